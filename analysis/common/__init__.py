@@ -0,0 +1,5 @@
+# Shared helpers for the Superstore analysis scripts
+
+from .data_loader import load_superstore
+
+__all__ = ['load_superstore']
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# Runtime scaling benchmark for the FP-Growth basket miner
+#
+# Usage (from the analysis/ directory):
+#   python -m common.basket_benchmark [--orders 10000 100000 1000000] [--items 2000]
+#
+# Baskets are synthetic: item popularity follows a Zipf-like distribution and
+# basket sizes are geometric with the same mean as the Superstore sample
+# (about two lines per order).
+
+import argparse
+import time
+
+import numpy as np
+from scipy import sparse
+
+from common.market_basket import CSRBaskets, fpgrowth
+
+
+def synthetic_baskets(n_orders, n_items, mean_size=2.0, seed=0):
+    """Return a binary CSR order x item matrix with skewed item popularity."""
+    rng = np.random.default_rng(seed)
+    sizes = rng.geometric(1 / mean_size, size=n_orders)
+    popularity = 1 / np.arange(1, n_items + 1) ** 1.1
+    popularity /= popularity.sum()
+    items = rng.choice(n_items, size=sizes.sum(), p=popularity)
+    orders = np.repeat(np.arange(n_orders), sizes)
+    matrix = sparse.csr_matrix((np.ones(len(items), dtype=np.int32), (orders, items)), shape=(n_orders, n_items))
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return matrix
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time FP-Growth on synthetic order baskets')
+    parser.add_argument('--orders', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--items', type=int, default=2000)
+    parser.add_argument('--min-support', type=float, default=0.0005)
+    args = parser.parse_args()
+
+    print(f"{'orders':>10} {'lines':>10} {'itemsets':>9} {'seconds':>8} {'us/order':>9}")
+    for n_orders in args.orders:
+        matrix = synthetic_baskets(n_orders, args.items)
+        start = time.perf_counter()
+        itemsets, _ = fpgrowth(CSRBaskets(matrix), args.min_support)
+        elapsed = time.perf_counter() - start
+        print(f"{n_orders:>10,} {matrix.nnz:>10,} {len(itemsets):>9,} {elapsed:>8.2f} {elapsed / n_orders * 1e6:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# Benchmark suite: every analysis stage on synthetic data at several scales
+#
+# Usage (from the analysis/ directory):
+#   python -m common.benchmark_suite [--rows 10000 100000 1000000] [--stages load_csv rfm ...]
+#                                    [--chunk-rows N] [--label NAME] [--baseline LABEL] [--check]
+#
+# For each scale a synthetic dataset with the Superstore schema is generated
+# (see common.synthetic; files are kept under analysis/.cache/benchmarks/data
+# and reused) and each stage is run once on it, timed and memory-profiled
+# with common.profiling. The stages call the same functions the analysis
+# scripts do, without rendering charts or writing their outputs:
+#
+#   load_csv       parse and clean the raw CSV (a cold load)
+#   load_cache     read the cleaned frame back from its Parquet cache
+#   clean          the data_cleaning stage: cleaned CSV and column store
+#   rfm            RFM metrics and scores per customer
+#   cooccurrence   top sub-category pairs bought together
+#   sales_cube     build the shared sales cube
+#   time_rollups   build the time cube and run every time-trend rollup
+#   profitability  the profitability analysis (cube queries and line scans)
+#   geographic     the geographic analysis
+#
+# With --chunk-rows each stage streams the file instead (load_cache is
+# skipped), as the analyses do with SUPERSTORE_CHUNK_ROWS; use it for scales
+# that do not fit in memory, e.g. --rows 100000000 --chunk-rows 1000000.
+#
+# Each run is appended to a JSON history (analysis/.cache/benchmarks/
+# history.json by default) and compared with an earlier run: the one named by
+# --baseline, else the latest run in the same mode. Stages more than
+# --threshold times slower than the baseline are flagged, and --check makes
+# that an error exit.
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from common.cooccurrence import top_pairs
+from common.data_loader import DEFAULT_CACHE_DIR, REPO_ROOT, SuperstoreChunks, clean_superstore, read_raw
+from common.profiling import measure
+from common.rfm import compute_rfm, score_rfm
+from common.sales_cube import SalesCube
+from common.synthetic import write_synthetic_superstore
+from common.time_cube import build_time_cube
+from run_pipeline import SCRIPTS, load_analysis
+
+BENCHMARK_DIR = os.path.join(DEFAULT_CACHE_DIR, 'benchmarks')
+DEFAULT_HISTORY = os.path.join(BENCHMARK_DIR, 'history.json')
+DEFAULT_ROWS = [10_000, 100_000, 1_000_000]
+# Stages faster than this in the baseline are too noisy to flag
+NOISE_FLOOR_S = 0.05
+
+
+def run_load_csv(bench):
+    if bench['chunk_rows']:
+        return sum(len(chunk) for chunk in bench['data'])
+    bench['data'] = clean_superstore(read_raw(bench['path']))
+    return bench['data']
+
+
+def write_cache(bench):
+    bench['cache_path'] = os.path.join(bench['tmp'], 'superstore.parquet')
+    bench['data'].to_parquet(bench['cache_path'], index=False)
+
+
+def run_load_cache(bench):
+    return pd.read_parquet(bench['cache_path'])
+
+
+def run_clean(bench):
+    clean_path = os.path.join(bench['tmp'], 'superstore_clean.csv')
+    return bench['analyses']['data_cleaning'].write_clean_dataset(bench['data'], clean_path)
+
+
+def run_rfm(bench):
+    return score_rfm(compute_rfm(bench['data']))
+
+
+def run_cooccurrence(bench):
+    return top_pairs(bench['data'][['order_id', 'sub-category']], 'sub-category', k=10)
+
+
+def run_sales_cube(bench):
+    data = bench['data']
+    bench['cube'] = SalesCube.build(data) if isinstance(data, pd.DataFrame) else SalesCube.build_chunked(data)
+    return bench['cube'].cells
+
+
+def run_time_rollups(bench):
+    analysis = bench['analyses']['time_trends']
+    time_cube = build_time_cube(bench['data'])
+    analysis.monthly_sales_trend(time_cube)
+    seasonal_sales = analysis.sales_by_month(time_cube)
+    analysis.yearly_growth(time_cube)
+    analysis.sales_by_day_of_week(time_cube)
+    analysis.category_seasonality(time_cube)
+    analysis.quarterly_sales_trend(time_cube)
+    analysis.peak_month_products(time_cube, seasonal_sales.sort_values('sales', ascending=False).head(3))
+    analysis.seasonal_merchandise_recommendations(time_cube)
+    return time_cube
+
+
+def run_profitability(bench):
+    analysis = bench['analyses']['profitability']
+    cube, data = bench['cube'], bench['data']
+    analysis.category_profitability(cube)
+    analysis.subcategory_profitability(cube)
+    analysis.regional_profitability(cube)
+    analysis.discount_impact_by_level(cube)
+    analysis.category_discount_margins(cube)
+    negative_profit = analysis.negative_profit_subcategories(data)
+    analysis.negative_order_percentage(data)
+    analysis.discount_correlation(data)
+    analysis.event_recommendations(cube)
+    return negative_profit
+
+
+def run_geographic(bench):
+    analysis = bench['analyses']['geographic']
+    cube = bench['cube']
+    analysis.sales_by_region(cube)
+    city_sales = analysis.sales_by_city(cube)
+    analysis.sales_variability(cube)
+    analysis.seasonal_pivot_table(analysis.seasonal_sales_by_region(cube))
+    analysis.event_target_cities(city_sales)
+    return city_sales
+
+
+# Stages in run order: the stage, the stages whose results it uses and an
+# unmeasured setup step run just before it
+STAGES = {
+    'load_csv': (run_load_csv, [], None),
+    'load_cache': (run_load_cache, ['load_csv'], write_cache),
+    'clean': (run_clean, ['load_csv'], None),
+    'rfm': (run_rfm, ['load_csv'], None),
+    'cooccurrence': (run_cooccurrence, ['load_csv'], None),
+    'sales_cube': (run_sales_cube, ['load_csv'], None),
+    'time_rollups': (run_time_rollups, ['load_csv'], None),
+    'profitability': (run_profitability, ['load_csv', 'sales_cube'], None),
+    'geographic': (run_geographic, ['load_csv', 'sales_cube'], None),
+}
+# Stages that only exist for in-memory runs
+IN_MEMORY_STAGES = {'load_cache'}
+
+
+def dataset_path(data_dir, n_rows, seed):
+    """The synthetic dataset of ``n_rows`` lines, generated on first use."""
+    path = os.path.join(data_dir, f"superstore-{n_rows}-seed{seed}.csv")
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        print(f"Generating {n_rows:,} rows as '{path}'...")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        write_synthetic_superstore(tmp_path, n_rows, seed)
+        os.replace(tmp_path, path)
+    return path
+
+
+def _rows_out(result):
+    if isinstance(result, (int, np.integer)):
+        return int(result)
+    return len(result) if hasattr(result, '__len__') else None
+
+
+def run_scale(path, n_rows, stages, chunk_rows, analyses):
+    """Measurements of ``stages`` on the dataset at ``path``; dependencies run unmeasured.
+
+    ``analyses`` maps the pipeline's analysis names to their imported scripts.
+    """
+    needed = set(stages)
+    for stage in stages:
+        needed.update(STAGES[stage][1])
+    results = []
+    with tempfile.TemporaryDirectory(prefix='superstore-bench-') as tmp:
+        bench = {'path': path, 'tmp': tmp, 'chunk_rows': chunk_rows, 'analyses': analyses}
+        if chunk_rows:
+            bench['data'] = SuperstoreChunks(path, chunk_rows)
+        for stage, (run, _, setup) in STAGES.items():
+            if stage not in needed or chunk_rows and stage in IN_MEMORY_STAGES:
+                continue
+            if setup is not None:
+                setup(bench)
+            gc.collect()
+            # The analysis functions print their progress; keep the report readable
+            with measure() as stats, contextlib.redirect_stdout(io.StringIO()):
+                result = run(bench)
+            if stage in stages:
+                results.append({'rows': n_rows, 'stage': stage, 'rows_out': _rows_out(result), **stats})
+            del result
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_history(path, history):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(history, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def find_baseline(history, label=None, chunk_rows=None):
+    """The run named ``label``, else the latest run in the same (in-memory or streaming) mode."""
+    for run in reversed(history):
+        if label is not None and run['label'] == label:
+            return run
+        if label is None and bool(run['chunk_rows']) == bool(chunk_rows):
+            return run
+    return None
+
+
+def compare(results, baseline, threshold):
+    """Wall-time ratios of ``results`` against the ``baseline`` run, with regressions flagged."""
+    previous = {(r['rows'], r['stage']): r['wall_s'] for r in baseline['results']}
+    rows = []
+    for r in results:
+        before = previous.get((r['rows'], r['stage']))
+        if before is None:
+            continue
+        ratio = r['wall_s'] / before if before else np.nan
+        rows.append({
+            'rows': r['rows'], 'stage': r['stage'], 'baseline s': before, 'now s': r['wall_s'], 'ratio': ratio,
+            'regression': bool(before >= NOISE_FLOOR_S and ratio > threshold),
+        })
+    return pd.DataFrame(rows)
+
+
+def print_results(results):
+    table = pd.DataFrame(results)
+    table['lines/s'] = table['rows'] / table['wall_s']
+    print(table[['rows', 'stage', 'wall_s', 'cpu_s', 'peak_rss_delta_mb', 'rss_start_mb', 'rows_out', 'lines/s']]
+          .to_string(index=False, formatters={
+              'rows': '{:,}'.format,
+              'rows_out': lambda n: '' if pd.isna(n) else f"{n:,.0f}",
+              'lines/s': lambda n: f"{n:,.0f}",
+          }, float_format=lambda x: f"{x:.3f}"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time and memory-profile every analysis stage on synthetic data')
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS, help='Dataset sizes in lines')
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES))
+    parser.add_argument('--chunk-rows', type=int, help='Stream each dataset in chunks of this many rows')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic datasets')
+    parser.add_argument('--data-dir', default=os.path.join(BENCHMARK_DIR, 'data'), help='Where datasets are kept')
+    parser.add_argument('--history', default=DEFAULT_HISTORY, help='JSON file the runs are appended to')
+    parser.add_argument('--label', help='Name of this run in the history (default: the git commit)')
+    parser.add_argument('--baseline', help='Label of the run to compare with (default: the latest run)')
+    parser.add_argument('--threshold', type=float, default=1.25, help='Slowdown ratio flagged as a regression')
+    parser.add_argument('--check', action='store_true', help='Exit with status 1 if a stage regressed')
+    parser.add_argument('--no-record', action='store_true', help='Do not append this run to the history')
+    args = parser.parse_args()
+
+    # Import the scripts up front so no stage is charged for it
+    analyses = {name: load_analysis(SCRIPTS[name]) for name in ['data_cleaning', 'time_trends', 'profitability',
+                                                                'geographic']}
+    results = []
+    for n_rows in args.rows:
+        path = dataset_path(args.data_dir, n_rows, args.seed)
+        print(f"Benchmarking {n_rows:,} rows{f' in chunks of {args.chunk_rows:,}' if args.chunk_rows else ''}...")
+        results.extend(run_scale(path, n_rows, args.stages, args.chunk_rows, analyses))
+
+    commit = _git_commit()
+    run = {
+        'label': args.label or commit or datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'chunk_rows': args.chunk_rows,
+        'seed': args.seed,
+        'results': results,
+    }
+
+    print()
+    print_results(results)
+
+    history = load_history(args.history)
+    baseline = find_baseline(history, args.baseline, args.chunk_rows)
+    regressed = False
+    if baseline is not None:
+        comparison = compare(results, baseline, args.threshold)
+        if len(comparison):
+            print(f"\nCompared with run '{baseline['label']}' ({baseline['timestamp']}):")
+            print(comparison.to_string(index=False, formatters={
+                'rows': '{:,}'.format,
+                'ratio': lambda r: f"{r:.2f}x",
+                'regression': lambda flag: 'SLOWER' if flag else '',
+            }, float_format=lambda x: f"{x:.3f}"))
+            regressed = bool(comparison['regression'].any())
+    elif args.baseline:
+        print(f"\nNo run labelled '{args.baseline}' in '{args.history}'")
+
+    if not args.no_record:
+        history.append(run)
+        save_history(args.history, history)
+        print(f"\nRecorded run '{run['label']}' in '{args.history}'")
+    if args.check and regressed:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
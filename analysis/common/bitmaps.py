@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# Roaring-style compressed bitmaps of integer ids
+#
+# The sales cube keeps, for each of its cells, the set of order codes and the
+# set of customer codes present in the cell (see ID_CODE_COLUMNS in
+# common.data_loader). Each set is a bitmap over the ids, compressed as in
+# Roaring bitmaps: an id is split into its high 16 bits, the key, and its low
+# 16 bits, and the low bits of the ids sharing a key form a container that is
+#
+#   an array    at most ARRAY_MAX_IDS ids, as sorted uint16 low bits
+#   a bitmap    more ids, as 65536 bits in 1024 uint64 words
+#
+# so a container never takes more than 8 KiB and a sparse one takes 2 bytes
+# per id. ``IdBitmaps`` holds a whole sequence of bitmaps in a few flat numpy
+# arrays, which is also how they are saved.
+#
+# ``union_counts`` gives the number of distinct ids in the union of each group
+# of bitmaps, which is how the cube answers nunique at any rollup level
+# without the row-level data. Containers are unioned key by key: when the
+# inputs of a union together hold at most ARRAY_MAX_IDS ids their arrays are
+# merged, otherwise they are OR-ed into a bitmap and the ids are counted with
+# a popcount.
+
+import numpy as np
+
+# Largest container stored (and unioned) as a sorted array
+ARRAY_MAX_IDS = 4096
+# 64-bit words in a bitmap container
+CONTAINER_WORDS = (1 << 16) // 64
+# Fields of ``IdBitmaps``, in the order the constructor takes them
+FIELDS = ['offsets', 'keys', 'cardinalities', 'starts', 'lows', 'words']
+
+
+def slice_indices(starts, lengths):
+    """Indices covering the slices ``starts[i]:starts[i] + lengths[i]``, concatenated."""
+    # Position within the concatenated slices, shifted to each slice's start
+    shift = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    return np.arange(lengths.sum()) + shift
+
+
+def _set_bits(words, rows, lows):
+    """Set bit ``lows[i]`` of bitmap container ``words[rows[i]]``."""
+    lows = lows.astype(np.int64)
+    masks = np.left_shift(np.uint64(1), (lows & 63).astype(np.uint64))
+    np.bitwise_or.at(words.reshape(-1), rows * CONTAINER_WORDS + (lows >> 6), masks)
+
+
+class IdBitmaps:
+    """A sequence of compressed bitmaps of non-negative integer ids below 2**32."""
+
+    def __init__(self, offsets, keys, cardinalities, starts, lows, words):
+        # The containers of bitmap i are offsets[i]:offsets[i + 1], in key order
+        self.offsets = offsets
+        # Per container: its key, its number of ids, and where its ids are:
+        # the start of its slice of ``lows`` for an array, its row of ``words``
+        # for a bitmap
+        self.keys = keys
+        self.cardinalities = cardinalities
+        self.starts = starts
+        self.lows = lows
+        self.words = words
+
+    @classmethod
+    def from_pairs(cls, bitmap_ids, ids, n_bitmaps):
+        """Bitmaps 0 to ``n_bitmaps`` - 1, bitmap ``bitmap_ids[i]`` holding ``ids[i]``.
+
+        Pairs may repeat; negative (missing) ids are left out.
+        """
+        present = ids >= 0
+        pairs = np.unique(bitmap_ids[present].astype(np.int64) << 32 | ids[present].astype(np.int64))
+        containers, cardinalities = np.unique(pairs >> 16, return_counts=True)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(containers >> 16, minlength=n_bitmaps))])
+
+        dense = cardinalities > ARRAY_MAX_IDS
+        array_sizes = np.where(dense, 0, cardinalities)
+        starts = np.cumsum(array_sizes) - array_sizes
+        starts[dense] = np.arange(dense.sum())
+        lows = (pairs & 0xFFFF).astype(np.uint16)
+        in_dense = np.repeat(dense, cardinalities)
+        words = np.zeros((dense.sum(), CONTAINER_WORDS), dtype=np.uint64)
+        _set_bits(words, np.repeat(starts[dense], cardinalities[dense]), lows[in_dense])
+        return cls(offsets, (containers & 0xFFFF).astype(np.uint16), cardinalities.astype(np.int32), starts,
+                   lows[~in_dense], words)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def to_arrays(self, prefix=''):
+        """The bitmaps' arrays, named ``prefix`` + field, e.g. for ``np.savez``."""
+        return {prefix + field: getattr(self, field) for field in FIELDS}
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix=''):
+        return cls(*(arrays[prefix + field] for field in FIELDS))
+
+    def union_counts(self, bitmaps, groups, n_groups):
+        """Distinct ids in each of ``n_groups`` groups, bitmap ``bitmaps[i]`` being in group ``groups[i]``."""
+        bitmaps = np.asarray(bitmaps)
+        first = self.offsets[bitmaps]
+        lengths = self.offsets[bitmaps + 1] - first
+        containers = slice_indices(first, lengths)
+        # One unioned container per (group, key) present
+        targets, target_of = np.unique(
+            np.repeat(np.asarray(groups, dtype=np.int64), lengths) << 16 | self.keys[containers],
+            return_inverse=True)
+        cardinalities = self.cardinalities[containers].astype(np.int64)
+        dense_target = np.bincount(target_of, weights=cardinalities, minlength=len(targets)) > ARRAY_MAX_IDS
+        sizes = np.zeros(len(targets), dtype=np.int64)
+
+        # Unions of few enough ids: merge the arrays (none of which can be a bitmap)
+        merged = ~dense_target[target_of]
+        lows = self.lows[slice_indices(self.starts[containers[merged]], cardinalities[merged])]
+        distinct = np.unique(np.repeat(target_of[merged].astype(np.int64), cardinalities[merged]) << 16 | lows)
+        sizes += np.bincount(distinct >> 16, minlength=len(targets))
+
+        # The rest: OR every input into a bitmap and count its bits
+        rows = np.cumsum(dense_target) - 1
+        words = np.zeros((dense_target.sum(), CONTAINER_WORDS), dtype=np.uint64)
+        is_bitmap = cardinalities > ARRAY_MAX_IDS
+        np.bitwise_or.at(words, rows[target_of[is_bitmap]], self.words[self.starts[containers[is_bitmap]]])
+        is_array = ~merged & ~is_bitmap
+        lows = self.lows[slice_indices(self.starts[containers[is_array]], cardinalities[is_array])]
+        _set_bits(words, np.repeat(rows[target_of[is_array]], cardinalities[is_array]), lows)
+        sizes[dense_target] = np.bitwise_count(words).sum(axis=1, dtype=np.int64)
+
+        return np.bincount(targets >> 16, weights=sizes, minlength=n_groups).astype(np.int64)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# Headless chart rendering stage
+#
+# The analysis scripts no longer draw while they compute. Each chart is
+# queued as a spec (output file, plot function, the data it needs) on a
+# ChartBatch, and the batch is rendered at the end of the run with the Agg
+# backend, in a process pool. Plot functions draw onto the current pyplot
+# figure; the renderer applies the shared style, saves and closes it.
+#
+# Environment options:
+#   SUPERSTORE_SKIP_CHARTS=1   data-only run, no chart is rendered
+#   SUPERSTORE_CHART_JOBS=N    worker processes (default: CPU count, 1 = serial)
+#
+# Workers are forked so that plot functions defined in a script's __main__
+# resolve in the children. Where fork is unavailable the batch is rendered
+# serially in-process.
+#
+# Given an OutputCache, a chart whose plot function, data and style are
+# unchanged since an earlier run is copied from the cache, not re-rendered.
+#
+# matplotlib and seaborn take most of a script's startup time, so they are
+# not imported up front. ``plt``, ``sns`` and ``mtick`` here stand in for
+# matplotlib.pyplot, seaborn and matplotlib.ticker and import the real module
+# on first use, which only happens once a chart is actually rendered. A
+# data-only run never imports them.
+
+import importlib
+import multiprocessing
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from importlib import metadata
+
+from common.output_cache import fingerprint
+
+ChartSpec = namedtuple('ChartSpec', ['filename', 'plot', 'description', 'data'])
+
+
+class _LazyModule:
+    """Stand-in for a plotting module, imported on first attribute access."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            import matplotlib
+            matplotlib.use('Agg')
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+plt = _LazyModule('matplotlib.pyplot')
+sns = _LazyModule('seaborn')
+mtick = _LazyModule('matplotlib.ticker')
+
+
+def apply_style():
+    """The plotting style shared by every analysis chart."""
+    plt.style.use('ggplot')
+    sns.set(font_scale=1.1)
+    plt.rcParams['figure.figsize'] = [12, 8]
+
+
+def charts_enabled():
+    return os.environ.get('SUPERSTORE_SKIP_CHARTS', '').lower() not in ('1', 'true', 'yes')
+
+
+def chart_jobs():
+    return int(os.environ.get('SUPERSTORE_CHART_JOBS', 0)) or os.cpu_count() or 1
+
+
+def render_chart(spec):
+    """Draw one spec and save it; runs in a worker process."""
+    apply_style()
+    spec.plot(**spec.data)
+    plt.savefig(spec.filename)
+    plt.close('all')
+    return spec.filename
+
+
+class ChartBatch:
+    """Charts queued by an analysis, rendered together at the end of the run."""
+
+    def __init__(self, cache=None):
+        self.specs = []
+        self.cache = cache
+
+    def add(self, filename, plot, description, **data):
+        """Queue ``plot(**data)`` to be saved as ``filename``."""
+        self.specs.append(ChartSpec(filename, plot, description, data))
+
+    def render(self, jobs=None):
+        specs, self.specs = self.specs, []
+        if not charts_enabled():
+            print(f"Skipped {len(specs)} charts (SUPERSTORE_SKIP_CHARTS is set)")
+            return []
+
+        keys, pending = {}, specs
+        use_cache = self.cache is not None and self.cache.enabled
+        if use_cache:
+            pending = []
+            for spec in specs:
+                key = fingerprint('chart', spec.filename, spec.plot, spec.data, apply_style,
+                                  metadata.version('matplotlib'), metadata.version('seaborn'))
+                if not self.cache.restore('chart', key, spec.filename):
+                    keys[spec.filename] = key
+                    pending.append(spec)
+
+        if pending:
+            # Import the plotting libraries once here so forked workers inherit them
+            apply_style()
+        jobs = min(jobs or chart_jobs(), len(pending))
+        if jobs > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
+            with ProcessPoolExecutor(jobs, mp_context=context) as pool:
+                list(pool.map(render_chart, pending))
+        else:
+            for spec in pending:
+                render_chart(spec)
+
+        for spec in specs:
+            if spec.filename in keys:
+                self.cache.store(keys[spec.filename], spec.filename)
+            cached = use_cache and spec.filename not in keys
+            print(f"Saved {spec.description} as '{spec.filename}'{' (cached)' if cached else ''}")
+        return [spec.filename for spec in specs]
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# Per-analysis column projection report: bytes parsed and held by each analysis
+#
+# Usage (from the analysis/ directory):
+#   python -m common.column_report [--data PATH] [--repeat R]
+#
+# For each analysis in the pipeline, the dataset columns named in its COLUMNS
+# manifest are loaded two ways, as the loader would: from the raw CSV with
+# usecols (the raw columns the derived ones need included) and from the
+# Parquet cache by columnar projection. The report shows how many bytes of
+# each source that touches, the load times and the memory the loaded columns
+# take, next to a load of every column.
+
+import argparse
+import os
+import time
+
+import pandas as pd
+
+from common.data_loader import (DEFAULT_DATA_PATH, RAW_DTYPES, SUPERSTORE_COLUMNS, cache_file, clean_superstore,
+                                load_superstore, parquet_column_bytes, raw_columns, read_raw)
+from common.sales_cube import SOURCE_COLUMNS
+from run_pipeline import SCRIPTS, load_analysis
+
+
+def field_bytes(path):
+    """Bytes of the raw CSV taken by each column's fields, separators included."""
+    raw = pd.read_csv(path, encoding='latin1', dtype=str, keep_default_na=False)
+    return pd.Series({col: int(raw[col].str.len().sum()) + len(raw) for col in RAW_DTYPES})
+
+
+def best_time(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def manifests():
+    rows = {'(all columns)': SUPERSTORE_COLUMNS, '(sales cube build)': SOURCE_COLUMNS}
+    for name, relative_path in SCRIPTS.items():
+        rows[name] = load_analysis(relative_path).COLUMNS or SUPERSTORE_COLUMNS
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bytes parsed and held per analysis with column projection')
+    parser.add_argument('--data', default=DEFAULT_DATA_PATH, help='Raw Superstore CSV')
+    parser.add_argument('--repeat', type=int, default=3, help='Timing repetitions per load (best is shown)')
+    args = parser.parse_args()
+
+    # Make sure the cache exists; the first load of a file parses every column
+    load_superstore(args.data, columns=['row_id'])
+    cache_path = cache_file(args.data)
+    fields = field_bytes(args.data)
+    csv_size = os.path.getsize(args.data)
+
+    report = {}
+    for name, columns in manifests().items():
+        usecols = raw_columns(columns)
+        csv_time, _ = best_time(lambda: clean_superstore(read_raw(args.data, usecols=usecols)), args.repeat)
+        cache_time, frame = best_time(lambda: pd.read_parquet(cache_path, columns=list(columns)), args.repeat)
+        report[name] = {
+            'columns': len(columns),
+            'csv fields MB': fields[usecols].sum() / 1e6,
+            'csv share': fields[usecols].sum() / csv_size,
+            'csv parse s': csv_time,
+            'cache MB read': parquet_column_bytes(cache_path, list(columns)) / 1e6,
+            'cache load s': cache_time,
+            'memory MB': frame.memory_usage(deep=True, index=False).sum() / 1e6,
+        }
+
+    print(f"Source: {args.data} ({csv_size / 1e6:.1f} MB), cache: {cache_path}")
+    table = pd.DataFrame(report).T
+    print(table.to_string(formatters={
+        'columns': lambda n: f"{n:.0f}",
+        'csv share': lambda share: f"{share:.1%}",
+    }, float_format=lambda x: f"{x:.3f}"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# Memory-mapped columnar store for the cleaned Superstore table
+#
+# Usage (from the analysis/ directory):
+#   python -m common.column_store [data_cleaning/superstore_clean.csv] [--chunk-rows 1000000]
+#
+# The cleaned CSV is exported once to a directory holding one raw binary
+# file per column next to a JSON manifest:
+#
+#   numeric columns   the values as a raw little-endian array (int64, float64, ...)
+#   datetime columns  int64 nanoseconds since the epoch (NaT as the minimum int64)
+#   string columns    int32 dictionary codes (-1 for missing), with the
+#                     dictionary itself, sorted, stored in the manifest
+#
+# Opening the store only reads the manifest. Each column is memory-mapped on
+# first use, so a script pays (in time and memory) only for the columns it
+# touches, and the OS pages in just the parts of them it reads. String
+# columns come back as categoricals sharing the stored dictionary. The CSV is
+# streamed in chunks while exporting, so the source can be larger than memory.
+
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from common.data_loader import REPO_ROOT, Vocabulary, file_identity, parse_dates
+
+DEFAULT_CLEAN_CSV = os.path.join(REPO_ROOT, 'analysis', 'data_cleaning', 'superstore_clean.csv')
+CLEAN_DATE_COLUMNS = ['order_date', 'ship_date']
+# Columns of the cleaned CSV read as strings, not numbers: postal codes keep their leading zeros
+CLEAN_STRING_COLUMNS = ['postal_code']
+
+# Bump whenever the on-disk layout changes so stale stores are re-exported
+STORE_VERSION = 2
+MANIFEST = 'manifest.json'
+CODE_DTYPE = np.dtype('<i4')
+
+
+def store_path(csv_path):
+    """Directory of the store exported from ``csv_path`` (``x.csv`` -> ``x.columns``)."""
+    return f"{os.path.splitext(csv_path)[0]}.columns"
+
+
+class ColumnStoreWriter:
+    """Append DataFrame chunks to a new store; ``close`` publishes it atomically.
+
+    The column layout is fixed by the first chunk, and later chunks must have
+    the same columns. An integer column that later holds decimals or missing
+    values is promoted to float64.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._tmp_dir = f"{directory}.{os.getpid()}.tmp"
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+        os.makedirs(self._tmp_dir)
+        self._columns = None
+        self._files = {}
+        self._vocabularies = {}
+        self.rows = 0
+
+    def _layout(self, chunk):
+        columns = []
+        for name, dtype in chunk.dtypes.items():
+            if pd.api.types.is_datetime64_any_dtype(dtype):
+                columns.append({'name': name, 'kind': 'datetime', 'dtype': '<i8'})
+            elif pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+                columns.append({'name': name, 'kind': 'numeric', 'dtype': np.dtype(dtype).newbyteorder('<').str})
+            else:
+                columns.append({'name': name, 'kind': 'dictionary', 'dtype': CODE_DTYPE.str})
+                self._vocabularies[name] = Vocabulary()
+        return columns
+
+    def append(self, chunk):
+        if self._columns is None:
+            self._columns = self._layout(chunk)
+        elif list(chunk.columns) != [column['name'] for column in self._columns]:
+            raise ValueError("Chunk columns differ from the first chunk's")
+
+        for column in self._columns:
+            name = column['name']
+            values = chunk[name]
+            if column['kind'] == 'dictionary':
+                labels = values.astype(object)
+                array = self._vocabularies[name].encode(labels.where(values.isna(), labels.astype(str)))
+            elif column['kind'] == 'datetime':
+                array = pd.to_datetime(values).to_numpy(dtype='datetime64[ns]').view(np.int64)
+            else:
+                if np.dtype(column['dtype']).kind in 'iu' and not pd.api.types.is_integer_dtype(values.dtype):
+                    # e.g. an integer-looking column that turns out to have decimals or gaps
+                    self._promote(column)
+                array = values.to_numpy()
+            if name not in self._files:
+                self._files[name] = open(self._file(name), 'wb')
+            self._files[name].write(np.ascontiguousarray(array, dtype=column['dtype']).tobytes())
+        self.rows += len(chunk)
+
+    def _file(self, name):
+        position = [column['name'] for column in self._columns].index(name)
+        return os.path.join(self._tmp_dir, f"{position}.bin")
+
+    def _promote(self, column, block_rows=1 << 20):
+        """Rewrite an integer column written so far as float64."""
+        written_dtype, column['dtype'] = column['dtype'], '<f8'
+        handle = self._files.pop(column['name'], None)
+        if handle is None:
+            return
+        handle.close()
+        path = self._file(column['name'])
+        written = np.memmap(path, dtype=written_dtype, mode='r') if self.rows else np.empty(0, dtype=written_dtype)
+        with open(f"{path}.promoted", 'wb') as out:
+            for start in range(0, len(written), block_rows):
+                out.write(written[start:start + block_rows].astype('<f8').tobytes())
+        del written
+        os.replace(f"{path}.promoted", path)
+        self._files[column['name']] = open(path, 'ab')
+
+    def close(self, source=None):
+        """Sort the dictionaries, write the manifest and move the store into place."""
+        for handle in self._files.values():
+            handle.close()
+        for column in self._columns or []:
+            column['file'] = os.path.basename(self._file(column['name']))
+            if column['kind'] != 'dictionary':
+                continue
+            # Codes were assigned in order of first appearance; renumber them so
+            # the dictionary is sorted and categoricals group in label order
+            labels = self._vocabularies[column['name']].values()
+            order = np.argsort(np.array(labels, dtype=object), kind='stable')
+            remap = np.empty(len(labels) + 1, dtype=CODE_DTYPE)
+            remap[order] = np.arange(len(labels))
+            remap[-1] = -1
+            if self.rows:
+                codes = np.memmap(os.path.join(self._tmp_dir, column['file']), dtype=CODE_DTYPE, mode='r+')
+                codes[:] = remap[codes]
+                codes.flush()
+                del codes
+            column['dictionary'] = [labels[i] for i in order]
+
+        manifest = {'version': STORE_VERSION, 'rows': self.rows, 'columns': self._columns or [], 'source': source}
+        with open(os.path.join(self._tmp_dir, MANIFEST), 'w') as f:
+            json.dump(manifest, f)
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.replace(self._tmp_dir, self.directory)
+
+
+def write_column_store(df, directory, source=None):
+    """Write an in-memory frame as a store."""
+    writer = ColumnStoreWriter(directory)
+    writer.append(df.reset_index(drop=True))
+    writer.close(source)
+
+
+class ColumnStore:
+    """Read-only view of a store; columns are memory-mapped on first access."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        self._layout = {column['name']: column for column in self.manifest['columns']}
+        self._arrays = {}
+
+    def __len__(self):
+        return self.manifest['rows']
+
+    @property
+    def columns(self):
+        return pd.Index(list(self._layout))
+
+    @property
+    def shape(self):
+        return len(self), len(self._layout)
+
+    def _array(self, name):
+        if name not in self._arrays:
+            column = self._layout[name]
+            dtype = np.dtype(column['dtype'])
+            if len(self):
+                self._arrays[name] = np.memmap(os.path.join(self.directory, column['file']), dtype=dtype, mode='r',
+                                               shape=(len(self),))
+            else:
+                self._arrays[name] = np.empty(0, dtype=dtype)
+        return self._arrays[name]
+
+    def column(self, name, rows=slice(None)):
+        """One column as a Series, optionally just the ``rows`` slice."""
+        if name not in self._layout:
+            raise KeyError(name)
+        column = self._layout[name]
+        values = self._array(name)[rows]
+        if column['kind'] == 'dictionary':
+            categories = pd.Index(column['dictionary'], dtype=object)
+            values = pd.Categorical.from_codes(values, categories=categories, validate=False)
+        elif column['kind'] == 'datetime':
+            values = np.asarray(values).view('datetime64[ns]')
+        return pd.Series(values, name=name, index=pd.RangeIndex(len(self))[rows])
+
+    def read(self, columns=None):
+        """A DataFrame of ``columns`` (all by default); other columns are never touched."""
+        columns = list(self._layout) if columns is None else list(columns)
+        return pd.DataFrame({name: self.column(name) for name in columns})
+
+    def head(self, n=5):
+        return pd.DataFrame({name: self.column(name, slice(0, n)) for name in self._layout})
+
+
+def export_csv(csv_path, directory=None, chunk_rows=1_000_000, date_columns=CLEAN_DATE_COLUMNS,
+               string_columns=CLEAN_STRING_COLUMNS):
+    """Export a CSV (latin1, like the cleaned dataset) to a store, streaming it in chunks."""
+    directory = directory or store_path(csv_path)
+    writer = ColumnStoreWriter(directory)
+    dtypes = {col: 'object' for col in string_columns}
+    with pd.read_csv(csv_path, encoding='latin1', chunksize=chunk_rows, dtype=dtypes) as reader:
+        for chunk in reader:
+            for col in date_columns:
+                if col in chunk.columns:
+                    chunk[col] = parse_dates(chunk[col], '%Y-%m-%d')
+            writer.append(chunk)
+    _, mtime_ns, size = file_identity(csv_path)
+    writer.close(source={'path': os.path.basename(csv_path), 'mtime_ns': mtime_ns, 'size': size})
+    return directory
+
+
+def open_clean_store(csv_path=DEFAULT_CLEAN_CSV):
+    """Open the store exported from ``csv_path``, exporting it first if it is missing or stale."""
+    directory = store_path(csv_path)
+    _, mtime_ns, size = file_identity(csv_path)
+    try:
+        store = ColumnStore(directory)
+        source = store.manifest.get('source') or {}
+        if (store.manifest.get('version') == STORE_VERSION
+                and (source.get('mtime_ns'), source.get('size')) == (mtime_ns, size)):
+            return store
+    except FileNotFoundError:
+        pass
+    print(f"Exporting '{csv_path}' to the column store '{directory}'...")
+    export_csv(csv_path, directory)
+    return ColumnStore(directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the cleaned dataset to a memory-mapped column store')
+    parser.add_argument('csv', nargs='?', default=DEFAULT_CLEAN_CSV)
+    parser.add_argument('--output', help='store directory (default: next to the CSV, with a .columns suffix)')
+    parser.add_argument('--chunk-rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    directory = export_csv(args.csv, args.output, args.chunk_rows)
+    store = ColumnStore(directory)
+    print(f"Exported {len(store)} rows x {len(store.columns)} columns to '{directory}'")
+
+
+if __name__ == '__main__':
+    main()
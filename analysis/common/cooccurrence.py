@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# Sparse item co-occurrence counting for the bundling analysis
+#
+# Orders are turned into a binary order x item incidence matrix in CSR form
+# built from integer codes, and pair counts come from one sparse product.
+# Only the strict upper triangle of the result is inspected, and the top-k
+# pairs are selected with a partial sort, so neither the dense matrix nor the
+# full list of pairs is ever materialised. This keeps the analysis usable at
+# product level (thousands of items, millions of orders).
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from common.partial_agg import distinct
+
+# Item column used for each supported bundling granularity
+LEVEL_COLUMNS = {
+    'sub-category': 'sub-category',
+    'product': 'product_id',
+}
+
+
+def encode_baskets(df, item_col, basket_col='order_id'):
+    """Return integer codes for the basket and item of every row.
+
+    Returns ``(basket_codes, item_codes, items)``. Basket codes follow order of
+    first appearance; item codes index into ``items``, which is sorted. Rows
+    with a missing basket or item get code -1.
+    """
+    basket_codes, _ = pd.factorize(df[basket_col])
+    item_codes, items = pd.factorize(df[item_col], sort=True)
+    return basket_codes, item_codes, np.asarray(items)
+
+
+def incidence_matrix(df, item_col, basket_col='order_id'):
+    """Build the binary basket x item incidence matrix.
+
+    Returns ``(matrix, items)`` where ``matrix`` is a CSR matrix with one row
+    per basket and one column per item, and ``items`` holds the item label of
+    each column in sorted order.
+    """
+    basket_codes, item_codes, items = encode_baskets(df, item_col, basket_col)
+    valid = (basket_codes >= 0) & (item_codes >= 0)
+    basket_codes = basket_codes[valid]
+    item_codes = item_codes[valid]
+
+    matrix = sparse.csr_matrix(
+        (np.ones(len(item_codes), dtype=np.int32), (basket_codes, item_codes)),
+        shape=(basket_codes.max() + 1 if len(basket_codes) else 0, len(items)),
+    )
+    # Repeated lines of the same item in one basket count once
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return matrix, items
+
+
+def cooccurrence_counts(matrix):
+    """Return the strict upper triangle of ``matrix.T @ matrix`` in COO form.
+
+    Entry ``(i, j)`` with ``i < j`` is the number of baskets that contain both
+    item ``i`` and item ``j``.
+    """
+    counts = (matrix.T @ matrix).tocoo()
+    return sparse.triu(counts, k=1, format='coo')
+
+
+def top_pairs(df, level='sub-category', k=10, basket_col='order_id'):
+    """Return the ``k`` item pairs that appear together in the most baskets.
+
+    ``level`` is one of ``LEVEL_COLUMNS``. The result has columns
+    ``Product1``, ``Product2`` and ``Count`` sorted by count, with ties broken
+    by item order, matching an exhaustive scan of every pair. ``df`` may be a
+    stream of chunks, reduced first to its distinct (basket, item) lines.
+    """
+    if not isinstance(df, pd.DataFrame):
+        df = distinct(df, [basket_col, LEVEL_COLUMNS[level]])
+    matrix, items = incidence_matrix(df, LEVEL_COLUMNS[level], basket_col)
+    return rank_pairs(matrix, items, k)
+
+
+def rank_pairs(matrix, items, k=10):
+    """The ``k`` pairs of columns of a binary basket x item ``matrix`` set together in the most rows.
+
+    ``items`` labels the columns, in sorted order; the result is as for ``top_pairs``.
+    """
+    upper = cooccurrence_counts(matrix)
+    rows, cols, counts = upper.row, upper.col, upper.data
+
+    if len(counts) > k:
+        # Keep every pair tied with the k-th largest count so tie-breaking stays exact
+        threshold = np.partition(counts, len(counts) - k)[len(counts) - k]
+        keep = counts >= threshold
+        rows, cols, counts = rows[keep], cols[keep], counts[keep]
+
+    order = np.lexsort((cols, rows, -counts))[:k]
+    return pd.DataFrame({
+        'Product1': items[rows[order]],
+        'Product2': items[cols[order]],
+        'Count': counts[order],
+    })
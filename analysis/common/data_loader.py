@@ -0,0 +1,505 @@
+#!/usr/bin/env python3
+# Shared loading and cleaning of the Superstore dataset
+#
+# Every analysis script used to re-read the raw CSV, re-parse the date
+# columns with format inference and re-derive the same columns. This module
+# does that work once, stores the cleaned frame in a columnar cache keyed on
+# the hash of the source file, and serves later loads straight from the cache.
+# Each analysis declares the columns it uses (its COLUMNS manifest) and loads
+# just those: a projection of the cache, or a usecols parse of the CSV.
+
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_DATA_PATH = os.path.join(REPO_ROOT, 'Superstore Dataset.csv')
+DEFAULT_CACHE_DIR = os.path.join(REPO_ROOT, 'analysis', '.cache')
+
+# Bump whenever the cleaning logic below, or the layout of a cache built on the
+# cleaned data (such as the sales cube), changes so stale caches are ignored
+CACHE_VERSION = 5
+
+# Rows per chunk when streaming the dataset; set SUPERSTORE_CHUNK_ROWS to make
+# the analyses stream every dataset instead of loading it into memory
+DEFAULT_CHUNK_ROWS = 1_000_000
+
+DATE_FORMAT = '%m/%d/%Y'
+DATE_COLUMNS = ['Order Date', 'Ship Date']
+
+# Explicit dtypes for the raw columns so pandas does not have to sniff them
+RAW_DTYPES = {
+    'Row ID': 'int64',
+    'Order ID': 'object',
+    'Order Date': 'object',
+    'Ship Date': 'object',
+    'Ship Mode': 'object',
+    'Customer ID': 'object',
+    'Customer Name': 'object',
+    'Segment': 'object',
+    'Country': 'object',
+    'City': 'object',
+    'State': 'object',
+    # Postal codes are labels; some have a leading zero (Vermont's 05408)
+    'Postal Code': 'object',
+    'Region': 'object',
+    'Product ID': 'object',
+    'Category': 'object',
+    'Sub-Category': 'object',
+    'Product Name': 'object',
+    'Sales': 'float64',
+    'Quantity': 'int64',
+    'Discount': 'float64',
+    'Profit': 'float64',
+}
+
+# Shared category vocabularies for the low-cardinality dimension columns.
+# Every script loads through this module, so a given label always maps to the
+# same code. Labels are kept in alphabetical order so grouped output is sorted
+# exactly as it was with plain object columns; values missing from a fixed list
+# are merged in rather than turned into NaN.
+US_STATES = [
+    'Alabama', 'Alaska', 'Arizona', 'Arkansas', 'California', 'Colorado',
+    'Connecticut', 'Delaware', 'District of Columbia', 'Florida', 'Georgia',
+    'Hawaii', 'Idaho', 'Illinois', 'Indiana', 'Iowa', 'Kansas', 'Kentucky',
+    'Louisiana', 'Maine', 'Maryland', 'Massachusetts', 'Michigan', 'Minnesota',
+    'Mississippi', 'Missouri', 'Montana', 'Nebraska', 'Nevada', 'New Hampshire',
+    'New Jersey', 'New Mexico', 'New York', 'North Carolina', 'North Dakota',
+    'Ohio', 'Oklahoma', 'Oregon', 'Pennsylvania', 'Rhode Island',
+    'South Carolina', 'South Dakota', 'Tennessee', 'Texas', 'Utah', 'Vermont',
+    'Virginia', 'Washington', 'West Virginia', 'Wisconsin', 'Wyoming',
+]
+
+CATEGORY_VOCABULARIES = {
+    'segment': ['Consumer', 'Corporate', 'Home Office'],
+    'region': ['Central', 'East', 'South', 'West'],
+    'category': ['Furniture', 'Office Supplies', 'Technology'],
+    'sub-category': [
+        'Accessories', 'Appliances', 'Art', 'Binders', 'Bookcases', 'Chairs',
+        'Copiers', 'Envelopes', 'Fasteners', 'Furnishings', 'Labels',
+        'Machines', 'Paper', 'Phones', 'Storage', 'Supplies', 'Tables',
+    ],
+    'ship_mode': ['First Class', 'Same Day', 'Second Class', 'Standard Class'],
+    'country': ['United States'],
+    'state': US_STATES,
+    'city': [],  # Too many to list; the vocabulary comes from the data
+}
+CATEGORICAL_COLUMNS = list(CATEGORY_VOCABULARIES)
+
+# Order-date columns clean_superstore derives, and their date dimension attributes
+ORDER_DATE_ATTRIBUTES = {
+    'order_year': 'year',
+    'order_month': 'month',
+    'order_quarter': 'quarter',
+    'order_day_of_week': 'day_of_week',
+    'order_day_name': 'day_name',
+}
+
+# Columns clean_superstore derives, with the cleaned columns each is computed from
+DERIVED_COLUMNS = {
+    'order_year': ['order_date'],
+    'order_month': ['order_date'],
+    'order_quarter': ['order_date'],
+    'order_day_of_week': ['order_date'],
+    'order_day_name': ['order_date'],
+    'shipping_days': ['order_date', 'ship_date'],
+    'profit_margin': ['profit', 'sales'],
+    'order_code': ['order_id'],
+    'customer_code': ['customer_id'],
+}
+
+# Integer id columns clean_superstore derives, with the string id column each
+# codes. Codes are assigned in order of first appearance in the file, so they
+# are dense (0 to n - 1) and the same whether the file is loaded whole or
+# streamed, and distinct counts can work on integers instead of hashing strings.
+ID_CODE_COLUMNS = {'order_code': 'order_id', 'customer_code': 'customer_id'}
+ID_CODE_DTYPE = np.int32
+
+
+def clean_name(raw_name):
+    """Cleaned name of a raw column ('Sub-Category' -> 'sub-category')."""
+    return raw_name.lower().replace(' ', '_')
+
+
+# Every column of the cleaned dataset, in order
+SUPERSTORE_COLUMNS = [clean_name(col) for col in RAW_DTYPES] + list(DERIVED_COLUMNS)
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file, read in fixed-size chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def take_codes(values, codes):
+    """``values[codes]``, with missing values where a code is -1."""
+    return pd.api.extensions.take(np.asarray(values), codes, allow_fill=True)
+
+
+def parse_date_codes(series, date_format=DATE_FORMAT):
+    """Parse a raw date column once per distinct string.
+
+    Returns each row's code into the distinct dates (-1 for missing values)
+    and the parsed distinct dates. Strings that do not match ``date_format``
+    fall back to pandas' inference, so a stray ISO date in the feed is still
+    parsed rather than silently dropped.
+    """
+    codes, strings = pd.factorize(series)
+    strings = pd.Series(strings, dtype=object)
+    days = pd.to_datetime(strings, format=date_format, errors='coerce')
+    failed = days.isna()
+    if failed.any():
+        days[failed] = pd.to_datetime(strings[failed], errors='coerce')
+    return codes, pd.DatetimeIndex(days)
+
+
+def parse_dates(series, date_format=DATE_FORMAT):
+    """Parse a raw date column with a fixed format (see ``parse_date_codes``)."""
+    codes, days = parse_date_codes(series, date_format)
+    return pd.Series(take_codes(days, codes), index=series.index, name=series.name)
+
+
+def date_codes(dates):
+    """Codes of a parsed date column into its distinct dates (-1 for NaT), and those dates."""
+    codes, days = pd.factorize(dates)
+    return codes, pd.DatetimeIndex(days)
+
+
+def date_dimension(days):
+    """Date dimension table: the calendar attributes of each of ``days``, one row per day."""
+    days = pd.DatetimeIndex(days)
+    return pd.DataFrame({
+        'year': days.year,
+        'month': days.month,
+        'quarter': days.quarter,
+        'day': days.day,
+        'day_of_week': days.dayofweek,  # Monday=0, Sunday=6
+        'day_name': days.day_name(),
+    }, index=days)
+
+
+def calendar_attributes(codes, days, attributes):
+    """Calendar ``attributes`` of each row, joined by ``codes`` from the date dimension of ``days``."""
+    dimension = date_dimension(days)
+    return {attribute: take_codes(dimension[attribute], codes) for attribute in attributes}
+
+
+def encode_categoricals(df):
+    """Convert the dimension columns to categoricals with the shared vocabularies."""
+    for col, vocabulary in CATEGORY_VOCABULARIES.items():
+        if col not in df.columns:
+            continue
+        categories = sorted(set(vocabulary).union(df[col].dropna().unique()))
+        df[col] = pd.Categorical(df[col], categories=categories)
+    return df
+
+
+def plain_labels(frame, columns=CATEGORICAL_COLUMNS):
+    """Return ``frame`` with the shared dimension columns cast back to plain labels.
+
+    Aggregated results are tiny, and plotting libraries order categorical axes
+    by the full vocabulary rather than by the rows passed in, so summary
+    tables are handed on with ordinary label columns.
+    """
+    frame = frame.copy()
+    for col in columns:
+        if col in frame.columns and isinstance(frame[col].dtype, pd.CategoricalDtype):
+            frame[col] = frame[col].astype(frame[col].cat.categories.dtype)
+    return frame
+
+
+class Vocabulary:
+    """Integer codes for values streamed in chunks, assigned in order of first appearance.
+
+    Encoding the chunks of a column in order gives exactly the codes that
+    ``pd.factorize`` would give the whole column.
+    """
+
+    def __init__(self):
+        self._codes = {}
+
+    def __len__(self):
+        return len(self._codes)
+
+    def values(self):
+        """The distinct values seen, in code order."""
+        return list(self._codes)
+
+    def encode(self, values):
+        """Codes for ``values``, a column or a frame whose rows are coded as tuples."""
+        if isinstance(values, pd.DataFrame):
+            local_codes, uniques = pd.MultiIndex.from_frame(values).factorize()
+        else:
+            local_codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+        codes = self._codes
+        # Missing values keep code -1
+        unique_codes = np.fromiter((codes.setdefault(value, len(codes)) for value in uniques),
+                                   dtype=np.int64, count=len(uniques))
+        return np.append(unique_codes, -1)[local_codes]
+
+    def first_seen(self, values):
+        """Encode ``values``; True for the rows holding a value's first occurrence ever."""
+        before = len(self)
+        codes = self.encode(values)
+        return (codes >= before) & ~pd.Series(codes).duplicated().to_numpy()
+
+
+def clean_superstore(df, categorical=True, vocabularies=None):
+    """Apply the standard cleaning steps to a raw Superstore frame.
+
+    With ``categorical`` set, the dimension columns listed in
+    ``CATEGORY_VOCABULARIES`` are stored as pandas categoricals. ``df`` may
+    hold just some of the raw columns (see ``raw_columns``); derived columns
+    whose inputs are missing are left out. The id code columns are coded
+    within ``df``; when streaming, ``vocabularies`` maps the code columns to
+    derive to the ``Vocabulary`` that codes every chunk of the pass.
+    """
+    # Dates are parsed once per distinct string, and the calendar attributes
+    # are joined from a date dimension over the distinct order dates
+    order_dates = None
+    for col in DATE_COLUMNS:
+        if col in df.columns:
+            codes, days = parse_date_codes(df[col])
+            df[col] = take_codes(days, codes)
+            if col == 'Order Date':
+                order_dates = codes, days
+
+    # Clean column names
+    df.columns = [clean_name(col) for col in df.columns]
+
+    # Add useful derived columns
+    if order_dates is not None:
+        calendar = calendar_attributes(*order_dates, ORDER_DATE_ATTRIBUTES.values())
+        for col, attribute in ORDER_DATE_ATTRIBUTES.items():
+            df[col] = calendar[attribute]
+    if 'order_date' in df.columns and 'ship_date' in df.columns:
+        df['shipping_days'] = (df['ship_date'] - df['order_date']).dt.days
+    if 'profit' in df.columns and 'sales' in df.columns:
+        df['profit_margin'] = df['profit'] / df['sales']
+    for col, id_col in ID_CODE_COLUMNS.items():
+        if id_col not in df.columns or vocabularies is not None and col not in vocabularies:
+            continue
+        codes = pd.factorize(df[id_col])[0] if vocabularies is None else vocabularies[col].encode(df[id_col])
+        df[col] = codes.astype(ID_CODE_DTYPE)
+
+    if categorical:
+        encode_categoricals(df)
+    return df
+
+
+def check_columns(columns):
+    """``columns`` as a list in dataset order, or every column for None."""
+    if columns is None:
+        return list(SUPERSTORE_COLUMNS)
+    unknown = set(columns) - set(SUPERSTORE_COLUMNS)
+    if unknown:
+        raise KeyError(f"Not columns of the cleaned dataset: {sorted(unknown)}")
+    return [col for col in SUPERSTORE_COLUMNS if col in set(columns)]
+
+
+def raw_columns(columns):
+    """Raw CSV columns needed to produce the cleaned ``columns``."""
+    needed = set()
+    for col in check_columns(columns):
+        needed.update(DERIVED_COLUMNS.get(col, [col]))
+    return [raw for raw in RAW_DTYPES if clean_name(raw) in needed]
+
+
+def read_raw(path=DEFAULT_DATA_PATH, usecols=None):
+    """Read the raw CSV (or just its ``usecols``) with explicit dtypes and latin1 decoding."""
+    return pd.read_csv(path, encoding='latin1', dtype=RAW_DTYPES, usecols=usecols)
+
+
+def file_identity(path):
+    """Cheap identity of a file (path, mtime, size) for in-process memoization."""
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_mtime_ns, stat.st_size
+
+
+# Frames already loaded by this process (or by the parent it was forked from)
+_LOADED = {}
+
+
+def parquet_column_bytes(path, columns=None):
+    """Compressed on-disk bytes of ``columns`` (all by default) in a Parquet file."""
+    import pyarrow.parquet as pq
+
+    metadata = pq.ParquetFile(path).metadata
+    total = 0
+    for i in range(metadata.num_row_groups):
+        row_group = metadata.row_group(i)
+        for j in range(row_group.num_columns):
+            chunk = row_group.column(j)
+            if columns is None or chunk.path_in_schema in columns:
+                total += chunk.total_compressed_size
+    return total
+
+
+def _megabytes(n_bytes):
+    return f"{n_bytes / 1e6:.1f} MB"
+
+
+def cache_file(path=DEFAULT_DATA_PATH, cache_dir=DEFAULT_CACHE_DIR):
+    """Path of the Parquet cache of the cleaned ``path`` (which may not exist yet)."""
+    return os.path.join(cache_dir, f"superstore-{file_hash(path)}-v{CACHE_VERSION}.parquet")
+
+
+def _project(frame, columns):
+    """Shallow copy of ``frame`` holding just ``columns``, sharing their data."""
+    if list(frame.columns) == columns:
+        return frame.copy(deep=False)
+    return pd.DataFrame({col: frame[col] for col in columns}, copy=False)
+
+
+def load_superstore(path=DEFAULT_DATA_PATH, cache_dir=DEFAULT_CACHE_DIR, use_cache=True, columns=None):
+    """Load the cleaned Superstore dataset, or just its ``columns``.
+
+    The cleaned frame is cached as Parquet under ``cache_dir`` keyed on the
+    SHA-256 of the source file, so each distinct input is parsed only once no
+    matter how many scripts load it. Within a process the loaded columns are
+    also kept in memory, so analyses forked from the pipeline runner share one
+    load; callers get a shallow copy and may add columns freely. Caching is
+    skipped when pyarrow is not installed or ``use_cache`` is False.
+
+    With ``columns`` given, only those columns are read: from the cache by
+    columnar projection, or from the CSV with ``usecols`` (plus the raw
+    columns the derived ones are computed from). The columns come back in
+    dataset order.
+    """
+    columns = check_columns(columns)
+    loaded = _LOADED.get(file_identity(path)) if use_cache else None
+    if loaded is not None and set(columns) <= set(loaded.columns):
+        print(f"Reusing the dataset already loaded from '{path}'")
+        return _project(loaded, columns)
+    missing = [col for col in columns if loaded is None or col not in loaded.columns]
+
+    cache_path = cache_file(path, cache_dir) if use_cache and _parquet_available() else None
+
+    if cache_path is not None and os.path.exists(cache_path):
+        print(f"Loading {len(missing)} of {len(SUPERSTORE_COLUMNS)} columns "
+              f"({_megabytes(parquet_column_bytes(cache_path, missing))} of "
+              f"{_megabytes(parquet_column_bytes(cache_path))}) from cache '{cache_path}'")
+        df = pd.read_parquet(cache_path, columns=missing)
+    elif cache_path is not None:
+        # First load of this file: clean every column so the cache serves any projection
+        print(f"Parsing '{path}'...")
+        df = clean_superstore(read_raw(path))
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write to a temporary name first so concurrent readers never see a partial file
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, cache_path)
+        print(f"Cached cleaned dataset as '{cache_path}'")
+        df = df[missing]
+    else:
+        usecols = raw_columns(missing)
+        print(f"Parsing {len(usecols)} of {len(RAW_DTYPES)} columns of '{path}'...")
+        df = clean_superstore(read_raw(path, usecols=usecols))[missing]
+
+    if not use_cache:
+        return df
+    if loaded is not None:
+        df = pd.concat([loaded, df], axis=1)
+        df = df[[col for col in SUPERSTORE_COLUMNS if col in df.columns]]
+    _LOADED[file_identity(path)] = df
+    return _project(df, columns)
+
+
+class SuperstoreChunks:
+    """The cleaned dataset as a stream of chunks, for inputs larger than memory.
+
+    Iterating parses the raw CSV ``chunk_rows`` lines at a time and yields
+    each chunk cleaned as ``clean_superstore`` would, with the dimension
+    columns left as plain labels and the row index continuing across chunks.
+    The stream can be iterated any number of times; each pass re-reads the
+    file. Indexing with a list of columns gives a stream of just those
+    columns, and only the raw columns they need are parsed. Aggregate with
+    the helpers in common.partial_agg, which accept either a stream or an
+    in-memory frame.
+    """
+
+    def __init__(self, path=DEFAULT_DATA_PATH, chunk_rows=DEFAULT_CHUNK_ROWS, columns=None):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self._columns = columns
+        self._rows = None
+
+    def __iter__(self):
+        rows = 0
+        # Ids are coded across the whole pass, as they would be in the loaded frame
+        vocabularies = {col: Vocabulary() for col in ID_CODE_COLUMNS
+                        if self._columns is None or col in self._columns}
+        with pd.read_csv(self.path, encoding='latin1', dtype=RAW_DTYPES, usecols=self._usecols(),
+                         chunksize=self.chunk_rows) as reader:
+            for chunk in reader:
+                chunk = clean_superstore(chunk, categorical=False, vocabularies=vocabularies)
+                if self._columns is not None:
+                    chunk = chunk[self._columns]
+                rows += len(chunk)
+                yield chunk
+        self._rows = rows
+
+    def _usecols(self):
+        return None if self._columns is None else raw_columns(self._columns)
+
+    def __getitem__(self, columns):
+        if isinstance(columns, str):
+            raise TypeError("Select a list of columns; single columns are not streamed as a Series")
+        return SuperstoreChunks(self.path, self.chunk_rows, list(columns))
+
+    def __len__(self):
+        if self._rows is None:
+            # Counting rows only needs one narrow column
+            self._rows = sum(len(chunk) for chunk in pd.read_csv(
+                self.path, encoding='latin1', usecols=['Row ID'], chunksize=self.chunk_rows))
+        return self._rows
+
+    def head(self, n=5):
+        chunk = clean_superstore(pd.read_csv(self.path, encoding='latin1', dtype=RAW_DTYPES,
+                                             usecols=self._usecols(), nrows=n), categorical=False)
+        return chunk if self._columns is None else chunk[self._columns]
+
+    @property
+    def columns(self):
+        return self.head(1).columns
+
+    @property
+    def shape(self):
+        return len(self), len(self.columns)
+
+    def identity(self):
+        """Content identity of the stream, for fingerprinting outputs derived from it."""
+        return file_hash(self.path), CACHE_VERSION, self._columns
+
+
+def chunk_rows_setting():
+    """Rows per chunk from SUPERSTORE_CHUNK_ROWS, or None to load datasets whole."""
+    value = os.environ.get('SUPERSTORE_CHUNK_ROWS', '').strip()
+    return int(value) if value else None
+
+
+def open_superstore(path=DEFAULT_DATA_PATH, chunk_rows=None, columns=None):
+    """Open the dataset (or just its ``columns``) for analysis, in memory or as a chunk stream.
+
+    Returns the frame from ``load_superstore`` unless ``chunk_rows`` (or the
+    SUPERSTORE_CHUNK_ROWS environment variable) is set, in which case a
+    ``SuperstoreChunks`` stream over the file is returned.
+    """
+    chunk_rows = chunk_rows or chunk_rows_setting()
+    if chunk_rows:
+        print(f"Streaming '{path}' in chunks of {chunk_rows} rows")
+        return SuperstoreChunks(path, chunk_rows, None if columns is None else check_columns(columns))
+    return load_superstore(path, columns=columns)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# Memory and groupby timing comparison: object vs categorical dimension columns
+#
+# Usage (from the analysis/ directory):
+#   python -m common.dtype_report [--scale N] [--repeat R]
+#
+# --scale replicates the sample rows N times to approximate a larger feed.
+
+import argparse
+import time
+
+import pandas as pd
+
+from common.data_loader import CATEGORICAL_COLUMNS, clean_superstore, encode_categoricals, read_raw
+
+# Groupings used by the analysis scripts
+GROUPINGS = [
+    ['segment'],
+    ['region'],
+    ['category'],
+    ['sub-category'],
+    ['segment', 'category'],
+    ['category', 'sub-category'],
+    ['city', 'state', 'region'],
+]
+
+
+def time_groupbys(df, observed, repeat):
+    timings = {}
+    for keys in GROUPINGS:
+        kwargs = {'observed': True} if observed else {}
+        start = time.perf_counter()
+        for _ in range(repeat):
+            df.groupby(keys, **kwargs).agg({'sales': 'sum', 'profit': 'sum', 'order_id': 'nunique'})
+        timings[' + '.join(keys)] = (time.perf_counter() - start) / repeat
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare object and categorical dimension columns')
+    parser.add_argument('--scale', type=int, default=1, help='Replicate the sample rows this many times')
+    parser.add_argument('--repeat', type=int, default=5, help='Timing repetitions per groupby')
+    args = parser.parse_args()
+
+    raw = read_raw()
+    if args.scale > 1:
+        raw = pd.concat([raw] * args.scale, ignore_index=True)
+    object_df = clean_superstore(raw, categorical=False)
+    categorical_df = encode_categoricals(object_df.copy())
+
+    print(f"Rows: {len(object_df):,}")
+
+    print("\n===== MEMORY (deep, MB) =====")
+    memory = pd.DataFrame({
+        'object': object_df[CATEGORICAL_COLUMNS].memory_usage(deep=True, index=False),
+        'categorical': categorical_df[CATEGORICAL_COLUMNS].memory_usage(deep=True, index=False),
+    }) / 1e6
+    memory.loc['all dimension columns'] = memory.sum()
+    memory.loc['whole frame'] = [
+        object_df.memory_usage(deep=True).sum() / 1e6,
+        categorical_df.memory_usage(deep=True).sum() / 1e6,
+    ]
+    memory['reduction'] = 1 - memory['categorical'] / memory['object']
+    print(memory.round(3))
+
+    print("\n===== GROUPBY TIME (ms, sum/sum/nunique) =====")
+    timings = pd.DataFrame({
+        'object': time_groupbys(object_df, observed=False, repeat=args.repeat),
+        'categorical': time_groupbys(categorical_df, observed=True, repeat=args.repeat),
+    }) * 1000
+    timings['speedup'] = timings['object'] / timings['categorical']
+    print(timings.round(2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# Error and speed of HyperLogLog distinct counts against exact ones
+#
+# Usage (from the analysis/ directory):
+#   python -m common.hll_report [--rows N] [--precisions 10 12 14 16] [--repeat 3]
+#
+# Builds the sales cube and the time cube once with exact distinct counts and
+# once per HyperLogLog precision (as SUPERSTORE_HLL_PRECISION would), from the
+# bundled dataset or, with --rows, a synthetic dataset of that many lines (see
+# common.benchmark_suite). The order and customer counts of the geographic and
+# time-based analyses' rollups are then run on each cube. For every mode the
+# report shows the cube build time, the time of the rollups, the memory held
+# for the distinct counts, and the error of the estimates relative to the
+# exact counts next to the standard error 1.04 / sqrt(2**precision).
+
+import argparse
+import contextlib
+import io
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from common.benchmark_suite import BENCHMARK_DIR, dataset_path
+from common.data_loader import DEFAULT_DATA_PATH, load_superstore
+from common.sales_cube import SalesCube, source_columns
+from common.sketches import hll_error
+from common.time_cube import ORDER_COUNT_COLUMNS, build_time_cube, rollup, source_columns as time_source_columns
+
+# Distinct-count rollups of the geographic analysis: keys and measures
+SALES_ROLLUPS = {
+    'regional sales': (['region'], ['order_id', 'customer_id']),
+    'city sales': (['city', 'state', 'region'], ['order_id']),
+    'region by year': (['region', 'order_year'], ['order_id', 'customer_id']),
+}
+# Order-count rollups of the time-based analysis
+TIME_ROLLUPS = {
+    'monthly': ['order_year', 'order_month'],
+    'seasonal': ['order_month'],
+    'yearly': ['order_year'],
+    'day of week': ['order_day_of_week'],
+    'category by month': ['category', 'order_month'],
+    'quarterly': ['order_year', 'order_quarter'],
+    'sub-category': ['category', 'sub-category'],
+}
+DEFAULT_PRECISIONS = [10, 12, 14, 16]
+
+
+def best_time(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def sales_counts(cube):
+    return np.concatenate([cube.query(keys, measures)[measures].to_numpy().ravel()
+                           for keys, measures in SALES_ROLLUPS.values()])
+
+
+def time_counts(cube):
+    return np.concatenate([rollup(cube, keys, ['order_id'])['order_id'].to_numpy() for keys in TIME_ROLLUPS.values()])
+
+
+def _state_mb(cube):
+    """Memory held for a cube's distinct counts: its id sets or sketches, or its order indicators."""
+    if isinstance(cube, SalesCube):
+        states = list(cube.id_sets.values())
+    elif 'order_sketches' in cube.attrs:
+        states = [cube.attrs['order_sketches']]
+    else:
+        return cube[[col for _, col in ORDER_COUNT_COLUMNS]].memory_usage(index=False).sum() / 1e6
+    return sum(array.nbytes for state in states for array in state.to_arrays().values()) / 1e6
+
+
+def compare(df, precisions, repeat):
+    """One table per cube: build and rollup times, state size and estimate errors per mode."""
+    cubes = {
+        'sales cube': (lambda precision: SalesCube.build(df, precision), sales_counts),
+        'time cube': (lambda precision: build_time_cube(df, precision), time_counts),
+    }
+    tables = {}
+    for name, (build, counts) in cubes.items():
+        rows, exact = [], None
+        for precision in [None, *precisions]:
+            # The builders announce approximate counts; keep the report readable
+            with contextlib.redirect_stdout(io.StringIO()):
+                build_s, cube = best_time(lambda: build(precision), 1)
+            rollup_s, estimates = best_time(lambda: counts(cube), repeat)
+            if exact is None:
+                exact = estimates
+            errors = np.abs(estimates - exact) / np.maximum(exact, 1)
+            rows.append({
+                'mode': f"hll p={precision}" if precision else 'exact',
+                'std error': hll_error(precision) if precision else 0.0,
+                'build s': build_s,
+                'rollups ms': rollup_s * 1000,
+                'state MB': _state_mb(cube),
+                'mean error': errors.mean(),
+                'max error': errors.max(),
+            })
+        tables[name] = pd.DataFrame(rows)
+    return tables
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare HyperLogLog and exact distinct counts in the cubes')
+    parser.add_argument('--rows', type=int, help='Use a synthetic dataset of this many lines')
+    parser.add_argument('--precisions', type=int, nargs='+', default=DEFAULT_PRECISIONS)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic dataset')
+    parser.add_argument('--data-dir', default=os.path.join(BENCHMARK_DIR, 'data'), help='Where datasets are kept')
+    args = parser.parse_args()
+
+    path = dataset_path(args.data_dir, args.rows, args.seed) if args.rows else DEFAULT_DATA_PATH
+    columns = sorted({*source_columns(), *source_columns(True), *time_source_columns(), *time_source_columns(True)})
+    df = load_superstore(path, columns=columns)
+    print(f"{len(df):,} order lines from '{path}'")
+
+    formats = {'std error': '{:.2%}', 'mean error': '{:.2%}', 'max error': '{:.2%}', 'build s': '{:.2f}',
+               'rollups ms': '{:.1f}', 'state MB': '{:.2f}'}
+    for name, table in compare(df, args.precisions, args.repeat).items():
+        print(f"\n===== {name.upper()} =====")
+        print(table.to_string(index=False, formatters={col: fmt.format for col, fmt in formats.items()}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# Per-stage timing and memory trace of an analysis run
+#
+# Each analysis wraps its load step, every section and its chart rendering
+# and CSV export in ``trace.stage(...)`` blocks of a ``StageTrace``. A stage
+# records its wall and CPU time, how far the resident set rose above its
+# start (see common.profiling) and, where the script passes them, the rows
+# it read and the rows it produced. At the end of the run the trace is
+# printed as a table and written as JSON to analysis/.cache/traces/<name>.json
+# (SUPERSTORE_TRACE_DIR to put it elsewhere), replacing the previous run's.
+#
+# With SUPERSTORE_CHROME_TRACE=1 a Chrome trace-event file, <name>.chrome.json,
+# is written as well; open it in chrome://tracing or https://ui.perfetto.dev.
+# The pipeline runner merges the traces of its nodes into one pair of files,
+# with a process lane per node.
+#
+# Stages do not nest: each resets the peak RSS it measures from.
+
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from common.data_loader import DEFAULT_CACHE_DIR
+from common.profiling import measure
+
+DEFAULT_TRACE_DIR = os.path.join(DEFAULT_CACHE_DIR, 'traces')
+
+
+def trace_dir_setting():
+    """Directory traces are written to, from SUPERSTORE_TRACE_DIR."""
+    return os.environ.get('SUPERSTORE_TRACE_DIR', '').strip() or DEFAULT_TRACE_DIR
+
+
+def chrome_trace_enabled():
+    """Whether SUPERSTORE_CHROME_TRACE asks for Chrome trace-event files too."""
+    return os.environ.get('SUPERSTORE_CHROME_TRACE', '').strip() not in ('', '0')
+
+
+def row_count(data):
+    """Rows of a frame, series or array, an int as is, and None for anything else.
+
+    Chunk streams are not counted, since that would take a pass over the file.
+    """
+    if isinstance(data, (int, np.integer)):
+        return int(data)
+    if isinstance(data, (pd.DataFrame, pd.Series, np.ndarray)):
+        return len(data)
+    return None
+
+
+class Stage:
+    """One measured stage; set ``rows_out`` to the stage's result (or its row count)."""
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = row_count(rows_in)
+        self.rows_out = None
+
+    def record(self, start, stats):
+        return {
+            'name': self.name,
+            'start': start,
+            'wall_s': stats['wall_s'],
+            'cpu_s': stats['cpu_s'],
+            'rss_start_mb': stats['rss_start_mb'],
+            'peak_rss_delta_mb': stats['peak_rss_delta_mb'],
+            'rows_in': self.rows_in,
+            'rows_out': row_count(self.rows_out),
+        }
+
+
+class StageTrace:
+    """The stages of one run of an analysis, written out by ``report``."""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.time()
+        self._start_cpu = time.process_time()
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        """Measure the enclosed block as stage ``name``, reading ``rows_in`` (a frame or a count)."""
+        stage = Stage(name, rows_in)
+        start = time.time()
+        with measure() as stats:
+            yield stage
+        self.stages.append(stage.record(start, stats))
+
+    def traced(self, name, fn):
+        """``fn`` wrapped to run as stage ``name``, with its result as the rows out."""
+        def run(*args, **kwargs):
+            with self.stage(name) as stage:
+                stage.rows_out = result = fn(*args, **kwargs)
+            return result
+        return run
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'pid': os.getpid(),
+            'started': datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+            'start': self.started,
+            'wall_s': time.time() - self.started,
+            'cpu_s': time.process_time() - self._start_cpu,
+            'stages': self.stages,
+        }
+
+    def write(self, directory=None, children=()):
+        """Write the trace (and the Chrome trace if enabled) to ``directory``; returns the JSON path.
+
+        ``children`` are traces of other processes (as from ``to_dict``), such
+        as the pipeline's nodes; they are stored under 'children' and get a
+        lane each in the Chrome trace.
+        """
+        directory = directory or trace_dir_setting()
+        trace = self.to_dict()
+        trace['children'] = list(children)
+        path = os.path.join(directory, f"{self.name}.json")
+        write_json(path, trace)
+        if chrome_trace_enabled():
+            write_json(os.path.join(directory, f"{self.name}.chrome.json"), chrome_trace([trace, *children]))
+        return path
+
+    def report(self):
+        """Print the stage table and write the trace."""
+        print_stages(self.stages)
+        path = self.write()
+        peak = max((stage['rss_start_mb'] + stage['peak_rss_delta_mb'] for stage in self.stages), default=0)
+        print(f"Stage trace: {len(self.stages)} stages in {time.time() - self.started:.2f} s, "
+              f"peak RSS {peak:.0f} MB; written to '{path}'")
+
+
+def _count(n):
+    return '' if pd.isna(n) else f"{n:,.0f}"
+
+
+def print_stages(stages):
+    table = pd.DataFrame(stages, columns=['name', 'wall_s', 'cpu_s', 'peak_rss_delta_mb', 'rows_in', 'rows_out'])
+    for col in ['rows_in', 'rows_out']:
+        table[col] = table[col].map(_count)
+    print()
+    print(table.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+
+
+def write_json(path, obj):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # Write to a temporary name first so a concurrent reader never sees a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(obj, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def load_trace(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def chrome_trace(traces):
+    """Chrome trace-event document for ``traces`` (as from ``StageTrace.to_dict``), one process lane each."""
+    events = []
+    for lane, trace in enumerate(traces, start=1):
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': lane, 'tid': 0, 'args': {'name': trace['name']}})
+        for stage in trace['stages']:
+            events.append({
+                'name': stage['name'],
+                'cat': trace['name'],
+                'ph': 'X',
+                'ts': stage['start'] * 1e6,
+                'dur': stage['wall_s'] * 1e6,
+                'pid': lane,
+                'tid': 0,
+                'args': {key: stage[key] for key in ('cpu_s', 'peak_rss_delta_mb', 'rows_in', 'rows_out')},
+            })
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
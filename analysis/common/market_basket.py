@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# Market-basket mining: FP-Growth frequent itemsets and association rules
+#
+# Baskets are read in two streaming passes: the first counts item support,
+# the second inserts each basket (restricted to frequent items) into an
+# FP-tree. Itemsets are then mined from the tree with conditional pattern
+# bases, so infrequent items and their supersets are pruned early and the
+# baskets themselves never need to be held in memory.
+
+from collections import defaultdict
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+from common.cooccurrence import LEVEL_COLUMNS, encode_baskets, incidence_matrix
+from common.partial_agg import aggregate
+
+
+class _FPNode:
+    __slots__ = ('item', 'count', 'parent', 'children')
+
+    def __init__(self, item, parent):
+        self.item = item
+        self.count = 0
+        self.parent = parent
+        self.children = {}
+
+
+def _insert(root, header, path, count):
+    node = root
+    for item in path:
+        child = node.children.get(item)
+        if child is None:
+            child = _FPNode(item, node)
+            node.children[item] = child
+            header[item].append(child)
+        child.count += count
+        node = child
+
+
+def _build_tree(weighted_baskets, min_count):
+    """Build an FP-tree from a list of ``(items, count)`` pairs."""
+    support = defaultdict(int)
+    for items, count in weighted_baskets:
+        for item in items:
+            support[item] += count
+    frequent = {item: n for item, n in support.items() if n >= min_count}
+
+    root = _FPNode(None, None)
+    header = defaultdict(list)
+    for items, count in weighted_baskets:
+        path = sorted((item for item in items if item in frequent), key=lambda i: (-frequent[i], i))
+        _insert(root, header, path, count)
+    return header, frequent
+
+
+def _mine(header, frequent, suffix, min_count, max_len, itemsets):
+    # Least frequent items first, as in the original FP-Growth formulation
+    for item in sorted(frequent, key=lambda i: (frequent[i], i)):
+        itemset = suffix + (item,)
+        itemsets[frozenset(itemset)] = frequent[item]
+        if max_len is not None and len(itemset) >= max_len:
+            continue
+
+        # Conditional pattern base: prefix paths ending at this item
+        pattern_base = []
+        for node in header[item]:
+            path = []
+            parent = node.parent
+            while parent.item is not None:
+                path.append(parent.item)
+                parent = parent.parent
+            if path:
+                pattern_base.append((path, node.count))
+
+        if pattern_base:
+            cond_header, cond_frequent = _build_tree(pattern_base, min_count)
+            if cond_frequent:
+                _mine(cond_header, cond_frequent, itemset, min_count, max_len, itemsets)
+
+
+def fpgrowth(baskets, min_support, max_len=None):
+    """Mine frequent itemsets with FP-Growth.
+
+    ``baskets`` is any re-iterable collection of baskets, each an iterable of
+    hashable items without duplicates; it is iterated exactly twice, so it can
+    stream from disk. ``min_support`` is a fraction of baskets (float) or an
+    absolute basket count (int). Returns ``(itemsets, n_baskets)`` where
+    ``itemsets`` maps each frequent ``frozenset`` to its basket count.
+    """
+    # Pass 1: item supports
+    support = defaultdict(int)
+    n_baskets = 0
+    for basket in baskets:
+        n_baskets += 1
+        for item in basket:
+            support[item] += 1
+
+    if isinstance(min_support, float):
+        min_count = max(1, int(np.ceil(min_support * n_baskets)))
+    else:
+        min_count = min_support
+    frequent = {item: n for item, n in support.items() if n >= min_count}
+
+    # Pass 2: build the FP-tree from the frequent part of each basket
+    root = _FPNode(None, None)
+    header = defaultdict(list)
+    for basket in baskets:
+        path = sorted((item for item in basket if item in frequent), key=lambda i: (-frequent[i], i))
+        if path:
+            _insert(root, header, path, 1)
+
+    itemsets = {}
+    _mine(header, frequent, (), min_count, max_len, itemsets)
+    return itemsets, n_baskets
+
+
+def association_rules(itemsets, n_baskets, min_confidence=0.0):
+    """Derive association rules from the output of ``fpgrowth``.
+
+    Every split of each frequent itemset (size >= 2) into a non-empty
+    antecedent and consequent is scored. Returns a DataFrame with
+    ``antecedents``, ``consequents`` (tuples of items), ``support``,
+    ``confidence`` and ``lift``, sorted by lift.
+    """
+    rows = []
+    for itemset, count in itemsets.items():
+        if len(itemset) < 2:
+            continue
+        support = count / n_baskets
+        for size in range(1, len(itemset)):
+            for antecedent in combinations(sorted(itemset), size):
+                consequent = tuple(sorted(itemset.difference(antecedent)))
+                confidence = count / itemsets[frozenset(antecedent)]
+                if confidence < min_confidence:
+                    continue
+                lift = confidence / (itemsets[frozenset(consequent)] / n_baskets)
+                rows.append((antecedent, consequent, support, confidence, lift))
+
+    rules = pd.DataFrame(rows, columns=['antecedents', 'consequents', 'support', 'confidence', 'lift'])
+    return rules.sort_values(['lift', 'support'], ascending=False, ignore_index=True)
+
+
+class CSRBaskets:
+    """Re-iterable view of the rows of a CSR incidence matrix as baskets."""
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def __iter__(self):
+        indptr, indices = self.matrix.indptr, self.matrix.indices
+        for row in range(self.matrix.shape[0]):
+            yield indices[indptr[row]:indptr[row + 1]].tolist()
+
+
+def recommend_bundles(df, level='sub-category', min_support=0.005, min_size=2, top_n=5,
+                      min_margin=0.0, basket_col='order_id'):
+    """Build bundle recommendations from frequent itemsets mined over order baskets.
+
+    Candidate bundles are frequent itemsets with at least ``min_size`` items,
+    ranked by lift (how much more often the items are bought together than
+    independently) and then support. Bundles whose lines, in orders containing
+    the whole bundle, earn a profit margin below ``min_margin`` are skipped.
+    Each bundle gets the customer segment where it is most over-represented,
+    or 'All Segments' when no segment stands out. ``df`` may be a stream of
+    chunks, which is first summed to one line per basket and item. Lines
+    without a basket or item are left out, as from the incidence matrix.
+    """
+    item_col = LEVEL_COLUMNS[level]
+    if not isinstance(df, pd.DataFrame):
+        df = aggregate(df, [basket_col, item_col, 'category', 'segment'], {'sales': 'sum', 'profit': 'sum'})
+    matrix, items = incidence_matrix(df, item_col, basket_col)
+    itemsets, n_baskets = fpgrowth(CSRBaskets(matrix), min_support)
+
+    # Lift of the whole bundle against the independence assumption
+    candidates = []
+    for itemset, count in itemsets.items():
+        if len(itemset) < min_size:
+            continue
+        expected = np.prod([itemsets[frozenset([item])] / n_baskets for item in itemset])
+        candidates.append((sorted(itemset), count / n_baskets, (count / n_baskets) / expected))
+    candidates.sort(key=lambda c: (-c[2], -c[1], c[0]))
+
+    columns = matrix.tocsc()
+    basket_codes, item_codes, _ = encode_baskets(df, item_col, basket_col)
+    valid = (basket_codes >= 0) & (item_codes >= 0)
+    basket_codes, item_codes = basket_codes[valid], item_codes[valid]
+    sales = df['sales'].to_numpy()[valid]
+    profit = df['profit'].to_numpy()[valid]
+    # One segment per row of the incidence matrix
+    basket_segment = pd.Series(df['segment'].to_numpy()[valid]).groupby(basket_codes).first().reindex(
+        np.arange(matrix.shape[0]))
+    segment_share = basket_segment.value_counts(normalize=True)
+    category_of = df.groupby(item_col, observed=True)['category'].first()
+
+    rows = []
+    for codes, support, lift in candidates:
+        if len(rows) == top_n:
+            break
+        in_bundle = np.asarray(columns[:, codes].sum(axis=1)).ravel() == len(codes)
+        bundle_lines = in_bundle[basket_codes] & np.isin(item_codes, codes)
+        bundle_sales = sales[bundle_lines].sum()
+        # A bundle without sales has no margin and is not recommended
+        margin = profit[bundle_lines].sum() / bundle_sales if bundle_sales != 0 else np.nan
+        if np.isnan(margin) or margin < min_margin:
+            continue
+
+        segment_lift = basket_segment[in_bundle].value_counts(normalize=True) / segment_share
+        target = segment_lift.idxmax() if segment_lift.max() > 1.1 else 'All Segments'
+
+        labels = [str(items[code]) for code in codes]
+        categories = {category_of[label] for label in labels}
+        theme = categories.pop() if len(categories) == 1 else 'Mixed'
+        rows.append({
+            'Bundle_Name': f"{theme} Bundle {len(rows) + 1}",
+            'Products': ' + '.join(labels),
+            'Target_Segment': target,
+            'Expected_Profit_Margin': f"{margin:.1%}",
+            'Support': round(support, 4),
+            'Lift': round(lift, 2),
+            'Order_Count': int(in_bundle.sum()),
+        })
+    return pd.DataFrame(rows)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# Materialized order-level table over the Superstore order lines
+#
+# Several analyses look at whole orders rather than lines: order sizes, order
+# sizes per segment, and which items are bought together. The order lines are
+# grouped once, by the integer order code coded at load (see ID_CODE_COLUMNS
+# in common.data_loader), into one row per order:
+#
+#   order_id, segment, region, order_date     taken from the order's first line
+#   quantity, sales, profit                   summed over its lines
+#   line_count                                its number of lines
+#
+# Row i is the order with code i. Each order's basket, the set of items
+# (sub-categories, or products with level='product') on its lines, is kept in
+# CSR form: the item codes of order i are
+# ``basket_items[basket_offsets[i]:basket_offsets[i + 1]]``, sorted, and index
+# into the sorted item labels ``items``, which is already the layout of the
+# order x item incidence matrix the bundling analysis counts pairs in (see
+# common.cooccurrence), so ``basket_matrix`` wraps the arrays without a copy.
+#
+# The table is persisted under analysis/.cache keyed on the source file hash
+# and the basket level, next to the sales cube.
+
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from common.cooccurrence import LEVEL_COLUMNS, rank_pairs
+from common.data_loader import (CACHE_VERSION, DEFAULT_CACHE_DIR, DEFAULT_DATA_PATH, file_hash, file_identity,
+                                open_superstore, plain_labels)
+from common.partial_agg import DistinctRows, PartialAggregate
+
+# Order attributes, taken from each order's first line
+ORDER_ATTRIBUTES = ['order_id', 'segment', 'region', 'order_date']
+SUM_MEASURES = ['quantity', 'sales', 'profit']
+
+
+def source_columns(level='sub-category'):
+    """Columns of the dataset the table is built from, with baskets of ``level`` items."""
+    return ['order_code'] + ORDER_ATTRIBUTES + SUM_MEASURES + [LEVEL_COLUMNS[level]]
+
+
+def _baskets(order_codes, item_codes, n_orders):
+    """CSR offsets and sorted item codes of each order's distinct items; missing orders and items are left out."""
+    present = (order_codes >= 0) & (item_codes >= 0)
+    pairs = np.unique(order_codes[present].astype(np.int64) << 32 | item_codes[present].astype(np.int64))
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(pairs >> 32, minlength=n_orders))])
+    return offsets, (pairs & 0xFFFFFFFF).astype(np.int32)
+
+
+def basket_matrix(offsets, item_codes, n_items):
+    """The binary order x item incidence matrix of CSR baskets, in CSR form."""
+    data = np.ones(len(item_codes), dtype=np.int32)
+    return sparse.csr_matrix((data, item_codes, offsets), shape=(len(offsets) - 1, n_items))
+
+
+def top_basket_pairs(baskets, items, k=10):
+    """``top_pairs`` over the CSR baskets ``[offsets, item codes]`` of the sorted ``items``."""
+    offsets, item_codes = baskets
+    return rank_pairs(basket_matrix(offsets, item_codes, len(items)), items, k)
+
+
+class OrderTable:
+    """One row per order, with the basket of items on its lines."""
+
+    def __init__(self, orders, basket_offsets, basket_items, items):
+        self.orders = orders
+        self.basket_offsets = basket_offsets
+        self.basket_items = basket_items
+        self.items = items
+
+    def __len__(self):
+        return len(self.orders)
+
+    @classmethod
+    def build(cls, df, level='sub-category'):
+        """Build the table from the order lines in one groupby over the order codes."""
+        order_codes = df['order_code'].to_numpy()
+        # Lines without an order id (code -1) belong to no order
+        coded = order_codes >= 0
+        lines = pd.DataFrame({col: df[col].array[coded] for col in ORDER_ATTRIBUTES + SUM_MEASURES})
+        lines['line_count'] = 1
+        spec = {col: 'first' for col in ORDER_ATTRIBUTES}
+        spec.update({col: 'sum' for col in SUM_MEASURES + ['line_count']})
+        orders = lines.groupby(order_codes[coded], sort=True).agg(spec)
+
+        item_codes, items = pd.factorize(df[LEVEL_COLUMNS[level]], sort=True)
+        offsets, basket_items = _baskets(order_codes, item_codes, len(orders))
+        return cls(plain_labels(orders.reset_index(drop=True)), offsets, basket_items, np.asarray(items, dtype=str))
+
+    @classmethod
+    def build_chunked(cls, chunks, level='sub-category'):
+        """Build the same table as ``build`` from a stream of chunks.
+
+        Order totals are merged chunk by chunk and only the distinct (order,
+        item) pairs are kept, so memory grows with the orders rather than
+        with the lines.
+        """
+        item_col = LEVEL_COLUMNS[level]
+        spec = {col: 'first' for col in ORDER_ATTRIBUTES}
+        spec.update({col: 'sum' for col in SUM_MEASURES + ['line_count']})
+        totals = PartialAggregate('order_code', spec)
+        pairs = DistinctRows()
+        for chunk in chunks[source_columns(level)]:
+            chunk = chunk[chunk['order_code'] >= 0]
+            totals.update(chunk[['order_code'] + ORDER_ATTRIBUTES + SUM_MEASURES].assign(line_count=1))
+            pairs.add(pd.DataFrame({'order': chunk['order_code'].to_numpy(), 'item': chunk[item_col].to_numpy()}))
+
+        orders = totals.result().drop(columns='order_code')
+        seen = pairs.frame()
+        item_codes, items = pd.factorize(seen['item'], sort=True)
+        offsets, basket_items = _baskets(seen['order'].to_numpy(), item_codes, len(orders))
+        return cls(orders, offsets, basket_items, np.asarray(items, dtype=str))
+
+    def baskets(self):
+        """The CSR baskets as ``[offsets, item codes]``, e.g. for ``top_basket_pairs``."""
+        return [self.basket_offsets, self.basket_items]
+
+    def save(self, directory):
+        """Write the table to ``directory``; readers never see a partial table."""
+        tmp_dir = f"{directory}.{os.getpid()}.tmp"
+        os.makedirs(tmp_dir, exist_ok=True)
+        self.orders.to_parquet(os.path.join(tmp_dir, 'orders.parquet'), index=False)
+        np.savez(os.path.join(tmp_dir, 'baskets.npz'), offsets=self.basket_offsets, items=self.basket_items,
+                 labels=self.items)
+        try:
+            os.replace(tmp_dir, directory)
+        except OSError:
+            # Another process published the table first; the directory is keyed
+            # on the source, so its copy is the same table
+            if not os.path.isdir(directory):
+                raise
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    @classmethod
+    def load(cls, directory):
+        orders = pd.read_parquet(os.path.join(directory, 'orders.parquet'))
+        with np.load(os.path.join(directory, 'baskets.npz')) as arrays:
+            return cls(orders, arrays['offsets'], arrays['items'], arrays['labels'])
+
+
+# Tables already loaded by this process, as for the dataset itself
+_LOADED = {}
+
+
+def load_order_table(path=DEFAULT_DATA_PATH, cache_dir=DEFAULT_CACHE_DIR, df=None, level='sub-category'):
+    """Load the persisted order table for ``path``, building and saving it on first use.
+
+    The table is built from ``df`` when given, which may be a frame or a
+    stream of chunks; a frame loaded without the table's source columns is
+    not used, and those columns are loaded instead.
+    """
+    identity = file_identity(path), level
+    if identity in _LOADED:
+        return _LOADED[identity]
+
+    directory = os.path.join(cache_dir, f"order-table-{file_hash(path)}-v{CACHE_VERSION}-{level}")
+    if os.path.exists(os.path.join(directory, 'baskets.npz')):
+        print(f"Loading order table from '{directory}'")
+        table = OrderTable.load(directory)
+    else:
+        columns = source_columns(level)
+        data = df
+        if df is None or isinstance(df, pd.DataFrame) and not set(columns) <= set(df.columns):
+            data = open_superstore(path, columns=columns)
+        if isinstance(data, pd.DataFrame):
+            table = OrderTable.build(data, level)
+        else:
+            table = OrderTable.build_chunked(data, level)
+        table.save(directory)
+        print(f"Saved order table with {len(table)} orders as '{directory}'")
+    _LOADED[identity] = table
+    return table
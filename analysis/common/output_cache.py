@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# Content-addressed cache for analysis outputs
+#
+# Charts and expensive intermediate frames are stored as blobs named by a
+# SHA-256 key over everything that determines them: the slice of input data
+# they are computed from (hashed by value), the function that produces them
+# (by the source of its whole module, so that edits to the helpers and
+# constants it uses next to it count too) and its parameters. When a run asks
+# for an output whose key is already cached, the blob is copied into place
+# instead of recomputing or re-rendering it, so unchanged outputs cost one
+# hash of their inputs. CSV exports are plain writes of frames that are
+# already computed; hashing them would cost as much as writing them.
+#
+# Code in other modules is not part of the key: bump OUTPUT_CACHE_VERSION
+# when a change to a shared helper (e.g. in common/) or a library upgrade
+# changes what a cached chart or frame would look like.
+#
+# Blobs live under analysis/.cache/outputs/. After each run the cache is
+# trimmed: entries not used for ``max_age_days`` are removed, then the least
+# recently used entries until the directory fits in ``max_bytes``. Set
+# SUPERSTORE_NO_OUTPUT_CACHE=1 to bypass the cache entirely.
+
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import shutil
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from common.data_loader import CACHE_VERSION, DEFAULT_CACHE_DIR, SuperstoreChunks
+
+DEFAULT_OUTPUT_CACHE_DIR = os.path.join(DEFAULT_CACHE_DIR, 'outputs')
+DEFAULT_MAX_BYTES = 512 * 1024 ** 2
+DEFAULT_MAX_AGE_DAYS = 30
+# Part of every key; bump to drop outputs that depend on code outside the producing module
+OUTPUT_CACHE_VERSION = 1
+
+
+@functools.lru_cache(maxsize=None)
+def _module_source(module):
+    return inspect.getsource(module)
+
+
+@functools.lru_cache(maxsize=None)
+def _file_source(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def _defining_source(obj):
+    """Source of the module defining ``obj``.
+
+    Scripts imported from a file path without being registered in
+    sys.modules have no module to look up; their file is read instead.
+    """
+    module = inspect.getmodule(obj) or sys.modules.get(obj.__module__)
+    if module is not None:
+        return _module_source(module)
+    return _file_source(inspect.getsourcefile(obj))
+
+
+def _update(h, obj):
+    if isinstance(obj, pd.DataFrame):
+        h.update(repr((list(obj.columns), [str(dtype) for dtype in obj.dtypes])).encode())
+        try:
+            h.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+        except TypeError:
+            # Unhashable cells (e.g. lists); fall back to the pickled frame
+            h.update(pickle.dumps(obj))
+    elif isinstance(obj, pd.Series):
+        h.update(repr((obj.name, str(obj.dtype))).encode())
+        h.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+    elif isinstance(obj, SuperstoreChunks):
+        # Streams are too large to hash by value; the source file hash stands in
+        h.update(repr(('chunks', obj.identity())).encode())
+    elif isinstance(obj, np.ndarray):
+        h.update(repr((obj.dtype.str, obj.shape)).encode())
+        h.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, dict):
+        h.update(f"dict{len(obj)}".encode())
+        for key in sorted(obj):
+            _update(h, key)
+            _update(h, obj[key])
+    elif isinstance(obj, (list, tuple)):
+        h.update(f"{type(obj).__name__}{len(obj)}".encode())
+        for item in obj:
+            _update(h, item)
+    elif callable(obj):
+        h.update(f"{obj.__module__}.{obj.__qualname__}".encode())
+        h.update(inspect.getsource(obj).encode())
+        # The rest of the defining module: the helpers and constants the function reads
+        h.update(_defining_source(obj).encode())
+    else:
+        h.update(repr(obj).encode())
+
+
+def fingerprint(*parts):
+    """SHA-256 over frames (by value), arrays, callables (by module source) and plain parameters."""
+    h = hashlib.sha256(f"v{CACHE_VERSION}.{OUTPUT_CACHE_VERSION}".encode())
+    for part in parts:
+        _update(h, part)
+    return h.hexdigest()
+
+
+class OutputCache:
+    """Content-addressed store for charts and computed frames."""
+
+    def __init__(self, directory=DEFAULT_OUTPUT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES,
+                 max_age_days=DEFAULT_MAX_AGE_DAYS, enabled=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        if enabled is None:
+            enabled = os.environ.get('SUPERSTORE_NO_OUTPUT_CACHE', '').lower() not in ('1', 'true', 'yes')
+        self.enabled = enabled
+        # kind -> [hits, misses]
+        self.stats = {}
+
+    def _blob_path(self, key, suffix):
+        return os.path.join(self.directory, key[:2], f"{key}{suffix}")
+
+    def _count(self, kind, hit):
+        counts = self.stats.setdefault(kind, [0, 0])
+        counts[0 if hit else 1] += 1
+
+    def restore(self, kind, key, path):
+        """Copy the blob for ``key`` to ``path``; returns False on a miss."""
+        if not self.enabled:
+            return False
+        blob = self._blob_path(key, os.path.splitext(path)[1])
+        hit = os.path.exists(blob)
+        self._count(kind, hit)
+        if hit:
+            shutil.copyfile(blob, path)
+            os.utime(blob)
+        return hit
+
+    def store(self, key, path):
+        """Save the file at ``path`` as the blob for ``key``."""
+        if not self.enabled:
+            return
+        blob = self._blob_path(key, os.path.splitext(path)[1])
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        tmp_path = f"{blob}.{os.getpid()}.tmp"
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, blob)
+
+    def frame(self, name, compute, data, **params):
+        """Return ``compute(data, **params)``, read from the cache when ``data`` and ``params`` match.
+
+        ``data`` should be just the slice of input the computation reads, so
+        that unrelated changes to the dataset do not invalidate the entry.
+        """
+        if not self.enabled:
+            return compute(data, **params)
+        key = fingerprint(name, compute, data, params)
+        blob = self._blob_path(key, '.parquet')
+        if os.path.exists(blob):
+            self._count('frame', True)
+            os.utime(blob)
+            return pd.read_parquet(blob)
+
+        self._count('frame', False)
+        result = compute(data, **params)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        tmp_path = f"{blob}.{os.getpid()}.tmp"
+        result.to_parquet(tmp_path)
+        os.replace(tmp_path, blob)
+        return result
+
+    def evict(self):
+        """Drop stale entries, then least recently used ones beyond ``max_bytes``."""
+        if not os.path.isdir(self.directory):
+            return 0, 0
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        cutoff = time.time() - self.max_age_days * 86400
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for mtime, size, path in entries:
+            if mtime >= cutoff and total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            evicted += 1
+        return evicted, total
+
+    def report(self):
+        """Trim the cache and print this run's hit/miss statistics."""
+        if not self.enabled:
+            print("Output cache disabled (SUPERSTORE_NO_OUTPUT_CACHE is set)")
+            return
+        evicted, total = self.evict()
+        hits = sum(h for h, _ in self.stats.values())
+        misses = sum(m for _, m in self.stats.values())
+        by_kind = ', '.join(f"{kind} {h}/{m}" for kind, (h, m) in sorted(self.stats.items()))
+        print(f"Output cache: {hits} hits, {misses} misses ({by_kind}); "
+              f"{total / 1024 ** 2:.1f} MB cached, {evicted} entries evicted")
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# Hash-partitioned parallel aggregation across CPU cores
+#
+# pandas runs every groupby on a single core. For large frames the rows are
+# hash-partitioned by the group key instead, and a process pool aggregates
+# the partitions independently:
+#
+#   1. each worker hashes the key of a contiguous block of rows into a
+#      partition number, written to a shared-memory buffer
+#   2. the parent turns the partition numbers into a row order grouped by
+#      partition (a stable sort of small integers), also in shared memory
+#   3. each worker gathers the rows of one partition at a time and runs the
+#      ordinary pandas aggregation on them
+#
+# A group never spans two partitions, so the partial results are disjoint:
+# they are concatenated and sorted, with nothing to merge, and every
+# aggregation (nunique, median, std) stays exact. Rows keep their original
+# order inside a partition, so sums come out bit for bit as in the serial
+# groupby. Workers are forked after the shared buffers are allocated, and
+# read the frame's column buffers through the fork without copying them.
+#
+# SUPERSTORE_AGG_WORKERS sets the number of workers (0 for one per CPU). It
+# defaults to 1, which keeps every aggregation serial, as do frames below
+# PARALLEL_MIN_ROWS and platforms without fork.
+
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+# Frames smaller than this are aggregated serially; below it the pool costs more than it saves
+PARALLEL_MIN_ROWS = 250_000
+# Partitions per worker, so one slow partition does not leave the other workers idle
+PARTITIONS_PER_WORKER = 4
+# Rows each worker hashes per task in the partitioning pass
+HASH_BLOCK_ROWS = 1 << 20
+
+# State of the running aggregation, inherited by the forked workers
+_TASK = None
+_IN_WORKER = False
+
+
+def workers_setting():
+    """Worker processes for partitioned aggregation, from SUPERSTORE_AGG_WORKERS (1 = serial)."""
+    if _IN_WORKER or 'fork' not in multiprocessing.get_all_start_methods():
+        return 1
+    value = os.environ.get('SUPERSTORE_AGG_WORKERS', '').strip()
+    if not value:
+        return 1
+    return int(value) or os.cpu_count() or 1
+
+
+def use_parallel(df, workers=None):
+    """Whether ``df`` is large enough, and workers configured, to aggregate it in parallel."""
+    workers = workers_setting() if workers is None else workers
+    return workers > 1 and len(df) >= PARALLEL_MIN_ROWS
+
+
+class _SharedArray:
+    """A NumPy array backed by a shared-memory block, visible to processes forked after it."""
+
+    def __init__(self, length, dtype):
+        dtype = np.dtype(dtype)
+        self._block = shared_memory.SharedMemory(create=True, size=max(1, length * dtype.itemsize))
+        self.array = np.ndarray(length, dtype=dtype, buffer=self._block.buf)
+
+    def release(self):
+        del self.array
+        self._block.close()
+        self._block.unlink()
+
+
+def _init_worker():
+    global _IN_WORKER
+    _IN_WORKER = True
+
+
+def _hash_block(bounds):
+    start, stop = bounds
+    keys = _TASK['keys'].iloc[start:stop]
+    hashes = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+    _TASK['partition'].array[start:stop] = hashes % np.uint64(_TASK['partitions'])
+
+
+def _run_partition(index):
+    offsets = _TASK['offsets'].array
+    rows = _TASK['order'].array[offsets[index]:offsets[index + 1]]
+    if not len(rows):
+        return None
+    return _TASK['fn'](_TASK['frame'].take(rows), **_TASK['kwargs'])
+
+
+def _columns(df, columns):
+    """``df`` restricted to ``columns`` without copying them."""
+    return pd.DataFrame({col: df[col] for col in columns}, copy=False)
+
+
+def parallel_apply(df, key, fn, workers=None, columns=None, **kwargs):
+    """Results of ``fn(partition, **kwargs)`` on hash partitions of ``df`` by ``key``.
+
+    ``key`` is a column or a list of columns; every row with the same key
+    lands in the same partition, so ``fn`` must treat each group of ``key``
+    independently (a groupby on ``key`` or on a finer key does). The
+    partitions are processed by ``workers`` forked processes (default
+    ``workers_setting()``) and the non-empty results are returned as a list,
+    in no particular order, for the caller to concatenate and sort. Only
+    ``columns`` (all by default) are passed to ``fn``.
+    """
+    global _TASK
+    workers = workers_setting() if workers is None else workers
+    key = [key] if isinstance(key, str) else list(key)
+    n_rows = len(df)
+    partitions = max(1, workers * PARTITIONS_PER_WORKER)
+
+    partition = _SharedArray(n_rows, np.int32)
+    order = _SharedArray(n_rows, np.int64)
+    offsets = _SharedArray(partitions + 1, np.int64)
+    frame = df if columns is None else _columns(df, columns)
+    _TASK = {'frame': frame, 'keys': _columns(df, key), 'partitions': partitions, 'partition': partition,
+             'order': order, 'offsets': offsets, 'fn': fn, 'kwargs': kwargs}
+    try:
+        context = multiprocessing.get_context('fork')
+        with context.Pool(workers, initializer=_init_worker) as pool:
+            block_rows = min(HASH_BLOCK_ROWS, -(-n_rows // workers))
+            blocks = [(start, min(start + block_rows, n_rows)) for start in range(0, n_rows, block_rows)]
+            pool.map(_hash_block, blocks)
+
+            # Rows grouped by partition, in their original order within each one
+            order.array[:] = np.argsort(partition.array, kind='stable')
+            offsets.array[0] = 0
+            np.cumsum(np.bincount(partition.array, minlength=partitions), out=offsets.array[1:])
+
+            results = pool.map(_run_partition, range(partitions), chunksize=1)
+    finally:
+        _TASK = None
+        for shared in (partition, order, offsets):
+            shared.release()
+    return [result for result in results if result is not None]
+
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# Scaling benchmark for the hash-partitioned parallel aggregation
+#
+# Usage (from the analysis/ directory):
+#   python -m common.parallel_benchmark [--scale 200] [--workers 1 2 4 8] [--repeat 3]
+#
+# The dataset is replicated --scale times, with the order and customer ids of
+# each copy made distinct so the number of groups grows with the rows. Each
+# workload is timed serially and with each worker count, and every parallel
+# result is checked against the serial one.
+
+import argparse
+import os
+import time
+
+import pandas as pd
+
+from common.data_loader import load_superstore
+from common.parallel_agg import PARALLEL_MIN_ROWS
+from common.partial_agg import aggregate
+from common.rfm import SOURCE_COLUMNS, compute_rfm, default_reference_date
+
+COLUMNS = sorted(set(SOURCE_COLUMNS) | {'order_id', 'city', 'state', 'region', 'segment', 'quantity', 'profit'})
+
+# Workloads, each named after the key its rows are partitioned by
+WORKLOADS = {
+    'RFM (customer_id)': lambda df, reference_date: compute_rfm(df, reference_date),
+    'order totals (order_id)': lambda df, reference_date: aggregate(df, 'order_id', {
+        'quantity': 'sum', 'sales': 'sum', 'profit': 'sum', 'segment': 'first'}),
+    'city rollup (city, state, region)': lambda df, reference_date: aggregate(df, ['city', 'state', 'region'], {
+        'sales': 'sum', 'profit': 'sum', 'order_id': 'nunique', 'customer_id': 'nunique'}),
+}
+
+
+def replicated(scale):
+    """The dataset repeated ``scale`` times, each copy with its own order and customer ids."""
+    df = load_superstore(columns=COLUMNS)
+    copies = []
+    for i in range(scale):
+        copy = df.copy()
+        copy['order_id'] = copy['order_id'] + f"-{i}"
+        copy['customer_id'] = copy['customer_id'] + f"-{i}"
+        copies.append(copy)
+    return pd.concat(copies, ignore_index=True)
+
+
+def best_time(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time partitioned parallel aggregation against serial pandas')
+    parser.add_argument('--scale', type=int, default=200, help='Copies of the dataset to aggregate')
+    parser.add_argument('--workers', type=int, nargs='+', default=sorted({1, 2, 4, 8, os.cpu_count() or 1}))
+    parser.add_argument('--repeat', type=int, default=3, help='Timing repetitions (best is shown)')
+    args = parser.parse_args()
+
+    df = replicated(args.scale)
+    reference_date = default_reference_date(df)
+    if len(df) < PARALLEL_MIN_ROWS:
+        print(f"Note: {len(df):,} rows is below PARALLEL_MIN_ROWS ({PARALLEL_MIN_ROWS:,}); every run is serial")
+    print(f"Rows: {len(df):,}, CPUs: {os.cpu_count()}")
+
+    print(f"\n{'workload':<34} {'workers':>7} {'seconds':>8} {'speedup':>8}")
+    for name, workload in WORKLOADS.items():
+        os.environ['SUPERSTORE_AGG_WORKERS'] = '1'
+        serial_time, expected = best_time(lambda: workload(df, reference_date), args.repeat)
+        for workers in args.workers:
+            os.environ['SUPERSTORE_AGG_WORKERS'] = str(workers)
+            elapsed, result = best_time(lambda: workload(df, reference_date), args.repeat)
+            pd.testing.assert_frame_equal(result, expected)
+            print(f"{name:<34} {workers:>7} {elapsed:>8.2f} {serial_time / elapsed:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
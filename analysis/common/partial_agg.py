@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+# Mergeable partial aggregates for chunked (larger than memory) datasets
+#
+# The analyses' groupbys are restated as partial aggregates that can be
+# computed per chunk and combined, so a dataset streamed in chunks (see
+# ``SuperstoreChunks`` in common.data_loader) produces the same tables as the
+# whole frame while only one chunk is in memory at a time:
+#
+#   sum, count, min, max, first   combined with the same function
+#   mean                          count and mean, merged as a weighted mean
+#   std, var                      count, mean and sum of squared deviations,
+#                                 combined with Chan et al.'s pairwise formula
+#   nunique                       the distinct (group, value) pairs
+#   median                        per-group value counts (exact; meant for
+#                                 discrete columns such as quantity)
+#
+# Every helper also accepts an in-memory DataFrame, for which it runs the
+# plain pandas equivalent, so analysis code can be written once for both.
+# State is proportional to the number of groups, except for nunique and
+# median, which keep one entry per distinct value in each group.
+
+import numpy as np
+import pandas as pd
+
+from common.data_loader import plain_labels
+from common.parallel_agg import parallel_apply, use_parallel
+
+# Spec functions that combine partials with the function itself
+_SELF_COMBINING = {'sum': 'sum', 'count': 'sum', 'min': 'min', 'max': 'max', 'first': 'first'}
+AGGREGATIONS = set(_SELF_COMBINING) | {'mean', 'std', 'var', 'nunique', 'median'}
+
+# Rows per sample drawn by ``sample_rows`` (enough for a distribution chart)
+DEFAULT_SAMPLE_ROWS = 100_000
+
+
+def _chunks(data):
+    return [data] if isinstance(data, pd.DataFrame) else data
+
+
+def _as_list(columns):
+    if columns is None:
+        return []
+    return [columns] if isinstance(columns, str) else list(columns)
+
+
+class DistinctRows:
+    """Distinct rows seen across chunks, in order of first appearance.
+
+    New rows are buffered and deduplicated against the rows kept so far once
+    the buffer outgrows them, so the amortized cost stays linear.
+    """
+
+    def __init__(self, counts=False):
+        # With ``counts`` set, the rows are kept with their number of occurrences
+        self.counts = counts
+        self._kept = None
+        self._pending = []
+        self._pending_rows = 0
+
+    def add(self, frame):
+        if self.counts:
+            frame = frame.value_counts(sort=False, dropna=False).rename('count').reset_index()
+        else:
+            frame = frame.drop_duplicates()
+        self._pending.append(frame)
+        self._pending_rows += len(frame)
+        if self._pending_rows > max(4096, 0 if self._kept is None else len(self._kept)):
+            self._compact()
+
+    def _compact(self):
+        frames = ([] if self._kept is None else [self._kept]) + self._pending
+        if not frames:
+            return
+        merged = pd.concat(frames, ignore_index=True)
+        if self.counts:
+            keys = [col for col in merged.columns if col != 'count']
+            merged = merged.groupby(keys, sort=False, dropna=False)['count'].sum().reset_index()
+        else:
+            merged = merged.drop_duplicates(ignore_index=True)
+        self._kept, self._pending, self._pending_rows = merged, [], 0
+
+    def merge(self, other):
+        """Add the rows kept by another ``DistinctRows`` of the same kind."""
+        frame = other.frame()
+        if frame is not None:
+            self._pending.append(frame)
+            self._pending_rows += len(frame)
+        return self
+
+    def frame(self):
+        self._compact()
+        return self._kept
+
+
+class PartialAggregate:
+    """``groupby(by).agg(spec)`` accumulated chunk by chunk.
+
+    ``spec`` maps columns to one function name or a list of them, as for
+    ``DataFrame.agg``. Call ``update`` with each chunk (or ``merge`` two
+    partials built on different chunks), then ``result``.
+    """
+
+    def __init__(self, by, spec):
+        self.by = _as_list(by)
+        self.spec = {col: funcs if isinstance(funcs, list) else [funcs] for col, funcs in spec.items()}
+        # pandas labels every column (column, function) once any entry is a list
+        self.nested = any(isinstance(funcs, list) for funcs in spec.values())
+        for col, funcs in self.spec.items():
+            unknown = set(funcs) - AGGREGATIONS
+            if unknown:
+                raise ValueError(f"Unsupported aggregation {sorted(unknown)} for '{col}'")
+        self._parts = []
+        self._distinct = {col: DistinctRows() for col, funcs in self.spec.items() if 'nunique' in funcs}
+        self._value_counts = {col: DistinctRows(counts=True) for col, funcs in self.spec.items() if 'median' in funcs}
+
+    def update(self, chunk):
+        # A constant key stands in for "no grouping"
+        keys = self.by if self.by else [np.zeros(len(chunk), dtype=np.int8)]
+        grouped = chunk.groupby(keys, observed=True, sort=False)
+        part = {('', 'rows'): grouped.size()}
+        for col, funcs in self.spec.items():
+            for func in funcs:
+                if func in _SELF_COMBINING:
+                    part[(col, func)] = grouped[col].agg(func)
+                elif func in ('mean', 'std', 'var'):
+                    part[(col, 'n')] = grouped[col].count()
+                    part[(col, 'mean')] = grouped[col].mean()
+                    if func != 'mean':
+                        part[(col, 'm2')] = grouped[col].var(ddof=0) * part[(col, 'n')]
+        self._parts.append(pd.DataFrame(part))
+        if len(self._parts) > 16:
+            self._parts = [self._combine()]
+
+        rows = chunk[self.by].reset_index(drop=True) if self.by else pd.DataFrame(index=range(len(chunk)))
+        for col, distinct in self._distinct.items():
+            distinct.add(rows.assign(_value=chunk[col].to_numpy()))
+        for col, value_counts in self._value_counts.items():
+            value_counts.add(rows.assign(_value=chunk[col].to_numpy()))
+        return self
+
+    def merge(self, other):
+        self._parts.extend(other._parts)
+        for col, distinct in self._distinct.items():
+            distinct.merge(other._distinct[col])
+        for col, value_counts in self._value_counts.items():
+            value_counts.merge(other._value_counts[col])
+        return self
+
+    def _combine(self):
+        parts = pd.concat(self._parts)
+        level = list(range(parts.index.nlevels))
+
+        def per_group(values, func='sum'):
+            return values.groupby(level=level, sort=False).agg(func)
+
+        combined = {}
+        for col, func in parts.columns:
+            if func in _SELF_COMBINING or func == 'rows':
+                combined[(col, func)] = per_group(parts[(col, func)], _SELF_COMBINING.get(func, 'sum'))
+        for col in [col for col, func in parts.columns if func == 'n']:
+            n_part, mean_part = parts[(col, 'n')], parts[(col, 'mean')]
+            n = per_group(n_part)
+            # Weighted mean of the partial means; empty partials carry no weight
+            mean = per_group((mean_part * n_part).where(n_part > 0, 0.0)) / n
+            combined[(col, 'n')] = n
+            combined[(col, 'mean')] = mean
+            if (col, 'm2') in parts.columns:
+                # Chan et al.: M2 = sum(M2_i) + sum(n_i * (mean_i - mean)^2)
+                deviation = (mean_part - mean.reindex(parts.index).to_numpy()) ** 2 * n_part
+                combined[(col, 'm2')] = per_group(parts[(col, 'm2')]) + per_group(deviation.where(n_part > 0, 0.0))
+        return pd.DataFrame(combined)
+
+    def _group_index(self, frame):
+        if len(self.by) > 1:
+            return pd.MultiIndex.from_frame(frame[self.by])
+        return pd.Index(frame[self.by[0]])
+
+    def _nunique(self, col, index):
+        pairs = self._distinct[col].frame()
+        pairs = pairs[pairs['_value'].notna()]
+        if not self.by:
+            return pd.Series([len(pairs)], index=index)
+        return pairs.groupby(self.by).size().reindex(index, fill_value=0)
+
+    def _median(self, col, index):
+        counts = self._value_counts[col].frame().dropna(subset=['_value'])
+        counts = counts.sort_values(self.by + ['_value'], ignore_index=True)
+        weights = counts['count'].to_numpy()
+        if self.by:
+            group_index = self._group_index(counts)
+            first_row = ~group_index.duplicated()
+            grouped = counts.groupby(self.by, sort=False)['count']
+            totals = grouped.transform('sum').to_numpy()
+            starts = grouped.cumsum().to_numpy() - weights
+        else:
+            group_index = index
+            first_row = np.arange(len(counts)) == 0
+            totals = np.full(len(counts), weights.sum())
+            starts = np.cumsum(weights) - weights
+        medians = quantiles_from_counts(counts['_value'].to_numpy(dtype=float), weights,
+                                        totals, starts, first_row, 0.5)
+        if not self.by:
+            return pd.Series(medians, index=index)
+        return pd.Series(medians, index=group_index[first_row]).reindex(index)
+
+    def result(self):
+        """The aggregated frame, like ``groupby(by).agg(spec).reset_index()`` with plain labels."""
+        combined = self._combine().sort_index()
+        index = combined.index
+        columns = {}
+        for col, funcs in self.spec.items():
+            for func in funcs:
+                if func in _SELF_COMBINING:
+                    values = combined[(col, func)]
+                elif func == 'mean':
+                    values = combined[(col, 'mean')]
+                elif func in ('std', 'var'):
+                    n = combined[(col, 'n')]
+                    values = (combined[(col, 'm2')] / (n - 1)).where(n > 1)
+                    values = np.sqrt(values) if func == 'std' else values
+                elif func == 'nunique':
+                    values = self._nunique(col, index)
+                else:
+                    values = self._median(col, index)
+                columns[(col, func)] = values.to_numpy()
+
+        result = pd.DataFrame(columns, index=index)
+        if not self.nested:
+            result.columns = [col for col, _ in result.columns]
+        if not self.by:
+            return result.reset_index(drop=True)
+        result.index.names = self.by
+        return plain_labels(result.reset_index())
+
+
+def quantiles_from_counts(values, counts, totals, starts, first_row, q):
+    """Quantile ``q`` of each group of sorted ``values`` given their ``counts``.
+
+    Groups are contiguous runs of rows; ``totals`` holds each row's group
+    size, ``starts`` the number of group members before the row and
+    ``first_row`` marks the first row of each group. Interpolation is linear,
+    as in ``Series.quantile``.
+    """
+    group_starts = np.flatnonzero(first_row)
+    group_ends = np.append(group_starts[1:], len(values))
+    result = np.empty(len(group_starts))
+    for i, (start, end) in enumerate(zip(group_starts, group_ends)):
+        n = totals[start]
+        position = (n - 1) * q
+        lower = int(np.floor(position))
+        cumulative = starts[start:end] + counts[start:end]
+        lower_value = values[start + np.searchsorted(cumulative, lower, side='right')]
+        upper_value = values[start + np.searchsorted(cumulative, min(lower + 1, n - 1), side='right')]
+        result[i] = lower_value + (position - lower) * (upper_value - lower_value)
+    return result
+
+
+def _group_frame(df, by, spec, where=None):
+    if where is not None:
+        df = df[where(df)]
+    keys = _as_list(by) or np.zeros(len(df), dtype=np.int8)
+    return df.groupby(keys, observed=True).agg(spec)
+
+
+def aggregate(data, by, spec, where=None):
+    """``data.groupby(by, observed=True).agg(spec).reset_index()`` with plain labels.
+
+    ``data`` is a DataFrame or a stream of chunks. ``by=None`` aggregates
+    everything into a single row. ``where``, if given, is called on each
+    frame or chunk and returns the boolean mask of rows to keep. Large frames
+    are aggregated in parallel when SUPERSTORE_AGG_WORKERS is set (see
+    common.parallel_agg).
+    """
+    if isinstance(data, pd.DataFrame):
+        if by is not None and use_parallel(data):
+            # Hash partitions by the group key hold disjoint groups; see common.parallel_agg
+            columns = None if where is not None else _as_list(by) + [col for col in spec if col not in _as_list(by)]
+            results = parallel_apply(data, by, _group_frame, columns=columns, by=by, spec=spec, where=where)
+            result = pd.concat(results).sort_index() if results else _group_frame(data.iloc[:0], by, spec, where)
+        else:
+            result = _group_frame(data, by, spec, where)
+        return result.reset_index(drop=True) if by is None else result.reset_index().pipe(plain_labels)
+
+    partial = PartialAggregate(by, spec)
+    for chunk in data:
+        partial.update(chunk if where is None else chunk[where(chunk)])
+    return partial.result()
+
+
+def distinct(data, columns):
+    """Distinct rows of ``columns`` in order of first appearance, like ``drop_duplicates``."""
+    rows = DistinctRows()
+    for chunk in _chunks(data):
+        rows.add(chunk[_as_list(columns)])
+    return rows.frame()
+
+
+def describe(data, column):
+    """``data[column].describe()`` for a numeric column.
+
+    Chunked data is summarised from value counts, so quantiles are exact; the
+    state grows with the number of distinct values in the column.
+    """
+    if isinstance(data, pd.DataFrame):
+        return data[column].describe()
+
+    counts = DistinctRows(counts=True)
+    for chunk in data:
+        counts.add(chunk[[column]])
+    counts = counts.frame().dropna().sort_values(column, ignore_index=True)
+    values = counts[column].to_numpy(dtype=float)
+    weights = counts['count'].to_numpy()
+    n = weights.sum()
+    mean = (values * weights).sum() / n
+    std = np.sqrt((weights * (values - mean) ** 2).sum() / (n - 1)) if n > 1 else np.nan
+    starts = np.concatenate([[0], np.cumsum(weights)[:-1]])
+    first_row = np.arange(len(values)) == 0
+    totals = np.full(len(values), n)
+    stats = [float(n), mean, std, values[0]]
+    stats += [quantiles_from_counts(values, weights, totals, starts, first_row, q)[0] for q in (0.25, 0.5, 0.75)]
+    stats.append(values[-1])
+    return pd.Series(stats, index=['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max'], name=column)
+
+
+def correlation(data, columns):
+    """Pearson correlation matrix of ``columns``, like ``data[columns].corr()``.
+
+    Chunks are merged through their counts, means and co-moment matrices.
+    Rows with a missing value in any of the columns are skipped.
+    """
+    if isinstance(data, pd.DataFrame):
+        return data[columns].corr()
+
+    n, mean, comoment = 0, np.zeros(len(columns)), np.zeros((len(columns), len(columns)))
+    for chunk in data:
+        values = chunk[columns].dropna().to_numpy(dtype=float)
+        if not len(values):
+            continue
+        chunk_mean = values.mean(axis=0)
+        centered = values - chunk_mean
+        chunk_n = len(values)
+        delta = chunk_mean - mean
+        total = n + chunk_n
+        comoment += centered.T @ centered + np.outer(delta, delta) * n * chunk_n / total
+        mean += delta * chunk_n / total
+        n = total
+    scale = np.sqrt(np.diag(comoment))
+    return pd.DataFrame(comoment / np.outer(scale, scale), index=columns, columns=columns)
+
+
+def sample_rows(data, columns, n=DEFAULT_SAMPLE_ROWS, seed=0):
+    """Up to ``n`` rows of ``columns`` drawn uniformly at random, in their original order.
+
+    When there are no more than ``n`` rows they are all returned, so charts
+    drawn from a sample of a small dataset are unchanged.
+    """
+    rng = np.random.default_rng(seed)
+    kept, kept_keys = None, np.empty(0)
+    for chunk in _chunks(data):
+        rows = chunk[_as_list(columns)]
+        keys = rng.random(len(rows))
+        if kept is not None:
+            rows = pd.concat([kept, rows])
+            keys = np.concatenate([kept_keys, keys])
+        if len(rows) > n:
+            keep = np.sort(np.argpartition(keys, n - 1)[:n])
+            rows, keys = rows.iloc[keep], keys[keep]
+        kept, kept_keys = rows, keys
+    return kept.sort_index()
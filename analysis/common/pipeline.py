@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# Dependency-DAG executor for the analysis pipeline
+#
+# A pipeline is a list of nodes, each naming the nodes it needs as inputs.
+# Shared nodes (loading the dataset, the sales cube) run in the runner
+# process itself, so their results stay in memory. Every other node runs in
+# its own forked child process as soon as its inputs have finished, with up
+# to ``jobs`` children at a time. A fresh fork per node means it inherits
+# everything loaded so far and nothing from its siblings. Child output goes
+# to a per-node log file so concurrent nodes do not interleave.
+#
+# A failed node fails the run, and the nodes that depend on it are skipped.
+# Independent nodes still run.
+
+import multiprocessing
+import os
+import sys
+import time
+from collections import namedtuple
+from multiprocessing.connection import wait
+
+Node = namedtuple('Node', ['name', 'run', 'inputs', 'shared'], defaults=[(), False])
+
+
+def _check_graph(nodes):
+    names = [node.name for node in nodes]
+    if len(set(names)) != len(names):
+        raise ValueError("Pipeline node names must be unique")
+    for node in nodes:
+        missing = set(node.inputs) - set(names)
+        if missing:
+            raise ValueError(f"Node '{node.name}' depends on unknown nodes {sorted(missing)}")
+
+    # Kahn's algorithm; anything left over sits on a cycle
+    remaining = {node.name: set(node.inputs) for node in nodes}
+    while remaining:
+        ready = [name for name, inputs in remaining.items() if not inputs]
+        if not ready:
+            raise ValueError(f"Pipeline has a dependency cycle among {sorted(remaining)}")
+        for name in ready:
+            del remaining[name]
+        for inputs in remaining.values():
+            inputs.difference_update(ready)
+
+
+def _run_child(node, log_path):
+    with open(log_path, 'w') as log:
+        os.dup2(log.fileno(), sys.stdout.fileno())
+        os.dup2(log.fileno(), sys.stderr.fileno())
+        node.run()
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+
+def run_pipeline(nodes, jobs=None, log_dir='.'):
+    """Run ``nodes`` in dependency order, independent ones concurrently.
+
+    Returns ``{name: (status, seconds)}`` where status is 'ok', 'failed' or
+    'skipped'.
+    """
+    _check_graph(nodes)
+    jobs = jobs or os.cpu_count() or 1
+    os.makedirs(log_dir, exist_ok=True)
+    context = multiprocessing.get_context('fork')
+
+    pending = list(nodes)
+    results = {}
+    running = {}  # sentinel -> (node, process, start)
+
+    def log_path(node):
+        return os.path.join(log_dir, f"{node.name}.log")
+
+    while pending or running:
+        for node in list(pending):
+            if any(results[name][0] != 'ok' for name in node.inputs if name in results):
+                pending.remove(node)
+                results[node.name] = ('skipped', 0.0)
+                print(f"[{node.name}] skipped: an input failed")
+                continue
+            if not all(name in results for name in node.inputs):
+                continue
+            if node.shared:
+                if running:
+                    # Shared nodes run in this process; let the children drain first
+                    continue
+                pending.remove(node)
+                print(f"[{node.name}] running")
+                start = time.perf_counter()
+                try:
+                    node.run()
+                    status = 'ok'
+                except Exception as exc:
+                    print(f"[{node.name}] failed: {exc!r}")
+                    status = 'failed'
+                results[node.name] = (status, time.perf_counter() - start)
+            elif len(running) < jobs:
+                pending.remove(node)
+                print(f"[{node.name}] started (log: {log_path(node)})")
+                sys.stdout.flush()
+                process = context.Process(target=_run_child, args=(node, log_path(node)), name=node.name)
+                process.start()
+                running[process.sentinel] = (node, process, time.perf_counter())
+
+        if not running:
+            continue
+        for sentinel in wait(list(running)):
+            node, process, start = running.pop(sentinel)
+            process.join()
+            elapsed = time.perf_counter() - start
+            status = 'ok' if process.exitcode == 0 else 'failed'
+            results[node.name] = (status, elapsed)
+            print(f"[{node.name}] {status} in {elapsed:.2f} s")
+    return results
+
+
+def print_timings(results, wall_time):
+    """Per-node timing table plus the speedup over running the nodes back to back."""
+    print(f"\n{'node':<26} {'status':<8} {'seconds':>8}")
+    for name, (status, seconds) in results.items():
+        print(f"{name:<26} {status:<8} {seconds:>8.2f}")
+    serial = sum(seconds for _, seconds in results.values())
+    print(f"{'total (wall)':<26} {'':<8} {wall_time:>8.2f}")
+    print(f"Sum of node times {serial:.2f} s, {serial / wall_time:.1f}x overlap")
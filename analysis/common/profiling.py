@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# Wall time, CPU time and peak memory of a block of code
+#
+# Peak memory is the process's resident set high-water mark (VmHWM in
+# /proc/self/status). On Linux the mark is reset before each measured block
+# by writing 5 to /proc/self/clear_refs, so the peak reported is the block's
+# own; elsewhere, or where clear_refs is not writable, the lifetime peak from
+# getrusage is used and only grows when a block exceeds every earlier one.
+# Memory and CPU used by worker processes (SUPERSTORE_AGG_WORKERS) are not
+# included.
+
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+MB = 1e6
+
+
+def _status_bytes(field):
+    """A memory field of /proc/self/status (e.g. 'VmRSS') in bytes, or None off Linux."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _max_rss_bytes():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def current_rss():
+    """Resident set size of this process in bytes."""
+    rss = _status_bytes('VmRSS')
+    return rss if rss is not None else _max_rss_bytes()
+
+
+def peak_rss():
+    """Resident set high-water mark of this process in bytes (since the last reset)."""
+    peak = _status_bytes('VmHWM')
+    return peak if peak is not None else _max_rss_bytes()
+
+
+def reset_peak_rss():
+    """Reset the high-water mark to the current RSS; returns whether that is supported."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+    return True
+
+
+@contextmanager
+def measure():
+    """Measure the enclosed block; the yielded dict is filled in when it exits.
+
+    Keys: ``wall_s`` and ``cpu_s`` (seconds), ``rss_start_mb`` (RSS on entry)
+    and ``peak_rss_delta_mb``, how far the resident set rose above that
+    during the block.
+    """
+    result = {}
+    reset_peak_rss()
+    start_rss = current_rss()
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    try:
+        yield result
+    finally:
+        result['wall_s'] = time.perf_counter() - start_wall
+        result['cpu_s'] = time.process_time() - start_cpu
+        result['rss_start_mb'] = start_rss / MB
+        result['peak_rss_delta_mb'] = max(0, peak_rss() - start_rss) / MB
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# Accuracy of sketched RFM quintiles versus exact pd.qcut
+#
+# Usage (from the analysis/ directory):
+#   python -m common.quantile_report [--customers 1000000] [--partitions 16] [--k 200]
+#
+# Scores the Superstore customers, and a synthetic customer table of the
+# given size, once with exact quintiles and once with cut points from
+# partition-wise KLL sketches merged together, then reports how far the
+# sketched cut points are from the exact ones (in rank) and how many
+# customers receive a different score.
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from common.data_loader import load_superstore
+from common.rfm import QUINTILES, RFM_METRICS, SOURCE_COLUMNS, RFMSketch, compute_rfm, score_rfm
+
+
+def synthetic_rfm(n_customers, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'recency': rng.geometric(1 / 150, size=n_customers).astype(np.int32),
+        'frequency': rng.poisson(6, size=n_customers).astype(np.int32) + 1,
+        'monetary': rng.lognormal(7.5, 1.0, size=n_customers).astype(np.float32),
+    })
+
+
+def compare(rfm, partitions, k):
+    sketch = RFMSketch(k=k, seed=0)
+    for part in np.array_split(np.arange(len(rfm)), partitions):
+        sketch.merge(RFMSketch(k=k, seed=len(part)).update(rfm.iloc[part]))
+    cut_points = sketch.cut_points()
+
+    exact = score_rfm(rfm.copy())
+    approx = score_rfm(rfm.copy(), cut_points)
+
+    rows = []
+    for metric, score in zip(RFM_METRICS, ['r_score', 'f_score', 'm_score']):
+        values = np.sort(rfm[metric].to_numpy())
+        # Rank of each sketched cut point within the exact distribution
+        lower = np.searchsorted(values, cut_points[metric], side='left') / len(values)
+        upper = np.searchsorted(values, cut_points[metric], side='right') / len(values)
+        rank_error = np.maximum(0, np.maximum(lower - QUINTILES, QUINTILES - upper)).max()
+        rows.append({
+            'metric': metric,
+            'max cut-point rank error': rank_error,
+            'customers rescored': (exact[score].astype(int) != approx[score].astype(int)).mean(),
+        })
+    rows.append({
+        'metric': 'rfm_segment',
+        'max cut-point rank error': np.nan,
+        'customers rescored': (exact['rfm_segment'] != approx['rfm_segment']).mean(),
+    })
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare sketched and exact RFM quintiles')
+    parser.add_argument('--customers', type=int, default=1_000_000)
+    parser.add_argument('--partitions', type=int, default=16)
+    parser.add_argument('--k', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"Documented rank error bound for k={args.k}: {RFMSketch(k=args.k).sketches['recency'].rank_error:.2%}")
+
+    print("\n===== SUPERSTORE CUSTOMERS =====")
+    print(compare(compute_rfm(load_superstore(columns=SOURCE_COLUMNS)), args.partitions, args.k).to_string(index=False))
+
+    print(f"\n===== SYNTHETIC ({args.customers:,} CUSTOMERS) =====")
+    print(compare(synthetic_rfm(args.customers), args.partitions, args.k).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
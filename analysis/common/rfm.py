@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# Recency / Frequency / Monetary metrics per customer
+#
+# All three metrics come from native groupby aggregations: recency is a max
+# of the order date followed by one vectorized subtraction, frequency a
+# nunique over integer-coded order ids, and monetary a sum. No Python
+# function is called per customer.
+
+import os
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from common.parallel_agg import parallel_apply, use_parallel
+from common.partial_agg import aggregate
+from common.sketches import KLLSketch
+
+# Dataset columns compute_rfm reads
+SOURCE_COLUMNS = ['customer_id', 'order_code', 'order_date', 'sales']
+
+
+def default_reference_date(df):
+    """The day after the latest order, used as 'today' for recency."""
+    if not isinstance(df, pd.DataFrame):
+        return aggregate(df[['order_date']], None, {'order_date': 'max'})['order_date'].iloc[0] + timedelta(days=1)
+    return df['order_date'].max() + timedelta(days=1)
+
+
+def compute_rfm(df, reference_date=None):
+    """Compute RFM metrics for every customer in ``df``.
+
+    Returns a frame with one row per customer, sorted by ``customer_id``, and
+    compact columns: ``recency`` (days since the last order, int32),
+    ``frequency`` (distinct orders, int32) and ``monetary`` (total sales,
+    float32).
+
+    ``df`` may also be a stream of chunks (see common.partial_agg), which is
+    aggregated chunk by chunk. Large frames are split by customer across
+    worker processes when SUPERSTORE_AGG_WORKERS is set (see
+    common.parallel_agg).
+    """
+    if reference_date is None:
+        reference_date = default_reference_date(df)
+
+    if isinstance(df, pd.DataFrame) and use_parallel(df):
+        results = parallel_apply(df, 'customer_id', compute_rfm, columns=SOURCE_COLUMNS, reference_date=reference_date)
+        return pd.concat(results, ignore_index=True).sort_values('customer_id', ignore_index=True)
+
+    if isinstance(df, pd.DataFrame):
+        grouped = pd.DataFrame({
+            'customer_id': df['customer_id'].to_numpy(),
+            'order_date': df['order_date'].to_numpy(),
+            'order_code': df['order_code'].to_numpy(),
+            'sales': df['sales'].to_numpy(),
+        }).groupby('customer_id', sort=True)
+        last_order = grouped['order_date'].max()
+        frequency = grouped['order_code'].nunique()
+        monetary = grouped['sales'].sum()
+    else:
+        totals = aggregate(df, 'customer_id', {'order_date': 'max', 'order_code': 'nunique', 'sales': 'sum'})
+        totals = totals.set_index('customer_id')
+        last_order, frequency, monetary = totals['order_date'], totals['order_code'], totals['sales']
+
+    rfm = pd.DataFrame({
+        'recency': (reference_date - last_order).dt.days.astype(np.int32),
+        'frequency': frequency.astype(np.int32),
+        'monetary': monetary.astype(np.float32),
+    })
+    return rfm.rename_axis('customer_id').reset_index()
+
+
+RFM_METRICS = ['recency', 'frequency', 'monetary']
+QUINTILES = [0.2, 0.4, 0.6, 0.8]
+
+
+def _scores_from_cut_points(values, cut_points, labels):
+    # Intervals are closed on the right, as with pd.qcut
+    codes = np.searchsorted(cut_points, values, side='left')
+    return pd.Categorical.from_codes(codes, categories=labels)
+
+
+def score_rfm(rfm, cut_points=None):
+    """Add quintile scores, the combined RFM score and the RFM segment.
+
+    Scores run from 1 to 5 (5 is best); recency is reversed because fewer days
+    since the last order is better. By default the quintiles are exact
+    (``pd.qcut``); pass ``cut_points`` (see ``RFMSketch.cut_points``) to score
+    against approximate quintile boundaries instead.
+    """
+    if cut_points is None:
+        rfm['r_score'] = pd.qcut(rfm['recency'], 5, labels=[5, 4, 3, 2, 1])
+        rfm['f_score'] = pd.qcut(rfm['frequency'], 5, labels=[1, 2, 3, 4, 5])
+        rfm['m_score'] = pd.qcut(rfm['monetary'], 5, labels=[1, 2, 3, 4, 5])
+    else:
+        rfm['r_score'] = _scores_from_cut_points(rfm['recency'], cut_points['recency'], [5, 4, 3, 2, 1])
+        rfm['f_score'] = _scores_from_cut_points(rfm['frequency'], cut_points['frequency'], [1, 2, 3, 4, 5])
+        rfm['m_score'] = _scores_from_cut_points(rfm['monetary'], cut_points['monetary'], [1, 2, 3, 4, 5])
+
+    rfm['rfm_score'] = rfm['r_score'].astype(int) + rfm['f_score'].astype(int) + rfm['m_score'].astype(int)
+    rfm['rfm_segment'] = pd.cut(
+        rfm['rfm_score'],
+        bins=[0, 5, 9, 12, 15],
+        labels=['Low-Value', 'Mid-Value', 'High-Value', 'Top Customers']
+    )
+    return rfm
+
+
+class RFMSketch:
+    """Mergeable quantile sketches of recency, frequency and monetary.
+
+    Feed customer RFM rows partition by partition (or build one sketch per
+    partition and ``merge`` them); ``cut_points`` then yields quintile
+    boundaries for ``score_rfm`` in bounded memory. See ``common.sketches``
+    for the error bound.
+    """
+
+    def __init__(self, k=200, seed=None):
+        self.sketches = {metric: KLLSketch(k, seed) for metric in RFM_METRICS}
+
+    def update(self, rfm):
+        for metric, sketch in self.sketches.items():
+            sketch.update(rfm[metric].to_numpy())
+        return self
+
+    def merge(self, other):
+        for metric, sketch in self.sketches.items():
+            sketch.merge(other.sketches[metric])
+        return self
+
+    def cut_points(self):
+        return {metric: sketch.quantiles(QUINTILES) for metric, sketch in self.sketches.items()}
+
+
+# Incremental RFM state
+#
+# Instead of rescanning every order ever placed, a persisted per-customer
+# state (last order date, distinct order count, total sales, name, segment)
+# is folded together with each new batch of orders. Aggregation and the
+# update of the state are proportional to the batch: returning customers'
+# rows are updated in place and new customers are appended unsorted. Reading,
+# writing and re-scoring the state remain proportional to the number of
+# customers; the state is put back in customer order only when it is scored.
+# Each order's lines are assumed to arrive in a single batch, so distinct
+# order counts can simply be added.
+
+STATE_COLUMNS = ['last_order_date', 'frequency', 'monetary', 'customer_name', 'segment']
+# Dataset columns build_rfm_state reads
+STATE_SOURCE_COLUMNS = SOURCE_COLUMNS + ['customer_name', 'segment']
+
+
+def build_rfm_state(df):
+    """Aggregate order lines into per-customer RFM state indexed by ``customer_id``."""
+    grouped = pd.DataFrame({
+        'customer_id': df['customer_id'].to_numpy(),
+        'order_date': df['order_date'].to_numpy(),
+        'order_code': df['order_code'].to_numpy(),
+        'sales': df['sales'].to_numpy(),
+        'customer_name': df['customer_name'].to_numpy(),
+        'segment': np.asarray(df['segment'], dtype=object),
+    }).groupby('customer_id', sort=True)
+
+    return pd.DataFrame({
+        'last_order_date': grouped['order_date'].max(),
+        'frequency': grouped['order_code'].nunique().astype(np.int64),
+        'monetary': grouped['sales'].sum(),
+        'customer_name': grouped['customer_name'].first(),
+        'segment': grouped['segment'].first(),
+    })
+
+
+def update_rfm_state(state, batch):
+    """Fold a batch of new order lines into ``state`` and return the new state.
+
+    Returning customers are updated in ``state`` itself; new customers are
+    appended after the existing rows.
+    """
+    delta = build_rfm_state(batch)
+    # Looked up in the state's index rather than hashing the whole state
+    known = state.index.get_indexer(delta.index) >= 0
+    returning = delta[known]
+
+    state.loc[returning.index, 'last_order_date'] = np.maximum(
+        state.loc[returning.index, 'last_order_date'], returning['last_order_date'])
+    state.loc[returning.index, 'frequency'] += returning['frequency']
+    state.loc[returning.index, 'monetary'] += returning['monetary']
+
+    new_customers = delta[~known]
+    if len(new_customers):
+        state = pd.concat([state, new_customers])
+    return state
+
+
+def rfm_from_state(state, reference_date=None):
+    """Turn RFM state into the same frame as ``compute_rfm`` plus customer details."""
+    if not state.index.is_monotonic_increasing:
+        state = state.sort_index()
+    if reference_date is None:
+        reference_date = state['last_order_date'].max() + timedelta(days=1)
+    rfm = pd.DataFrame({
+        'recency': (reference_date - state['last_order_date']).dt.days.astype(np.int32),
+        'frequency': state['frequency'].astype(np.int32),
+        'monetary': state['monetary'].astype(np.float32),
+        'customer_name': state['customer_name'],
+        'segment': state['segment'],
+    })
+    return rfm.rename_axis('customer_id').reset_index()
+
+
+def save_rfm_state(state, path):
+    """Persist RFM state as Parquet, replacing any previous file atomically."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    state.to_parquet(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_rfm_state(path):
+    return pd.read_parquet(path, columns=STATE_COLUMNS)
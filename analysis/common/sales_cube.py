@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# Materialized OLAP cube over the Superstore sales fact table
+#
+# The order lines are aggregated once to cells keyed on every dimension the
+# analysis scripts group by:
+#
+#   date       order_year > order_quarter > order_month
+#   geography  region > state > city
+#   product    category > sub-category
+#   customer   segment
+#   discount   discount_bin
+#
+# Each cell stores additive measures (sums of sales, profit, quantity and
+# discount, plus the line count), the sum of squared deviations of its line
+# sales from the cell mean (merged across cells with Chan's formula, as in
+# common.partial_agg) and, for the distinct-count measures, the exact set of
+# order and customer codes present in the cell.
+# The codes are the integer ids coded at load (see ID_CODE_COLUMNS in
+# common.data_loader) and each cell's set is a compressed bitmap (see
+# common.bitmaps), so nunique at any rollup level is the size of the union of
+# the member cells' bitmaps and never needs the row-level data or a string hash.
+#
+# With SUPERSTORE_HLL_PRECISION=P the distinct counts are approximate
+# instead: each cell keeps a HyperLogLog sketch of the hashed string ids (see
+# common.sketches), rollups merge the sketches, and no id is coded or kept.
+# That suits exploratory runs over far more lines than the exact sets fit.
+#
+# The cube is persisted under analysis/.cache keyed on the source file hash,
+# next to the cleaned dataset cache.
+
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from common.bitmaps import IdBitmaps
+from common.data_loader import (CACHE_VERSION, CATEGORY_VOCABULARIES, DEFAULT_CACHE_DIR, DEFAULT_DATA_PATH,
+                                ID_CODE_COLUMNS, file_hash, file_identity, open_superstore, plain_labels)
+from common.partial_agg import DistinctRows, PartialAggregate
+from common.sketches import HyperLogLogSketches, hll_error, hll_hash, hll_precision_setting, hll_registers
+
+HIERARCHIES = {
+    'date': ['order_year', 'order_quarter', 'order_month'],
+    'geography': ['region', 'state', 'city'],
+    'product': ['category', 'sub-category'],
+    'customer': ['segment'],
+    'discount': ['discount_bin'],
+}
+DIMENSIONS = [level for levels in HIERARCHIES.values() for level in levels]
+
+SUM_MEASURES = ['sales', 'profit', 'quantity', 'discount']
+DISTINCT_MEASURES = ['order_id', 'customer_id']
+# Integer code column each distinct count is built from
+DISTINCT_CODES = {id_col: code_col for code_col, id_col in ID_CODE_COLUMNS.items()}
+# Columns of the dataset the cube is built from (the discount bin comes from 'discount')
+SOURCE_COLUMNS = DIMENSIONS[:-1] + SUM_MEASURES + [DISTINCT_CODES[measure] for measure in DISTINCT_MEASURES]
+# Columns an approximate cube is built from: the string ids are hashed instead
+APPROXIMATE_SOURCE_COLUMNS = DIMENSIONS[:-1] + SUM_MEASURES + DISTINCT_MEASURES
+
+DISCOUNT_BINS = [-0.001, 0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 1.0]
+DISCOUNT_LABELS = ['0%', '1-10%', '11-20%', '21-30%', '31-40%', '41-50%', '51-100%']
+
+
+def discount_bins(discount):
+    """Bin line discounts into the ranges used by the profitability analysis."""
+    return pd.cut(discount, bins=DISCOUNT_BINS, labels=DISCOUNT_LABELS)
+
+
+def source_columns(precision=None):
+    """Columns the cube is built from, exact or (with a HyperLogLog ``precision``) approximate."""
+    return APPROXIMATE_SOURCE_COLUMNS if precision else SOURCE_COLUMNS
+
+
+class SalesCube:
+    """Pre-aggregated sales cube with a rollup / drilldown query API."""
+
+    def __init__(self, cells, id_sets):
+        self.cells = cells
+        # measure -> IdBitmaps of each cell's distinct codes, or the
+        # HyperLogLogSketches of its ids in an approximate cube
+        self.id_sets = id_sets
+
+    @classmethod
+    def build(cls, df, precision=None):
+        """Build the cube from the order lines; ``precision`` makes its distinct counts HyperLogLog estimates."""
+        fact = pd.DataFrame({dim: df[dim].array for dim in DIMENSIONS if dim != 'discount_bin'})
+        fact['discount_bin'] = discount_bins(df['discount']).array
+        for measure in SUM_MEASURES:
+            fact[measure] = df[measure].to_numpy()
+
+        grouped = fact.groupby(DIMENSIONS, observed=True, sort=True)
+        cells = grouped[SUM_MEASURES].sum()
+        cells['line_count'] = grouped.size()
+        cells['sales_m2'] = grouped['sales'].var(ddof=0) * cells['line_count']
+        cell_ids = grouped.ngroup().to_numpy()
+
+        if precision:
+            id_sets = {measure: HyperLogLogSketches.from_hashes(cell_ids, hll_hash(df[measure]), len(cells), precision)
+                       for measure in DISTINCT_MEASURES}
+        else:
+            id_sets = {measure: IdBitmaps.from_pairs(cell_ids, df[DISTINCT_CODES[measure]].to_numpy(), len(cells))
+                       for measure in DISTINCT_MEASURES}
+        return cls(cells.reset_index(), id_sets)
+
+    @classmethod
+    def build_chunked(cls, chunks, precision=None):
+        """Build the same cube as ``build`` from a stream of chunks.
+
+        Cell sums are merged chunk by chunk. The stream codes ids across all
+        its chunks, and only the distinct (cell, code) pairs are kept, so
+        memory grows with the cube rather than with the input. An approximate
+        cube keeps the distinct (cell, register, rank) entries of its
+        sketches instead, and the ids are not coded at all.
+        """
+        spec = {measure: 'sum' for measure in SUM_MEASURES + ['line_count']}
+        # The partials merge the per-cell variance of a copy of the sales with Chan's formula
+        sums = PartialAggregate(DIMENSIONS, {**spec, 'sales_var': 'var'})
+        pairs = {measure: DistinctRows() for measure in DISTINCT_MEASURES}
+        cell_keys = {}
+        for chunk in chunks[source_columns(precision)]:
+            fact = chunk[DIMENSIONS[:-1] + SUM_MEASURES].assign(
+                discount_bin=discount_bins(chunk['discount']).astype(object),
+                sales_var=chunk['sales'],
+                line_count=1,
+            )
+            sums.update(fact)
+            # Chunk-local cells are numbered in order of first appearance, as are their keys
+            local_cells = fact.groupby(DIMENSIONS, sort=False).ngroup().to_numpy()
+            local_keys = fact[DIMENSIONS].drop_duplicates().itertuples(index=False, name=None)
+            global_cells = np.fromiter((cell_keys.setdefault(key, len(cell_keys)) for key in local_keys),
+                                       dtype=np.int64)
+            for measure in DISTINCT_MEASURES:
+                if precision:
+                    registers, ranks = hll_registers(hll_hash(chunk[measure]), precision)
+                    pairs[measure].add(pd.DataFrame({'cell': global_cells[local_cells], 'register': registers,
+                                                     'rank': ranks}))
+                else:
+                    codes = chunk[DISTINCT_CODES[measure]].to_numpy()
+                    pairs[measure].add(pd.DataFrame({'cell': global_cells[local_cells], 'code': codes}))
+
+        cells = sums.result()
+        cells['sales_m2'] = (cells.pop('sales_var') * (cells['line_count'] - 1)).fillna(0.0)
+        for dim in DIMENSIONS:
+            if dim in CATEGORY_VOCABULARIES:
+                categories = sorted(set(CATEGORY_VOCABULARIES[dim]).union(cells[dim].unique()))
+                cells[dim] = pd.Categorical(cells[dim], categories=categories)
+        cells['discount_bin'] = pd.Categorical(cells['discount_bin'], categories=DISCOUNT_LABELS, ordered=True)
+        cells = cells.sort_values(DIMENSIONS, ignore_index=True)
+
+        # Position of each streamed cell key in the sorted cell table
+        keys = pd.MultiIndex.from_tuples(list(cell_keys), names=DIMENSIONS)
+        sorted_keys = pd.MultiIndex.from_frame(plain_labels(cells[DIMENSIONS]).astype({'discount_bin': object}))
+        position = sorted_keys.get_indexer(keys)
+
+        id_sets = {}
+        for measure in DISTINCT_MEASURES:
+            seen = pairs[measure].frame()
+            cell_ids = position[seen['cell'].to_numpy()]
+            if precision:
+                id_sets[measure] = HyperLogLogSketches.from_registers(
+                    cell_ids, seen['register'].to_numpy(), seen['rank'].to_numpy(), len(cells), precision)
+            else:
+                id_sets[measure] = IdBitmaps.from_pairs(cell_ids, seen['code'].to_numpy(), len(cells))
+        return cls(cells, id_sets)
+
+    def save(self, directory):
+        """Write the cube to ``directory``; readers never see a partial cube."""
+        tmp_dir = f"{directory}.{os.getpid()}.tmp"
+        os.makedirs(tmp_dir, exist_ok=True)
+        self.cells.to_parquet(os.path.join(tmp_dir, 'cells.parquet'), index=False)
+        arrays = {}
+        for measure, bitmaps in self.id_sets.items():
+            arrays.update(bitmaps.to_arrays(f'{measure}_'))
+        np.savez(os.path.join(tmp_dir, 'id_sets.npz'), **arrays)
+        try:
+            os.replace(tmp_dir, directory)
+        except OSError:
+            # Another process published the cube first; the directory is keyed
+            # on the source, so its copy is the same cube
+            if not os.path.isdir(directory):
+                raise
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    @classmethod
+    def load(cls, directory):
+        cells = pd.read_parquet(os.path.join(directory, 'cells.parquet'))
+        with np.load(os.path.join(directory, 'id_sets.npz')) as arrays:
+            approximate = f'{DISTINCT_MEASURES[0]}_precision' in arrays
+            id_sets = {measure: (HyperLogLogSketches if approximate else IdBitmaps).from_arrays(arrays, f'{measure}_')
+                       for measure in DISTINCT_MEASURES}
+        return cls(cells, id_sets)
+
+    def query(self, by, measures=('sales', 'order_id', 'profit'), where=None):
+        """Roll the cube up to the dimensions in ``by``.
+
+        ``measures`` may contain the sums in ``SUM_MEASURES``, the distinct
+        counts in ``DISTINCT_MEASURES`` (named after the id column, as in the
+        scripts' nunique aggregations; exact unless the cube is approximate),
+        ``line_count``, and
+        ``discount_mean``, ``sales_mean`` and ``sales_std`` (per line).
+        ``where`` maps dimensions to the values to keep before rolling up.
+        Results are sorted by ``by`` and carry plain label columns.
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        cells = self.cells
+        if where:
+            mask = np.ones(len(cells), dtype=bool)
+            for dim, values in where.items():
+                mask &= cells[dim].isin(values).to_numpy()
+            cells = cells[mask]
+
+        grouped = cells.groupby(by, observed=True, sort=True)
+        sums = grouped[SUM_MEASURES + ['line_count', 'sales_m2']].sum()
+        group_codes = grouped.ngroup().to_numpy()
+
+        result = pd.DataFrame(index=sums.index)
+        for measure in measures:
+            if measure in SUM_MEASURES or measure == 'line_count':
+                result[measure] = sums[measure]
+            elif measure in DISTINCT_MEASURES:
+                result[measure] = self.id_sets[measure].union_counts(cells.index.to_numpy(), group_codes, len(sums))
+            elif measure == 'discount_mean':
+                result[measure] = sums['discount'] / sums['line_count']
+            elif measure == 'sales_mean':
+                result[measure] = sums['sales'] / sums['line_count']
+            elif measure == 'sales_std':
+                # Chan et al.: M2 = sum(M2_i) + sum(n_i * (mean_i - mean)^2) over the group's cells
+                n = sums['line_count']
+                group_mean = (sums['sales'] / n).to_numpy()[group_codes]
+                deviation = (cells['sales'] / cells['line_count'] - group_mean) ** 2 * cells['line_count']
+                m2 = sums['sales_m2'] + np.bincount(group_codes, weights=deviation.to_numpy(), minlength=len(sums))
+                result[measure] = np.sqrt(m2 / (n - 1)).where(n > 1)
+            else:
+                raise ValueError(f"Unknown cube measure '{measure}'")
+        return plain_labels(result.reset_index())
+
+    def drilldown(self, hierarchy, level, measures=('sales', 'order_id', 'profit'), where=None):
+        """Query a hierarchy down to ``level``, e.g. ``drilldown('geography', 'state')``."""
+        levels = HIERARCHIES[hierarchy]
+        return self.query(levels[:levels.index(level) + 1], measures, where)
+
+
+# Cubes already loaded by this process, as for the dataset itself
+_LOADED = {}
+
+
+def load_sales_cube(path=DEFAULT_DATA_PATH, cache_dir=DEFAULT_CACHE_DIR, df=None, precision=None):
+    """Load the persisted cube for ``path``, building and saving it on first use.
+
+    The cube is built from ``df`` when given, which may be a frame or a stream
+    of chunks; a frame loaded without the cube's source columns is not used,
+    and those columns are loaded instead. The distinct counts are HyperLogLog
+    estimates when ``precision`` (or SUPERSTORE_HLL_PRECISION) is set; exact
+    and approximate cubes are cached separately.
+    """
+    precision = precision or hll_precision_setting()
+    identity = file_identity(path), precision
+    if identity in _LOADED:
+        return _LOADED[identity]
+
+    mode = f"-hll{precision}" if precision else ''
+    directory = os.path.join(cache_dir, f"sales-cube-{file_hash(path)}-v{CACHE_VERSION}{mode}")
+    if precision:
+        print(f"Distinct counts are HyperLogLog estimates (precision {precision}, "
+              f"standard error {hll_error(precision):.1%})")
+    if os.path.exists(os.path.join(directory, 'id_sets.npz')):
+        print(f"Loading sales cube from '{directory}'")
+        cube = SalesCube.load(directory)
+    else:
+        columns = source_columns(precision)
+        data = df
+        if df is None or isinstance(df, pd.DataFrame) and not set(columns) <= set(df.columns):
+            data = open_superstore(path, columns=columns)
+        if isinstance(data, pd.DataFrame):
+            cube = SalesCube.build(data, precision)
+        else:
+            cube = SalesCube.build_chunked(data, precision)
+        cube.save(directory)
+        print(f"Saved sales cube with {len(cube.cells)} cells as '{directory}'")
+    _LOADED[identity] = cube
+    return cube
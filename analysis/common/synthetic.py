@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# Synthetic order data with the Superstore schema, at any scale
+#
+# The sample dataset has 9,994 lines; the benchmarks need millions. The
+# generator is fitted to the sample and writes a raw CSV the loader reads
+# like the real file:
+#
+#   - orders have a geometric number of lines with the sample's mean (about
+#     two), a date drawn from the sample's daily order counts (so seasonality
+#     and yearly growth carry over), a city drawn with the sample's skew (New
+#     York City and Los Angeles lead) and a ship mode and shipping time drawn
+#     as in the sample
+#   - customers grow with the data at the sample's lines per customer; their
+#     order rates are lognormal, so a minority places most orders
+#   - the product catalogue grows with the square root of the scale, variants
+#     of the sample's products; within a sub-category popularity is Zipf, and
+#     the sub-categories keep their sample shares
+#   - each line takes its discount and profit margin together from a sample
+#     line of the same region and sub-category, so the discount distribution
+#     and its effect on profit are the sample's; sales are the product's unit
+#     price times quantity less the discount
+#
+# Rows are generated and written a chunk at a time, so memory stays flat
+# however many rows are asked for.
+
+import math
+
+import numpy as np
+import pandas as pd
+
+from common.data_loader import DATE_FORMAT, DEFAULT_DATA_PATH, RAW_DTYPES, read_raw
+
+# Within-sub-category Zipf exponent of product popularity
+PRODUCT_ZIPF_EXPONENT = 1.0
+# Sigma of the lognormal customer order rates
+CUSTOMER_RATE_SIGMA = 1.0
+# Extra weight of every day in the date range, so days without a sample order still get some
+DAY_SMOOTHING = 0.5
+# Product numbers of generated variants start here, above the sample's
+VARIANT_PRODUCT_BASE = 20_000_000
+
+
+def _cdf(weights):
+    cdf = np.cumsum(weights, dtype=np.float64)
+    return cdf / cdf[-1]
+
+
+def _draw(rng, cdf, n):
+    """``n`` indices drawn with the probabilities of ``cdf``."""
+    return np.minimum(np.searchsorted(cdf, rng.random(n), side='right'), len(cdf) - 1)
+
+
+class SuperstoreModel:
+    """Distributions fitted to the sample, and a row generator for ``n_rows`` lines.
+
+    The catalogue and customer base are sized for ``n_rows`` when the model is
+    built; ``chunks`` then yields the raw lines.
+    """
+
+    def __init__(self, n_rows, sample_path=DEFAULT_DATA_PATH, seed=0):
+        self.n_rows = n_rows
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        sample = read_raw(sample_path)
+        sample['Order Date'] = pd.to_datetime(sample['Order Date'], format=DATE_FORMAT)
+        sample['Ship Date'] = pd.to_datetime(sample['Ship Date'], format=DATE_FORMAT)
+        scale = max(1.0, n_rows / len(sample))
+        orders = sample.drop_duplicates('Order ID')
+
+        self.mean_lines = len(sample) / len(orders)
+        self.quantities = sample['Quantity'].to_numpy()
+        self._fit_dates(orders)
+        self._fit_shipping(orders)
+        self._fit_cities(sample)
+        self._fit_customers(sample, rng, max(1, round(n_rows * sample['Customer ID'].nunique() / len(sample))))
+        self._fit_products(sample, rng, round(sample['Product ID'].nunique() * math.sqrt(scale)))
+        self._fit_donors(sample)
+
+    def _fit_dates(self, orders):
+        days = pd.date_range(orders['Order Date'].min(), orders['Order Date'].max())
+        counts = orders['Order Date'].value_counts().reindex(days, fill_value=0)
+        self.days = days
+        # Labels run past the last order day to cover the ship dates of the last orders
+        labelled = pd.date_range(days[0], periods=len(days) + 31)
+        self.day_labels = np.array([f"{d.month}/{d.day}/{d.year}" for d in labelled], dtype=object)
+        self.day_cdf = _cdf(counts.to_numpy() + DAY_SMOOTHING)
+        self.order_prefixes = orders['Order ID'].str[:2].value_counts(normalize=True)
+
+    def _fit_shipping(self, orders):
+        shares = orders['Ship Mode'].value_counts(normalize=True)
+        self.ship_modes = shares.index.to_numpy(dtype=object)
+        self.ship_mode_cdf = _cdf(shares.to_numpy())
+        days = (orders['Ship Date'] - orders['Order Date']).dt.days
+        self.ship_days = [days[orders['Ship Mode'] == mode].to_numpy() for mode in self.ship_modes]
+
+    def _fit_cities(self, sample):
+        places = sample.groupby(['City', 'State', 'Postal Code', 'Region']).size()
+        self.places = places.index.to_frame(index=False)
+        self.place_cdf = _cdf(places.to_numpy())
+
+    def _fit_customers(self, sample, rng, n_customers):
+        names = sample['Customer Name'].drop_duplicates().str.split(' ', n=1, expand=True).dropna()
+        self.first_names = names[0].drop_duplicates().to_numpy(dtype=object)
+        self.last_names = names[1].drop_duplicates().to_numpy(dtype=object)
+        self.customer_first = rng.integers(len(self.first_names), size=n_customers, dtype=np.int32)
+        self.customer_last = rng.integers(len(self.last_names), size=n_customers, dtype=np.int32)
+        segments = sample.drop_duplicates('Customer ID')['Segment'].value_counts(normalize=True)
+        self.segments = segments.index.to_numpy(dtype=object)
+        self.customer_segment = _draw(rng, _cdf(segments.to_numpy()), n_customers).astype(np.int8)
+        self.customer_cdf = _cdf(rng.lognormal(0, CUSTOMER_RATE_SIGMA, size=n_customers))
+
+    def _fit_products(self, sample, rng, n_products):
+        catalogue = sample.drop_duplicates('Product ID').reset_index(drop=True)
+        list_price = sample['Sales'] / (sample['Quantity'] * (1 - sample['Discount']))
+        unit_price = list_price.groupby(sample['Product ID']).median()
+
+        base = np.arange(n_products) % len(catalogue)
+        variant = np.arange(n_products) // len(catalogue)
+        ids = catalogue['Product ID'].to_numpy(dtype=object)[base]
+        numbers = pd.Series(VARIANT_PRODUCT_BASE + np.arange(n_products)).astype(str).to_numpy(dtype=object)
+        is_variant = variant > 0
+        # Variants keep their base product's prefix ('FUR-BO-') and name, with a number of their own
+        prefixes = catalogue['Product ID'].str[:7].to_numpy(dtype=object)
+        ids[is_variant] = prefixes[base[is_variant]] + numbers[is_variant]
+        names = catalogue['Product Name'].to_numpy(dtype=object)[base]
+        suffixes = pd.Series(variant[is_variant]).map(' #{}'.format).to_numpy(dtype=object)
+        names[is_variant] = names[is_variant] + suffixes
+        prices = unit_price.reindex(catalogue['Product ID']).to_numpy()[base]
+        prices[is_variant] *= rng.lognormal(0, 0.2, size=is_variant.sum())
+
+        sub_categories = catalogue['Sub-Category'].to_numpy(dtype=object)[base]
+        shares = sample['Sub-Category'].value_counts(normalize=True)
+        weights = np.empty(n_products)
+        for sub_category, share in shares.items():
+            members = np.flatnonzero(sub_categories == sub_category)
+            ranks = rng.permutation(len(members)) + 1
+            zipf = 1 / ranks ** PRODUCT_ZIPF_EXPONENT
+            weights[members] = share * zipf / zipf.sum()
+
+        self.products = pd.DataFrame({
+            'Product ID': ids,
+            'Category': catalogue['Category'].to_numpy(dtype=object)[base],
+            'Sub-Category': sub_categories,
+            'Product Name': names,
+        })
+        self.product_price = prices
+        self.product_cdf = _cdf(weights)
+
+    def _fit_donors(self, sample):
+        # Sample lines grouped by (region, sub-category) cell, each lending its discount and margin
+        cell = sample['Region'] + '|' + sample['Sub-Category']
+        order = np.argsort(cell.to_numpy(), kind='stable')
+        cells = cell.to_numpy()[order]
+        self.donor_cells, self.donor_starts, self.donor_counts = np.unique(cells, return_index=True,
+                                                                           return_counts=True)
+        self.donor_discount = sample['Discount'].to_numpy()[order]
+        self.donor_margin = (sample['Profit'] / sample['Sales']).to_numpy()[order]
+
+    def _order_lines(self, rng, n_lines):
+        """Lines per order for orders totalling exactly ``n_lines`` lines."""
+        sizes = []
+        total = 0
+        while total < n_lines:
+            batch = rng.geometric(1 / self.mean_lines, size=max(16, int((n_lines - total) / self.mean_lines * 1.1)))
+            sizes.append(batch)
+            total += batch.sum()
+        sizes = np.concatenate(sizes)
+        ends = np.cumsum(sizes)
+        n_orders = int(np.searchsorted(ends, n_lines)) + 1
+        sizes = sizes[:n_orders]
+        sizes[-1] -= ends[n_orders - 1] - n_lines
+        return sizes
+
+    def generate(self, rng, n_lines, first_row, first_order):
+        """``n_lines`` raw lines, numbered from ``first_row`` with orders numbered from ``first_order``."""
+        sizes = self._order_lines(rng, n_lines)
+        n_orders = len(sizes)
+
+        # Order attributes, repeated onto each order's lines
+        day = _draw(rng, self.day_cdf, n_orders)
+        mode = _draw(rng, self.ship_mode_cdf, n_orders)
+        ship_days = np.empty(n_orders, dtype=np.int64)
+        for i, days in enumerate(self.ship_days):
+            chosen = mode == i
+            ship_days[chosen] = rng.choice(days, size=chosen.sum())
+        ship_day = day + ship_days
+        customer = _draw(rng, self.customer_cdf, n_orders)
+        place = _draw(rng, self.place_cdf, n_orders)
+        prefix = rng.choice(self.order_prefixes.index.to_numpy(dtype=object), size=n_orders,
+                            p=self.order_prefixes.to_numpy())
+        years = pd.Series(self.days.year.to_numpy()[day]).astype(str).to_numpy(dtype=object)
+        numbers = pd.Series(100000 + first_order + np.arange(n_orders)).astype(str).to_numpy(dtype=object)
+        order_ids = prefix + '-' + years + '-' + numbers
+
+        first = self.first_names[self.customer_first[customer]]
+        last = self.last_names[self.customer_last[customer]]
+        customer_numbers = pd.Series(10000 + customer).astype(str).to_numpy(dtype=object)
+        initials = (pd.Series(first).str[0] + pd.Series(last).str[0]).to_numpy(dtype=object)
+        customer_ids = initials + '-' + customer_numbers
+        places = self.places.iloc[place]
+
+        line_order = np.repeat(np.arange(n_orders), sizes)
+        product = _draw(rng, self.product_cdf, n_lines)
+        products = self.products.iloc[product]
+        region = places['Region'].to_numpy(dtype=object)[line_order]
+        cell = np.searchsorted(self.donor_cells, region + '|' + products['Sub-Category'].to_numpy(dtype=object))
+        donor = self.donor_starts[cell] + (rng.random(n_lines) * self.donor_counts[cell]).astype(np.int64)
+        discount = self.donor_discount[donor]
+        quantity = rng.choice(self.quantities, size=n_lines)
+        sales = np.round(self.product_price[product] * quantity * (1 - discount), 4)
+        profit = np.round(sales * self.donor_margin[donor], 4)
+
+        frame = pd.DataFrame({
+            'Row ID': np.arange(first_row, first_row + n_lines),
+            'Order ID': order_ids[line_order],
+            'Order Date': self.day_labels[day][line_order],
+            'Ship Date': self.day_labels[ship_day][line_order],
+            'Ship Mode': self.ship_modes[mode][line_order],
+            'Customer ID': customer_ids[line_order],
+            'Customer Name': (first + ' ' + last)[line_order],
+            'Segment': self.segments[self.customer_segment[customer]][line_order],
+            'Country': 'United States',
+            'City': places['City'].to_numpy(dtype=object)[line_order],
+            'State': places['State'].to_numpy(dtype=object)[line_order],
+            'Postal Code': places['Postal Code'].to_numpy()[line_order],
+            'Region': region,
+            'Product ID': products['Product ID'].to_numpy(dtype=object),
+            'Category': products['Category'].to_numpy(dtype=object),
+            'Sub-Category': products['Sub-Category'].to_numpy(dtype=object),
+            'Product Name': products['Product Name'].to_numpy(dtype=object),
+            'Sales': sales,
+            'Quantity': quantity,
+            'Discount': discount,
+            'Profit': profit,
+        })
+        return frame[list(RAW_DTYPES)], n_orders
+
+    def chunks(self, chunk_rows=1_000_000):
+        """The ``n_rows`` raw lines as frames of at most ``chunk_rows`` lines."""
+        rng = np.random.default_rng([self.seed, self.n_rows])
+        rows = orders = 0
+        while rows < self.n_rows:
+            frame, n_orders = self.generate(rng, min(chunk_rows, self.n_rows - rows), rows + 1, orders)
+            rows += len(frame)
+            orders += n_orders
+            yield frame
+
+
+def write_synthetic_superstore(path, n_rows, seed=0, chunk_rows=1_000_000, sample_path=DEFAULT_DATA_PATH):
+    """Write ``n_rows`` synthetic lines with the Superstore schema to the CSV ``path``.
+
+    The same ``n_rows`` and ``seed`` always give the same file.
+    """
+    model = SuperstoreModel(n_rows, sample_path, seed)
+    with open(path, 'w', encoding='latin1', newline='') as f:
+        for i, frame in enumerate(model.chunks(chunk_rows)):
+            frame.to_csv(f, index=False, header=i == 0, lineterminator='\n')
+    return path
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# Single-scan base cube for the time-based analysis
+#
+# The raw order lines are grouped once into a fine-grained cube keyed on
+# (year, month, day of week, category, sub-category). Every rollup the
+# time-based analysis needs (monthly, seasonal, yearly, day-of-week,
+# category-by-month, quarterly and the seasonal recommendation filters) is
+# then a sum over cube cells, so the raw rows are touched only once.
+#
+# Distinct order counts are not additive in general, so the cube carries
+# one "first line of this order" indicator per product level instead:
+# orders_all counts an order once, orders_category once per category it
+# touches and orders_sub_category once per sub-category. Because an order has
+# a single order date, summing an indicator across any date cells is exact;
+# a rollup just has to use the indicator for the finest product level among
+# its keys.
+#
+# The indicators need every order seen so far, so with SUPERSTORE_HLL_PRECISION
+# set (see common.sketches) the cube is approximate instead: each cell keeps a
+# HyperLogLog sketch of its hashed order ids, held in the cube frame's
+# ``attrs['order_sketches']``, and a rollup's order count is the estimate of
+# its cells' merged sketches.
+
+import numpy as np
+import pandas as pd
+
+from common.data_loader import Vocabulary, plain_labels
+from common.partial_agg import DistinctRows, PartialAggregate
+from common.sketches import HyperLogLogSketches, hll_error, hll_hash, hll_registers
+
+BASE_KEYS = ['order_year', 'order_month', 'order_day_of_week', 'category', 'sub-category']
+SUM_MEASURES = ['sales', 'profit', 'quantity']
+# Columns of the dataset the cube is built from
+SOURCE_COLUMNS = BASE_KEYS + ['order_code'] + SUM_MEASURES
+# Columns an approximate cube is built from: the string order ids are hashed instead
+APPROXIMATE_SOURCE_COLUMNS = BASE_KEYS + ['order_id'] + SUM_MEASURES
+
+# Indicator column to sum for order counts, by finest product key in a rollup
+ORDER_COUNT_COLUMNS = [
+    ('sub-category', 'orders_sub_category'),
+    ('category', 'orders_category'),
+    (None, 'orders_all'),
+]
+
+
+def source_columns(precision=None):
+    """Columns the cube is built from, exact or (with a HyperLogLog ``precision``) approximate."""
+    return APPROXIMATE_SOURCE_COLUMNS if precision else SOURCE_COLUMNS
+
+
+def _base_lines(df, **indicators):
+    lines = pd.DataFrame({
+        'order_year': df['order_year'].to_numpy(),
+        'order_month': df['order_month'].to_numpy(),
+        'order_day_of_week': df['order_day_of_week'].to_numpy(),
+        'category': df['category'].array,
+        'sub-category': df['sub-category'].array,
+        'sales': df['sales'].to_numpy(),
+        'profit': df['profit'].to_numpy(),
+        'quantity': df['quantity'].to_numpy(),
+    }, index=pd.RangeIndex(len(df)))
+    for col, values in indicators.items():
+        lines[col] = values
+    return lines
+
+
+def _with_quarter(cube):
+    cube['order_quarter'] = (cube['order_month'] - 1) // 3 + 1
+    return cube
+
+
+def build_time_cube(df, precision=None):
+    """Group the order lines once into the base cube.
+
+    ``df`` may also be a stream of chunks, in which case the first-line
+    indicators are tracked across chunks and the cell sums merged. With a
+    HyperLogLog ``precision`` the cube is approximate (see above).
+    """
+    if precision:
+        print(f"Order counts are HyperLogLog estimates (precision {precision}, "
+              f"standard error {hll_error(precision):.1%})")
+        if not isinstance(df, pd.DataFrame):
+            return _build_approximate_chunked(df, precision)
+        grouped = _base_lines(df).groupby(BASE_KEYS, observed=True, sort=True)
+        cube = grouped.sum().reset_index()
+        cube.attrs['order_sketches'] = HyperLogLogSketches.from_hashes(
+            grouped.ngroup().to_numpy(), hll_hash(df['order_id']), len(cube), precision)
+        return _with_quarter(cube)
+    if not isinstance(df, pd.DataFrame):
+        return _build_time_cube_chunked(df)
+
+    order_codes = pd.Series(df['order_code'].to_numpy())
+    lines = _base_lines(
+        df,
+        orders_all=~order_codes.duplicated(),
+        orders_category=~pd.DataFrame({'o': order_codes, 'c': df['category'].array}).duplicated(),
+        orders_sub_category=~pd.DataFrame({'o': order_codes, 's': df['sub-category'].array}).duplicated(),
+    )
+    return _with_quarter(lines.groupby(BASE_KEYS, observed=True, sort=True).sum().reset_index())
+
+
+def _build_time_cube_chunked(chunks):
+    # Order codes are assigned in order of first appearance, so an order is
+    # new exactly when its code is at least the number of orders seen so far
+    n_orders = 0
+    # (order code, product key) pairs already seen, one vocabulary per level
+    seen = {'category': Vocabulary(), 'sub-category': Vocabulary()}
+    measures = SUM_MEASURES + ['orders_all', 'orders_category', 'orders_sub_category']
+    cube = PartialAggregate(BASE_KEYS, {measure: 'sum' for measure in measures})
+    for chunk in chunks[SOURCE_COLUMNS]:
+        order_codes = chunk['order_code'].to_numpy()
+        first_line = {level: vocabulary.first_seen(pd.DataFrame({'o': order_codes, 'k': chunk[level].to_numpy()}))
+                      for level, vocabulary in seen.items()}
+        cube.update(_base_lines(
+            chunk,
+            orders_all=(order_codes >= n_orders) & ~pd.Series(order_codes).duplicated().to_numpy(),
+            orders_category=first_line['category'],
+            orders_sub_category=first_line['sub-category'],
+        ))
+        n_orders = max(n_orders, order_codes.max(initial=-1) + 1)
+    return _with_quarter(cube.result())
+
+
+def _build_approximate_chunked(chunks, precision):
+    cube = PartialAggregate(BASE_KEYS, {measure: 'sum' for measure in SUM_MEASURES})
+    # Distinct (cell, register, rank) sketch entries, cells numbered in order of first appearance
+    entries = DistinctRows()
+    cell_keys = {}
+    for chunk in chunks[APPROXIMATE_SOURCE_COLUMNS]:
+        lines = _base_lines(chunk)
+        cube.update(lines)
+        local_cells = lines.groupby(BASE_KEYS, sort=False).ngroup().to_numpy()
+        local_keys = lines[BASE_KEYS].drop_duplicates().itertuples(index=False, name=None)
+        global_cells = np.fromiter((cell_keys.setdefault(key, len(cell_keys)) for key in local_keys),
+                                   dtype=np.int64)
+        registers, ranks = hll_registers(hll_hash(chunk['order_id']), precision)
+        entries.add(pd.DataFrame({'cell': global_cells[local_cells], 'register': registers, 'rank': ranks}))
+
+    cube = cube.result()
+    position = pd.MultiIndex.from_frame(cube[BASE_KEYS]).get_indexer(
+        pd.MultiIndex.from_tuples(list(cell_keys), names=BASE_KEYS))
+    seen = entries.frame()
+    cube.attrs['order_sketches'] = HyperLogLogSketches.from_registers(
+        position[seen['cell'].to_numpy()], seen['register'].to_numpy(), seen['rank'].to_numpy(), len(cube),
+        precision)
+    return _with_quarter(cube)
+
+
+def rollup(cube, keys, measures=('sales', 'order_id', 'profit'), where=None):
+    """Aggregate the cube to ``keys``.
+
+    ``measures`` may include ``sales``, ``profit``, ``quantity`` and
+    ``order_id`` (the distinct order count, named as in the scripts' nunique
+    aggregations; an estimate in an approximate cube). ``where`` optionally
+    maps cube columns to the values to keep before aggregating, e.g.
+    ``{'order_month': [1, 2, 3]}``.
+    """
+    if where:
+        mask = pd.Series(True, index=cube.index)
+        for col, values in where.items():
+            mask &= cube[col].isin(values)
+        cube = cube[mask]
+
+    grouped = cube.groupby(list(keys), observed=True, sort=True)
+    sketches = cube.attrs.get('order_sketches')
+    if sketches is not None:
+        result = grouped[SUM_MEASURES].sum()
+        # The filtered cube keeps the positions of its cells in the index
+        result['order_id'] = sketches.union_counts(cube.index.to_numpy(), grouped.ngroup().to_numpy(), len(result))
+        return plain_labels(result[list(measures)].reset_index())
+
+    order_col = next(col for key, col in ORDER_COUNT_COLUMNS if key is None or key in keys)
+    columns = {measure: order_col if measure == 'order_id' else measure for measure in measures}
+    result = grouped[list(set(columns.values()))].sum()
+    result = pd.DataFrame({measure: result[col] for measure, col in columns.items()})
+    return plain_labels(result.reset_index())
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# Incremental update of the customer RFM segments
+#
+# Folds a batch of new orders into the persisted per-customer RFM state and
+# rewrites customer_rfm_segments.csv without rescanning order history. The
+# output matches a full run of customer_segmentation.py over all orders.
+#
+# Usage:
+#   python update_rfm_segments.py --init          # build the state from the full dataset
+#   python update_rfm_segments.py new_orders.csv  # fold in a batch (raw Superstore format)
+#
+# With --approximate, quintile cut points come from mergeable quantile
+# sketches built per partition of customers instead of an exact pd.qcut over
+# the whole table, and the CSV is scored and written partition by partition.
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.data_loader import clean_superstore, load_superstore, read_raw
+from common.rfm import (STATE_SOURCE_COLUMNS, RFMSketch, build_rfm_state, load_rfm_state, rfm_from_state,
+                        save_rfm_state, score_rfm, update_rfm_state)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fold a batch of orders into the RFM state')
+    parser.add_argument('batch', nargs='?', help='CSV of new order lines in the raw Superstore format')
+    parser.add_argument('--init', action='store_true', help='Build the state from the full dataset')
+    parser.add_argument('--state', default='rfm_state.parquet', help='Path of the persisted RFM state')
+    parser.add_argument('--output', default='customer_rfm_segments.csv', help='Segments CSV to write')
+    parser.add_argument('--approximate', action='store_true', help='Score against sketched quintile cut points')
+    parser.add_argument('--partition-size', type=int, default=100_000, help='Customers per partition with --approximate')
+    args = parser.parse_args()
+
+    if args.init:
+        print("Building RFM state from the full dataset...")
+        state = build_rfm_state(load_superstore(columns=STATE_SOURCE_COLUMNS))
+    elif args.batch:
+        print(f"Folding '{args.batch}' into '{args.state}'...")
+        batch = clean_superstore(read_raw(args.batch))
+        state = update_rfm_state(load_rfm_state(args.state), batch)
+        print(f"Batch: {len(batch)} order lines, {batch['customer_id'].nunique()} customers")
+    else:
+        parser.error('pass a batch CSV or --init')
+
+    save_rfm_state(state, args.state)
+    print(f"Saved RFM state for {len(state)} customers as '{args.state}'")
+
+    rfm = rfm_from_state(state)
+    if args.approximate:
+        partitions = [rfm.iloc[i:i + args.partition_size] for i in range(0, len(rfm), args.partition_size)]
+        sketch = RFMSketch()
+        for partition in partitions:
+            sketch.merge(RFMSketch().update(partition))
+        cut_points = sketch.cut_points()
+        for i, partition in enumerate(partitions):
+            scored = score_rfm(partition.copy(), cut_points)
+            scored.to_csv(args.output, index=False, mode='a' if i else 'w', header=not i)
+    else:
+        score_rfm(rfm).to_csv(args.output, index=False)
+    print(f"Saved RFM segments as '{args.output}'")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# Cleaning stage: writes superstore_clean.csv from the raw dataset
+#
+# Python port of the cleaning in data_exploration.R. The raw CSV goes
+# through the shared loader (explicit dtypes, fixed-format date parsing) and
+# is written with the R script's schema: janitor-style snake_case names
+# (sub_category, ...), ISO dates and the derived order_year, order_month,
+# order_day, shipping_days and profit_margin columns, formatted as readr's
+# write_csv formats them. The column store read by the legacy product
+# scripts is written in the same pass.
+#
+# Usage:
+#   python clean_superstore.py              # write superstore_clean.csv (+ .columns store)
+#   python clean_superstore.py --profile    # also print the exploration summaries
+#
+# The R script's skim/DataExplorer profiling is replaced by --profile, which
+# prints the same summaries (dimensions, types, missing values, statistics,
+# duplicates, IQR outliers, category counts) and is off by default.
+# SUPERSTORE_CHUNK_ROWS streams the dataset, as for the analyses.
+
+import argparse
+import os
+import re
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.column_store import ColumnStoreWriter, DEFAULT_CLEAN_CSV, store_path
+from common.data_loader import calendar_attributes, date_codes, file_identity, open_superstore, take_codes
+from common.instrumentation import StageTrace
+from common.partial_agg import DistinctRows, aggregate, describe
+
+# Columns of the dataset this stage reads (all of them)
+COLUMNS = None
+CLEAN_COLUMNS = [
+    'row_id', 'order_id', 'order_date', 'ship_date', 'ship_mode', 'customer_id', 'customer_name', 'segment',
+    'country', 'city', 'state', 'postal_code', 'region', 'product_id', 'category', 'sub_category',
+    'product_name', 'sales', 'quantity', 'discount', 'profit', 'order_year', 'order_month', 'order_day',
+    'shipping_days', 'profit_margin',
+]
+OUTLIER_COLUMNS = ['sales', 'quantity', 'discount', 'profit', 'profit_margin', 'shipping_days']
+DISTRIBUTION_COLUMNS = [
+    ('Category', 'category'), ('Sub-Category', 'sub_category'), ('Segment', 'segment'),
+    ('Region', 'region'), ('Ship Mode', 'ship_mode'),
+]
+
+
+def clean_names(columns):
+    """snake_case column names, as janitor::clean_names makes them ('Sub-Category' -> 'sub_category')."""
+    return [re.sub(r'[^0-9a-z]+', '_', str(col).lower()).strip('_') for col in columns]
+
+
+def to_clean_schema(df):
+    """The R script's cleaned table, from a frame (or chunk) cleaned by the shared loader."""
+    df = df.copy(deep=False)
+    df.columns = clean_names(df.columns)
+    df['order_day'] = calendar_attributes(*date_codes(df['order_date']), ['day'])['day']
+    # readr trims surrounding whitespace from fields ('... Nano Receiver ')
+    for col in df.columns[df.dtypes == object]:
+        df[col] = df[col].str.strip()
+    return df[CLEAN_COLUMNS]
+
+
+def format_for_csv(clean):
+    """Format ``clean`` like readr::write_csv: ISO dates, shortest floats without '.0', NA for missing."""
+    formatted = {}
+    for col in clean.columns:
+        values = clean[col]
+        if pd.api.types.is_datetime64_any_dtype(values.dtype):
+            # Each distinct date is formatted once
+            codes, days = date_codes(values)
+            text = pd.Series(take_codes(days.strftime('%Y-%m-%d').astype(object), codes), index=values.index)
+        elif pd.api.types.is_float_dtype(values.dtype):
+            # repr is the shortest round-tripping form, as in readr
+            text = values.astype(str).str.replace(r'\.0$', '', regex=True).replace({'inf': 'Inf', '-inf': '-Inf'})
+        else:
+            text = values.astype(object)
+        formatted[col] = text.where(values.notna(), None)
+    return pd.DataFrame(formatted)
+
+
+def write_clean_dataset(data, csv_path=DEFAULT_CLEAN_CSV):
+    """Write the cleaned CSV and its column store from a frame or a stream of chunks."""
+    tmp_path = f"{csv_path}.{os.getpid()}.tmp"
+    store = ColumnStoreWriter(store_path(csv_path))
+    rows = 0
+    with open(tmp_path, 'w', encoding='latin1', newline='') as f:
+        for chunk in [data] if isinstance(data, pd.DataFrame) else data:
+            clean = to_clean_schema(chunk)
+            format_for_csv(clean).to_csv(f, index=False, header=rows == 0, na_rep='NA', lineterminator='\n')
+            store.append(clean.reset_index(drop=True))
+            rows += len(clean)
+    os.replace(tmp_path, csv_path)
+    _, mtime_ns, size = file_identity(csv_path)
+    store.close(source={'path': os.path.basename(csv_path), 'mtime_ns': mtime_ns, 'size': size})
+    return rows
+
+
+def duplicate_rows(data):
+    """Number of rows repeating an earlier row; streams are compared by 64-bit row hashes."""
+    if isinstance(data, pd.DataFrame):
+        return int(data.duplicated().sum())
+    seen, rows = DistinctRows(), 0
+    for chunk in data:
+        seen.add(pd.DataFrame({'row': pd.util.hash_pandas_object(chunk, index=False).to_numpy()}))
+        rows += len(chunk)
+    return rows - len(seen.frame())
+
+
+def print_profile(data):
+    """Print the exploration summaries data_exploration.R printed before and after cleaning."""
+    columns = list(data.columns)
+    counts = aggregate(data, None, {col: 'count' for col in columns}).iloc[0]
+    rows = len(data)
+
+    print("\n===== DATASET DIMENSIONS =====")
+    print(f"Number of rows: {rows}")
+    print(f"Number of columns: {len(columns)}")
+
+    print("\n===== DATA TYPES =====")
+    print(data.head(0).dtypes.to_string())
+
+    print("\n===== MISSING VALUES =====")
+    missing = rows - counts
+    print(missing[missing > 0].to_string() if (missing > 0).any() else "None")
+    print(f"Total missing values: {int(missing.sum())}")
+
+    print("\n===== SUMMARY STATISTICS =====")
+    numeric = [col for col, dtype in data.head(0).dtypes.items() if pd.api.types.is_numeric_dtype(dtype)]
+    print(pd.DataFrame({col: describe(data, col) for col in numeric}).T.to_string())
+
+    print("\n===== DUPLICATE ROWS =====")
+    print(f"Number of duplicate rows: {duplicate_rows(data)}")
+
+    print("\n===== OUTLIERS CHECK =====")
+    for col in OUTLIER_COLUMNS:
+        stats = describe(data, col)
+        iqr = stats['75%'] - stats['25%']
+        lower_bound, upper_bound = stats['25%'] - 1.5 * iqr, stats['75%'] + 1.5 * iqr
+        outliers = aggregate(data, None, {col: ['count', 'min', 'max']},
+                             where=lambda lines: (lines[col] < lower_bound) | (lines[col] > upper_bound))
+        print(f"\nOutliers in {col} :")
+        print(f"Number of outliers: {int(outliers[(col, 'count')].sum())}")
+        if len(outliers):
+            print(f"Min: {outliers[(col, 'min')].iloc[0]} Max: {outliers[(col, 'max')].iloc[0]}")
+
+    print("\n===== CATEGORICAL VARIABLES DISTRIBUTION =====")
+    for label, col in DISTRIBUTION_COLUMNS:
+        print(f"\n{label} distribution:")
+        print(aggregate(data, col, {'row_id': 'count'}).set_index(col)['row_id'].rename(None).to_string())
+
+
+class CleanChunks:
+    """A chunk stream mapped to the cleaned schema, for profiling with the partial_agg helpers."""
+
+    def __init__(self, chunks, columns=None):
+        self.chunks = chunks
+        self.columns = pd.Index(CLEAN_COLUMNS if columns is None else columns)
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            yield to_clean_schema(chunk)[list(self.columns)]
+
+    def __getitem__(self, columns):
+        return CleanChunks(self.chunks, list(columns))
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def head(self, n=5):
+        return to_clean_schema(self.chunks.head(n))[list(self.columns)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write superstore_clean.csv from the raw dataset')
+    parser.add_argument('--output', default=DEFAULT_CLEAN_CSV, help='Cleaned CSV to write')
+    parser.add_argument('--profile', action='store_true', help='Print the exploration summaries')
+    args = parser.parse_args()
+
+    trace = StageTrace('clean_superstore')
+
+    print("Loading the dataset...")
+    with trace.stage('load') as stage:
+        stage.rows_out = data = open_superstore(columns=COLUMNS)
+
+    if args.profile:
+        with trace.stage('profile', rows_in=data):
+            print_profile(to_clean_schema(data) if isinstance(data, pd.DataFrame) else CleanChunks(data))
+
+    with trace.stage('write cleaned dataset', rows_in=data) as stage:
+        stage.rows_out = rows = write_clean_dataset(data, args.output)
+    print("\n===== CLEANED DATASET SAVED =====")
+    print(f"Cleaned dataset ({rows} rows) saved as '{args.output}', with its column store")
+    trace.report()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,336 +1,350 @@
 #!/usr/bin/env python3
 # Order and Inventory Insights Analysis
+#
+# The aggregations are plain functions returning DataFrames and the charts
+# are plot_* functions, so both can be imported and reused; main() runs the
+# full analysis and writes the outputs.
+
+import os
+import sys
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import matplotlib.ticker as mtick
 
-# Set style for better visualizations
-plt.style.use('ggplot')
-sns.set(font_scale=1.1)
-plt.rcParams['figure.figsize'] = [12, 8]
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.charts import ChartBatch, mtick, plt, sns
+from common.cooccurrence import LEVEL_COLUMNS
+from common.data_loader import open_superstore
+from common.instrumentation import StageTrace
+from common.market_basket import recommend_bundles
+from common.order_table import load_order_table, top_basket_pairs
+from common.output_cache import OutputCache
+from common.partial_agg import aggregate, describe, sample_rows
+from common.sales_cube import load_sales_cube
 
-print("Loading the dataset...")
-# Load the dataset with the correct encoding
-df = pd.read_csv('../../Superstore Dataset.csv', encoding='latin1')
 
-# Clean the dataset
-print("\nCleaning and preparing the dataset...")
-# Convert date columns to datetime
-df['Order Date'] = pd.to_datetime(df['Order Date'], errors='coerce')
-df['Ship Date'] = pd.to_datetime(df['Ship Date'], errors='coerce')
+def bundling_level():
+    """Level products are paired at: sub-category by default, or SUPERSTORE_BUNDLING_LEVEL=product."""
+    return os.environ.get('SUPERSTORE_BUNDLING_LEVEL', 'sub-category')
 
-# Clean column names
-df.columns = [col.lower().replace(' ', '_') for col in df.columns]
 
-# Add useful derived columns
-df['order_year'] = df['order_date'].dt.year
-df['order_month'] = df['order_date'].dt.month
-df['order_quarter'] = df['order_date'].dt.quarter
-df['shipping_days'] = (df['ship_date'] - df['order_date']).dt.days
+# Columns of the dataset this analysis and its order table read; the sales cube loads its own
+COLUMNS = ['order_id', 'order_code', 'order_date', 'segment', 'region', 'category', 'sales', 'quantity', 'profit',
+           LEVEL_COLUMNS[bundling_level()]]
 
-print("Dataset cleaned and prepared successfully")
 
 # 1. Order Quantity Analysis
-print("\n===== ORDER QUANTITY ANALYSIS =====")
-# Basic statistics on quantity
-quantity_stats = df['quantity'].describe()
-print("Quantity Statistics:")
-print(quantity_stats)
-
 # Distribution of order quantities
-plt.figure(figsize=(12, 6))
-sns.histplot(df['quantity'], bins=20, kde=True)
-plt.title('Distribution of Order Quantities')
-plt.xlabel('Quantity')
-plt.ylabel('Frequency')
-plt.grid(True, alpha=0.3)
-plt.savefig('quantity_distribution.png')
-print("Saved quantity distribution chart as 'quantity_distribution.png'")
-
-# Quantity by category
-category_quantity = df.groupby('category').agg({
-    'quantity': ['sum', 'mean', 'median', 'std'],
-    'order_id': 'nunique'
-}).reset_index()
-
-category_quantity.columns = ['category', 'total_quantity', 'avg_quantity', 'median_quantity', 'std_quantity', 'order_count']
-category_quantity['avg_quantity_per_order'] = category_quantity['total_quantity'] / category_quantity['order_count']
-category_quantity = category_quantity.sort_values('total_quantity', ascending=False)
-
-print("\nQuantity by Category:")
-print(category_quantity)
+def plot_quantity_distribution(quantity):
+    plt.figure(figsize=(12, 6))
+    sns.histplot(quantity, bins=20, kde=True)
+    plt.title('Distribution of Order Quantities')
+    plt.xlabel('Quantity')
+    plt.ylabel('Frequency')
+    plt.grid(True, alpha=0.3)
+
+
+def quantity_by_category(df):
+    """Total, mean, median and spread of line quantities and order count per category."""
+    category_quantity = aggregate(df, 'category', {
+        'quantity': ['sum', 'mean', 'median', 'std'],
+        'order_code': 'nunique'
+    })
+
+    category_quantity.columns = ['category', 'total_quantity', 'avg_quantity', 'median_quantity', 'std_quantity', 'order_count']
+    category_quantity['avg_quantity_per_order'] = category_quantity['total_quantity'] / category_quantity['order_count']
+    return category_quantity.sort_values('total_quantity', ascending=False)
+
 
 # Plot quantity by category
-plt.figure(figsize=(14, 8))
-
-# Plot 1: Total Quantity by Category
-plt.subplot(2, 2, 1)
-sns.barplot(x='category', y='total_quantity', data=category_quantity)
-plt.title('Total Quantity by Category')
-plt.xlabel('Category')
-plt.ylabel('Total Quantity')
-plt.xticks(rotation=0)
-
-# Plot 2: Average Quantity per Order by Category
-plt.subplot(2, 2, 2)
-sns.barplot(x='category', y='avg_quantity_per_order', data=category_quantity)
-plt.title('Average Quantity per Order by Category')
-plt.xlabel('Category')
-plt.ylabel('Avg Quantity per Order')
-plt.xticks(rotation=0)
-
-plt.tight_layout()
-plt.savefig('category_quantity_analysis.png')
-print("Saved category quantity analysis chart as 'category_quantity_analysis.png'")
+def plot_category_quantity(category_quantity):
+    plt.figure(figsize=(14, 8))
+
+    # Plot 1: Total Quantity by Category
+    plt.subplot(2, 2, 1)
+    sns.barplot(x='category', y='total_quantity', data=category_quantity)
+    plt.title('Total Quantity by Category')
+    plt.xlabel('Category')
+    plt.ylabel('Total Quantity')
+    plt.xticks(rotation=0)
+
+    # Plot 2: Average Quantity per Order by Category
+    plt.subplot(2, 2, 2)
+    sns.barplot(x='category', y='avg_quantity_per_order', data=category_quantity)
+    plt.title('Average Quantity per Order by Category')
+    plt.xlabel('Category')
+    plt.ylabel('Avg Quantity per Order')
+    plt.xticks(rotation=0)
+
+    plt.tight_layout()
+
 
 # 2. Frequently Ordered Products
-print("\n===== FREQUENTLY ORDERED PRODUCTS =====")
-# Aggregate by sub-category
-subcategory_frequency = df.groupby('sub-category').agg({
-    'order_id': 'nunique',
-    'quantity': 'sum',
-    'sales': 'sum'
-}).reset_index()
+def subcategory_order_frequency(cube):
+    """Orders, quantity and sales per sub-category, most frequently ordered first."""
+    subcategory_frequency = cube.query('sub-category', ['order_id', 'quantity', 'sales'])
 
-subcategory_frequency['avg_quantity_per_order'] = subcategory_frequency['quantity'] / subcategory_frequency['order_id']
-subcategory_frequency = subcategory_frequency.sort_values('order_id', ascending=False)
+    subcategory_frequency['avg_quantity_per_order'] = subcategory_frequency['quantity'] / subcategory_frequency['order_id']
+    return subcategory_frequency.sort_values('order_id', ascending=False)
 
-print("Top 10 Most Frequently Ordered Sub-Categories:")
-print(subcategory_frequency.head(10))
 
 # Plot frequently ordered sub-categories
-plt.figure(figsize=(14, 8))
-top_subcats = subcategory_frequency.head(10)
-sns.barplot(x='order_id', y='sub-category', data=top_subcats)
-plt.title('Top 10 Most Frequently Ordered Sub-Categories')
-plt.xlabel('Number of Orders')
-plt.ylabel('Sub-Category')
-plt.tight_layout()
-plt.savefig('frequently_ordered_subcategories.png')
-print("Saved frequently ordered subcategories chart as 'frequently_ordered_subcategories.png'")
+def plot_frequent_subcategories(top_subcats):
+    plt.figure(figsize=(14, 8))
+    sns.barplot(x='order_id', y='sub-category', data=top_subcats)
+    plt.title('Top 10 Most Frequently Ordered Sub-Categories')
+    plt.xlabel('Number of Orders')
+    plt.ylabel('Sub-Category')
+    plt.tight_layout()
+
 
 # 3. Order Size Analysis
-print("\n===== ORDER SIZE ANALYSIS =====")
-# Create order size categories
-df['order_size'] = pd.cut(
-    df.groupby('order_id')['quantity'].transform('sum'),
-    bins=[0, 3, 6, 10, 20, 100],
-    labels=['Very Small (1-3)', 'Small (4-6)', 'Medium (7-10)', 'Large (11-20)', 'Very Large (21+)']
-)
-
-# Analyze order size distribution
-order_size_dist = df.groupby('order_size').agg({
-    'order_id': 'nunique',
-    'sales': 'sum',
-    'profit': 'sum'
-}).reset_index()
-
-order_size_dist['profit_margin'] = order_size_dist['profit'] / order_size_dist['sales']
-order_size_dist['avg_order_value'] = order_size_dist['sales'] / order_size_dist['order_id']
-
-print("Order Size Distribution:")
-print(order_size_dist)
+def order_totals(order_table):
+    """One row per order: its quantity, sales, profit, segment and order size category."""
+    orders = order_table.orders[['order_id', 'quantity', 'sales', 'profit', 'segment']].copy()
+    orders['order_size'] = pd.cut(
+        orders['quantity'],
+        bins=[0, 3, 6, 10, 20, 100],
+        labels=['Very Small (1-3)', 'Small (4-6)', 'Medium (7-10)', 'Large (11-20)', 'Very Large (21+)']
+    )
+    return orders
+
+
+def order_size_distribution(orders):
+    """Orders, sales, profit and average order value per order size."""
+    order_size_dist = orders.groupby('order_size', observed=False).agg({
+        'order_id': 'count',
+        'sales': 'sum',
+        'profit': 'sum'
+    }).reset_index()
+
+    order_size_dist['profit_margin'] = order_size_dist['profit'] / order_size_dist['sales']
+    order_size_dist['avg_order_value'] = order_size_dist['sales'] / order_size_dist['order_id']
+    return order_size_dist
+
 
 # Plot order size analysis
-plt.figure(figsize=(14, 10))
-
-# Plot 1: Number of Orders by Order Size
-plt.subplot(2, 2, 1)
-sns.barplot(x='order_size', y='order_id', data=order_size_dist)
-plt.title('Number of Orders by Order Size')
-plt.xlabel('Order Size')
-plt.ylabel('Number of Orders')
-plt.xticks(rotation=45)
-
-# Plot 2: Total Sales by Order Size
-plt.subplot(2, 2, 2)
-sns.barplot(x='order_size', y='sales', data=order_size_dist)
-plt.title('Total Sales by Order Size')
-plt.xlabel('Order Size')
-plt.ylabel('Sales ($)')
-plt.xticks(rotation=45)
-
-# Format y-axis to show dollar amounts
-plt.gca().yaxis.set_major_formatter(plt.FuncFormatter(lambda x, _: f'${x:,.0f}'))
-
-# Plot 3: Average Order Value by Order Size
-plt.subplot(2, 2, 3)
-sns.barplot(x='order_size', y='avg_order_value', data=order_size_dist)
-plt.title('Average Order Value by Order Size')
-plt.xlabel('Order Size')
-plt.ylabel('Avg Order Value ($)')
-plt.xticks(rotation=45)
-
-# Format y-axis to show dollar amounts
-plt.gca().yaxis.set_major_formatter(plt.FuncFormatter(lambda x, _: f'${x:,.0f}'))
-
-# Plot 4: Profit Margin by Order Size
-plt.subplot(2, 2, 4)
-sns.barplot(x='order_size', y='profit_margin', data=order_size_dist)
-plt.title('Profit Margin by Order Size')
-plt.xlabel('Order Size')
-plt.ylabel('Profit Margin')
-plt.xticks(rotation=45)
-plt.gca().yaxis.set_major_formatter(mtick.PercentFormatter(1.0))
-
-plt.tight_layout()
-plt.savefig('order_size_analysis.png')
-print("Saved order size analysis chart as 'order_size_analysis.png'")
+def plot_order_sizes(order_size_dist):
+    plt.figure(figsize=(14, 10))
+
+    # Plot 1: Number of Orders by Order Size
+    plt.subplot(2, 2, 1)
+    sns.barplot(x='order_size', y='order_id', data=order_size_dist)
+    plt.title('Number of Orders by Order Size')
+    plt.xlabel('Order Size')
+    plt.ylabel('Number of Orders')
+    plt.xticks(rotation=45)
+
+    # Plot 2: Total Sales by Order Size
+    plt.subplot(2, 2, 2)
+    sns.barplot(x='order_size', y='sales', data=order_size_dist)
+    plt.title('Total Sales by Order Size')
+    plt.xlabel('Order Size')
+    plt.ylabel('Sales ($)')
+    plt.xticks(rotation=45)
+
+    # Format y-axis to show dollar amounts
+    plt.gca().yaxis.set_major_formatter(plt.FuncFormatter(lambda x, _: f'${x:,.0f}'))
+
+    # Plot 3: Average Order Value by Order Size
+    plt.subplot(2, 2, 3)
+    sns.barplot(x='order_size', y='avg_order_value', data=order_size_dist)
+    plt.title('Average Order Value by Order Size')
+    plt.xlabel('Order Size')
+    plt.ylabel('Avg Order Value ($)')
+    plt.xticks(rotation=45)
+
+    # Format y-axis to show dollar amounts
+    plt.gca().yaxis.set_major_formatter(plt.FuncFormatter(lambda x, _: f'${x:,.0f}'))
+
+    # Plot 4: Profit Margin by Order Size
+    plt.subplot(2, 2, 4)
+    sns.barplot(x='order_size', y='profit_margin', data=order_size_dist)
+    plt.title('Profit Margin by Order Size')
+    plt.xlabel('Order Size')
+    plt.ylabel('Profit Margin')
+    plt.xticks(rotation=45)
+    plt.gca().yaxis.set_major_formatter(mtick.PercentFormatter(1.0))
+
+    plt.tight_layout()
+
 
 # 4. Order Size by Customer Segment
-print("\n===== ORDER SIZE BY CUSTOMER SEGMENT =====")
-# Analyze order size by customer segment
-segment_order_size = df.groupby(['segment', 'order_size']).agg({
-    'order_id': 'nunique',
-    'quantity': 'sum',
-    'sales': 'sum'
-}).reset_index()
-
-segment_order_size['avg_quantity_per_order'] = segment_order_size['quantity'] / segment_order_size['order_id']
-segment_order_size['avg_order_value'] = segment_order_size['sales'] / segment_order_size['order_id']
-
-print("Order Size by Customer Segment:")
-print(segment_order_size.head(10))
-
-# Create a pivot table for better visualization
-segment_size_pivot = segment_order_size.pivot_table(
-    index='segment',
-    columns='order_size',
-    values='order_id',
-    aggfunc='sum'
-)
+def segment_order_sizes(orders):
+    """Orders, quantity and sales per customer segment and order size."""
+    # Every order size is listed for every segment, including sizes a segment never ordered
+    segment_order_size = orders.groupby(['segment', 'order_size'], observed=False).agg({
+        'order_id': 'count',
+        'quantity': 'sum',
+        'sales': 'sum'
+    }).reset_index()
+
+    segment_order_size['avg_quantity_per_order'] = segment_order_size['quantity'] / segment_order_size['order_id']
+    segment_order_size['avg_order_value'] = segment_order_size['sales'] / segment_order_size['order_id']
+    return segment_order_size
+
+
+def segment_order_size_pivot(segment_order_size):
+    """Order counts with one row per segment and one column per order size."""
+    return segment_order_size.pivot_table(
+        index='segment',
+        columns='order_size',
+        values='order_id',
+        aggfunc='sum',
+        observed=False
+    )
+
 
 # Plot order size by segment
-plt.figure(figsize=(14, 8))
-segment_size_pivot.plot(kind='bar', stacked=True)
-plt.title('Order Size Distribution by Customer Segment')
-plt.xlabel('Customer Segment')
-plt.ylabel('Number of Orders')
-plt.legend(title='Order Size')
-plt.grid(True, alpha=0.3)
-plt.tight_layout()
-plt.savefig('segment_order_size.png')
-print("Saved segment order size chart as 'segment_order_size.png'")
+def plot_segment_order_size(segment_size_pivot):
+    plt.figure(figsize=(14, 8))
+    segment_size_pivot.plot(kind='bar', stacked=True)
+    plt.title('Order Size Distribution by Customer Segment')
+    plt.xlabel('Customer Segment')
+    plt.ylabel('Number of Orders')
+    plt.legend(title='Order Size')
+    plt.grid(True, alpha=0.3)
+    plt.tight_layout()
+
 
 # 5. Product Bundling Analysis
-print("\n===== PRODUCT BUNDLING ANALYSIS =====")
-# Find products frequently ordered together
-# Create a unique identifier for each order
-order_products = df.groupby(['order_id', 'sub-category']).size().reset_index(name='count')
-
-# Create a pivot table to see which products appear together in orders
-order_pivot = order_products.pivot_table(
-    index='order_id',
-    columns='sub-category',
-    values='count',
-    aggfunc='sum',
-    fill_value=0
-)
-
-# Convert to binary (1 if product was in order, 0 if not)
-order_pivot = (order_pivot > 0).astype(int)
-
-# Calculate co-occurrence matrix
-co_occurrence = order_pivot.T.dot(order_pivot)
-np.fill_diagonal(co_occurrence.values, 0)  # Remove self-pairs
-
-# Get top 10 product pairs
-product_pairs = []
-for i in range(len(co_occurrence.columns)):
-    for j in range(i+1, len(co_occurrence.columns)):
-        product1 = co_occurrence.index[i]
-        product2 = co_occurrence.columns[j]
-        count = co_occurrence.iloc[i, j]
-        product_pairs.append((product1, product2, count))
-
-# Sort by count and get top 10
-product_pairs.sort(key=lambda x: x[2], reverse=True)
-top_pairs = product_pairs[:10]
-
-print("Top 10 Product Pairs Frequently Purchased Together:")
-for pair in top_pairs:
-    print(f"{pair[0]} + {pair[1]}: {pair[2]} orders")
-
-# Create a dataframe for the top pairs for visualization
-top_pairs_df = pd.DataFrame(top_pairs, columns=['Product1', 'Product2', 'Count'])
-top_pairs_df['Pair'] = top_pairs_df['Product1'] + ' + ' + top_pairs_df['Product2']
+def product_pairs(cache, order_table):
+    """Top 10 pairs of products (at the order table's basket level) bought in the same order."""
+    top_pairs_df = cache.frame('top_pairs', top_basket_pairs, order_table.baskets(), items=order_table.items, k=10)
+
+    # Create a label for each pair for visualization
+    top_pairs_df['Pair'] = top_pairs_df['Product1'] + ' + ' + top_pairs_df['Product2']
+    return top_pairs_df
+
 
 # Plot top product pairs
-plt.figure(figsize=(14, 8))
-sns.barplot(x='Count', y='Pair', data=top_pairs_df)
-plt.title('Top 10 Product Pairs Frequently Purchased Together')
-plt.xlabel('Number of Orders')
-plt.ylabel('Product Pair')
-plt.tight_layout()
-plt.savefig('product_bundling.png')
-print("Saved product bundling chart as 'product_bundling.png'")
+def plot_product_pairs(top_pairs_df):
+    plt.figure(figsize=(14, 8))
+    sns.barplot(x='Count', y='Pair', data=top_pairs_df)
+    plt.title('Top 10 Product Pairs Frequently Purchased Together')
+    plt.xlabel('Number of Orders')
+    plt.ylabel('Product Pair')
+    plt.tight_layout()
+
 
 # 6. Event Merchandise Recommendations
-print("\n===== EVENT MERCHANDISE RECOMMENDATIONS =====")
-# Identify high-quantity, frequently ordered products
-event_recommendations = df.groupby(['category', 'sub-category']).agg({
-    'quantity': 'sum',
-    'order_id': 'nunique',
-    'sales': 'sum',
-    'profit': 'sum'
-}).reset_index()
-
-event_recommendations['avg_quantity_per_order'] = event_recommendations['quantity'] / event_recommendations['order_id']
-event_recommendations['profit_margin'] = event_recommendations['profit'] / event_recommendations['sales']
-
-# Sort by order frequency and quantity
-event_recommendations_by_frequency = event_recommendations.sort_values('order_id', ascending=False).head(10)
-event_recommendations_by_quantity = event_recommendations.sort_values('quantity', ascending=False).head(10)
-
-print("Top 10 Products by Order Frequency:")
-print(event_recommendations_by_frequency[['category', 'sub-category', 'order_id', 'quantity', 'profit_margin']])
-
-print("\nTop 10 Products by Quantity:")
-print(event_recommendations_by_quantity[['category', 'sub-category', 'quantity', 'order_id', 'profit_margin']])
-
-# Create bundle recommendations based on co-occurrence and profitability
-bundle_recommendations = pd.DataFrame({
-    'Bundle_Name': [
-        'Office Essentials',
-        'Tech Productivity',
-        'Furniture Combo',
-        'Storage Solution',
-        'Meeting Essentials'
-    ],
-    'Products': [
-        'Binders + Paper + Storage',
-        'Phones + Accessories + Machines',
-        'Chairs + Tables + Furnishings',
-        'Storage + Binders + Fasteners',
-        'Accessories + Paper + Art'
-    ],
-    'Target_Segment': [
-        'Corporate',
-        'Home Office',
-        'Consumer',
-        'Corporate',
-        'All Segments'
-    ],
-    'Expected_Profit_Margin': [
-        '25-30%',
-        '20-25%',
-        '10-15%',
-        '20-25%',
-        '25-30%'
-    ]
-})
-
-print("\nRecommended Product Bundles for Events:")
-print(bundle_recommendations)
-
-# Save recommendations to CSV
-event_recommendations_by_frequency.to_csv('top_products_by_frequency.csv', index=False)
-event_recommendations_by_quantity.to_csv('top_products_by_quantity.csv', index=False)
-bundle_recommendations.to_csv('bundle_recommendations.csv', index=False)
-print("Saved inventory recommendations to CSV files")
-
-print("\n===== ANALYSIS COMPLETE =====")
-print("All charts and data files have been saved to the current directory")
+def event_recommendations(cube):
+    """Quantity, orders, sales and profit per sub-category for event stocking."""
+    # Identify high-quantity, frequently ordered products
+    recommendations = cube.query(['category', 'sub-category'], ['quantity', 'order_id', 'sales', 'profit'])
+
+    recommendations['avg_quantity_per_order'] = recommendations['quantity'] / recommendations['order_id']
+    recommendations['profit_margin'] = recommendations['profit'] / recommendations['sales']
+    return recommendations
+
+
+def bundle_recommendations(cache, df, level):
+    """Bundle recommendations from frequent itemsets mined over the order baskets."""
+    bundle_min_support = {'sub-category': 0.005, 'product': 2}[level]
+    bundle_lines = df[['order_id', LEVEL_COLUMNS[level], 'category', 'segment', 'sales', 'profit']]
+    return cache.frame('bundle_recommendations', recommend_bundles, bundle_lines,
+                       level=level, min_support=bundle_min_support, top_n=5)
+
+
+def save_outputs(by_frequency, by_quantity, bundles):
+    """Save recommendations to CSV."""
+    by_frequency.to_csv('top_products_by_frequency.csv', index=False)
+    by_quantity.to_csv('top_products_by_quantity.csv', index=False)
+    bundles.to_csv('bundle_recommendations.csv', index=False)
+
+
+def main():
+    cache = OutputCache()
+    charts = ChartBatch(cache)
+    trace = StageTrace('order_inventory_analysis')
+
+    print("Loading the dataset...")
+    with trace.stage('load') as stage:
+        stage.rows_out = df = open_superstore(columns=COLUMNS)
+        cube = load_sales_cube(df=df)
+        order_table = load_order_table(df=df, level=bundling_level())
+
+    print("Dataset cleaned and prepared successfully")
+
+    print("\n===== ORDER QUANTITY ANALYSIS =====")
+    with trace.stage('order quantity', rows_in=df) as stage:
+        # Basic statistics on quantity
+        quantity_stats = describe(df, 'quantity')
+        print("Quantity Statistics:")
+        print(quantity_stats)
+        charts.add('quantity_distribution.png', plot_quantity_distribution, 'quantity distribution chart',
+                   quantity=sample_rows(df, ['quantity'])['quantity'])
+
+        stage.rows_out = category_quantity = quantity_by_category(df)
+        print("\nQuantity by Category:")
+        print(category_quantity)
+        charts.add('category_quantity_analysis.png', plot_category_quantity, 'category quantity analysis chart',
+                   category_quantity=category_quantity)
+
+    print("\n===== FREQUENTLY ORDERED PRODUCTS =====")
+    with trace.stage('frequently ordered', rows_in=cube.cells) as stage:
+        stage.rows_out = subcategory_frequency = subcategory_order_frequency(cube)
+        print("Top 10 Most Frequently Ordered Sub-Categories:")
+        print(subcategory_frequency.head(10))
+        charts.add('frequently_ordered_subcategories.png', plot_frequent_subcategories,
+                   'frequently ordered subcategories chart', top_subcats=subcategory_frequency.head(10))
+
+    print("\n===== ORDER SIZE ANALYSIS =====")
+    with trace.stage('order size', rows_in=order_table.orders) as stage:
+        orders = order_totals(order_table)
+        stage.rows_out = order_size_dist = order_size_distribution(orders)
+        print("Order Size Distribution:")
+        print(order_size_dist)
+        charts.add('order_size_analysis.png', plot_order_sizes, 'order size analysis chart',
+                   order_size_dist=order_size_dist)
+
+    print("\n===== ORDER SIZE BY CUSTOMER SEGMENT =====")
+    with trace.stage('segment order size', rows_in=orders) as stage:
+        stage.rows_out = segment_order_size = segment_order_sizes(orders)
+        print("Order Size by Customer Segment:")
+        print(segment_order_size.head(10))
+        charts.add('segment_order_size.png', plot_segment_order_size, 'segment order size chart',
+                   segment_size_pivot=segment_order_size_pivot(segment_order_size))
+
+    print("\n===== PRODUCT BUNDLING ANALYSIS =====")
+    with trace.stage('product pairs', rows_in=order_table.orders) as stage:
+        level = bundling_level()
+        stage.rows_out = top_pairs_df = product_pairs(cache, order_table)
+        print("Top 10 Product Pairs Frequently Purchased Together:")
+        for pair in top_pairs_df.itertuples(index=False):
+            print(f"{pair.Product1} + {pair.Product2}: {pair.Count} orders")
+        charts.add('product_bundling.png', plot_product_pairs, 'product bundling chart', top_pairs_df=top_pairs_df)
+
+    print("\n===== EVENT MERCHANDISE RECOMMENDATIONS =====")
+    with trace.stage('event recommendations', rows_in=cube.cells) as stage:
+        stage.rows_out = recommendations = event_recommendations(cube)
+
+        # Sort by order frequency and quantity
+        by_frequency = recommendations.sort_values('order_id', ascending=False).head(10)
+        by_quantity = recommendations.sort_values('quantity', ascending=False).head(10)
+
+        print("Top 10 Products by Order Frequency:")
+        print(by_frequency[['category', 'sub-category', 'order_id', 'quantity', 'profit_margin']])
+
+        print("\nTop 10 Products by Quantity:")
+        print(by_quantity[['category', 'sub-category', 'quantity', 'order_id', 'profit_margin']])
+
+    with trace.stage('bundle mining', rows_in=df) as stage:
+        stage.rows_out = bundles = bundle_recommendations(cache, df, level)
+        print("\nRecommended Product Bundles for Events:")
+        print(bundles)
+
+    with trace.stage('save outputs'):
+        save_outputs(by_frequency, by_quantity, bundles)
+        print("Saved inventory recommendations to CSV files")
+
+    with trace.stage('charts'):
+        charts.render()
+    cache.report()
+    trace.report()
+
+    print("\n===== ANALYSIS COMPLETE =====")
+    print("All charts and data files have been saved to the current directory")
+
+if __name__ == '__main__':
+    main()
@@ -1,150 +1,184 @@
 #!/usr/bin/env python3
 # Sales Performance by Product Hierarchy Analysis
+#
+# The aggregations are plain functions returning DataFrames and the charts
+# are plot_* functions, so both can be imported and reused; main() runs the
+# full analysis and writes the outputs.
+
+import os
+import sys
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 from datetime import datetime
 
-# Set style for better visualizations
-plt.style.use('ggplot')
-sns.set(font_scale=1.1)
-plt.rcParams['figure.figsize'] = [12, 8]
-
-# Load the original dataset
-print("Loading the dataset...")
-df = pd.read_csv('Superstore Dataset.csv', encoding='latin1')
-
-# Display basic information
-print(f"Dataset Shape: {df.shape}")
-print("\nFirst few rows:")
-print(df.head())
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.charts import ChartBatch, plt, sns
+from common.data_loader import open_superstore
+from common.instrumentation import StageTrace
+from common.output_cache import OutputCache
+from common.partial_agg import aggregate
+from common.sales_cube import load_sales_cube
 
-# Clean the dataset
-print("\nCleaning the dataset...")
-# Convert date columns to datetime
-df['Order Date'] = pd.to_datetime(df['Order Date'], errors='coerce')
-df['Ship Date'] = pd.to_datetime(df['Ship Date'], errors='coerce')
+# Columns of the dataset this analysis reads; the sales cube loads its own
+COLUMNS = ['order_id', 'category', 'sub-category', 'product_name', 'sales', 'quantity', 'profit']
 
-# Clean column names
-df.columns = [col.lower().replace(' ', '_') for col in df.columns]
-
-# Add useful derived columns
-df['order_year'] = df['order_date'].dt.year
-df['order_month'] = df['order_date'].dt.month
-df['shipping_days'] = (df['ship_date'] - df['order_date']).dt.days
-df['profit_margin'] = df['profit'] / df['sales']
-
-print("Dataset cleaned successfully")
 
 # 1. Sales by Category
-print("\n===== SALES BY CATEGORY =====")
-category_sales = df.groupby('category').agg({
-    'sales': 'sum',
-    'order_id': 'nunique',
-    'quantity': 'sum',
-    'profit': 'sum'
-}).reset_index()
+def sales_by_category(cube):
+    """Sales, orders, quantity and profit per category, best-selling first."""
+    category_sales = cube.query('category', ['sales', 'order_id', 'quantity', 'profit'])
 
-# Calculate metrics
-category_sales['avg_sales_per_order'] = category_sales['sales'] / category_sales['order_id']
-category_sales['profit_margin'] = category_sales['profit'] / category_sales['sales']
-category_sales = category_sales.sort_values('sales', ascending=False)
+    # Calculate metrics
+    category_sales['avg_sales_per_order'] = category_sales['sales'] / category_sales['order_id']
+    category_sales['profit_margin'] = category_sales['profit'] / category_sales['sales']
+    return category_sales.sort_values('sales', ascending=False)
 
-print(category_sales)
 
 # Visualize sales by category
-plt.figure(figsize=(12, 6))
-sns.barplot(x='category', y='sales', data=category_sales)
-plt.title('Total Sales by Category')
-plt.ylabel('Sales ($)')
-plt.xticks(rotation=0)
-plt.tight_layout()
-plt.savefig('category_sales.png')
-print("Saved category sales chart as 'category_sales.png'")
+def plot_category_sales(category_sales):
+    plt.figure(figsize=(12, 6))
+    sns.barplot(x='category', y='sales', data=category_sales)
+    plt.title('Total Sales by Category')
+    plt.ylabel('Sales ($)')
+    plt.xticks(rotation=0)
+    plt.tight_layout()
+
 
 # 2. Sales by Sub-Category
-print("\n===== SALES BY SUB-CATEGORY =====")
-subcategory_sales = df.groupby(['category', 'sub-category']).agg({
-    'sales': 'sum',
-    'order_id': 'nunique',
-    'quantity': 'sum',
-    'profit': 'sum'
-}).reset_index()
-
-# Calculate metrics
-subcategory_sales['avg_sales_per_order'] = subcategory_sales['sales'] / subcategory_sales['order_id']
-subcategory_sales['profit_margin'] = subcategory_sales['profit'] / subcategory_sales['sales']
-subcategory_sales = subcategory_sales.sort_values('sales', ascending=False)
-
-print("Top 10 Sub-Categories by Sales:")
-print(subcategory_sales.head(10))
+def sales_by_subcategory(cube):
+    """Sales, orders, quantity and profit per sub-category, best-selling first."""
+    subcategory_sales = cube.query(['category', 'sub-category'], ['sales', 'order_id', 'quantity', 'profit'])
+
+    # Calculate metrics
+    subcategory_sales['avg_sales_per_order'] = subcategory_sales['sales'] / subcategory_sales['order_id']
+    subcategory_sales['profit_margin'] = subcategory_sales['profit'] / subcategory_sales['sales']
+    return subcategory_sales.sort_values('sales', ascending=False)
+
 
 # Visualize top 10 sub-categories by sales
-plt.figure(figsize=(14, 8))
-top10_subcategories = subcategory_sales.head(10)
-sns.barplot(x='sales', y='sub-category', data=top10_subcategories, hue='category', dodge=False)
-plt.title('Top 10 Sub-Categories by Sales')
-plt.xlabel('Sales ($)')
-plt.tight_layout()
-plt.savefig('top10_subcategory_sales.png')
-print("Saved top 10 sub-categories chart as 'top10_subcategory_sales.png'")
+def plot_top_subcategories(top10_subcategories):
+    plt.figure(figsize=(14, 8))
+    sns.barplot(x='sales', y='sub-category', data=top10_subcategories, hue='category', dodge=False)
+    plt.title('Top 10 Sub-Categories by Sales')
+    plt.xlabel('Sales ($)')
+    plt.tight_layout()
+
 
 # 3. Top Selling Products
-print("\n===== TOP SELLING PRODUCTS =====")
-product_sales = df.groupby(['product_name', 'category', 'sub-category']).agg({
-    'sales': 'sum',
-    'quantity': 'sum',
-    'profit': 'sum',
-    'order_id': 'nunique'
-}).reset_index()
-
-# Calculate metrics
-product_sales['avg_sales_per_order'] = product_sales['sales'] / product_sales['order_id']
-product_sales['profit_margin'] = product_sales['profit'] / product_sales['sales']
-product_sales = product_sales.sort_values('sales', ascending=False)
-
-print("Top 20 Products by Sales:")
-print(product_sales.head(20)[['product_name', 'category', 'sub-category', 'sales', 'quantity', 'profit', 'profit_margin']])
+def sales_by_product(df):
+    """Sales, quantity, profit and orders per product, best-selling first."""
+    product_sales = aggregate(df, ['product_name', 'category', 'sub-category'], {
+        'sales': 'sum',
+        'quantity': 'sum',
+        'profit': 'sum',
+        'order_id': 'nunique'
+    })
+
+    # Calculate metrics
+    product_sales['avg_sales_per_order'] = product_sales['sales'] / product_sales['order_id']
+    product_sales['profit_margin'] = product_sales['profit'] / product_sales['sales']
+    return product_sales.sort_values('sales', ascending=False)
+
 
 # Visualize top 10 products by sales
-plt.figure(figsize=(14, 8))
-top10_products = product_sales.head(10)
-sns.barplot(x='sales', y='product_name', data=top10_products, hue='category', dodge=False)
-plt.title('Top 10 Products by Sales')
-plt.xlabel('Sales ($)')
-plt.tight_layout()
-plt.savefig('top10_products_sales.png')
-print("Saved top 10 products chart as 'top10_products_sales.png'")
+def plot_top_products(top10_products):
+    plt.figure(figsize=(14, 8))
+    sns.barplot(x='sales', y='product_name', data=top10_products, hue='category', dodge=False)
+    plt.title('Top 10 Products by Sales')
+    plt.xlabel('Sales ($)')
+    plt.tight_layout()
+
 
 # Event merchandise relevance analysis
-print("\n===== EVENT MERCHANDISE RELEVANCE =====")
-
-# Identify high-demand products with strong profit margins
-event_merchandise = product_sales[
-    (product_sales['quantity'] > product_sales['quantity'].median()) & 
-    (product_sales['profit_margin'] > product_sales['profit_margin'].median())
-].sort_values('sales', ascending=False)
-
-print("Top 10 Products for Event Merchandise (High Demand + Good Profit Margin):")
-print(event_merchandise.head(10)[['product_name', 'category', 'sub-category', 'sales', 'quantity', 'profit_margin']])
-
-# Create a summary report for event merchandise by category
-event_cat_summary = event_merchandise.groupby('category').agg({
-    'product_name': 'count',
-    'sales': 'sum',
-    'profit': 'sum'
-}).reset_index()
-
-event_cat_summary.columns = ['Category', 'Product Count', 'Total Sales', 'Total Profit']
-print("\nEvent Merchandise Summary by Category:")
-print(event_cat_summary)
-
-# Save results to CSV for further reference
-product_sales.head(100).to_csv('top_100_products.csv', index=False)
-event_merchandise.head(50).to_csv('event_merchandise_recommendations.csv', index=False)
-print("\nSaved detailed product analysis to CSV files")
-
-print("\n===== ANALYSIS COMPLETE =====")
-print("All charts and data files have been saved to the current directory")
+def event_merchandise_products(product_sales):
+    """High-demand products with strong profit margins (both above the median)."""
+    return product_sales[
+        (product_sales['quantity'] > product_sales['quantity'].median()) &
+        (product_sales['profit_margin'] > product_sales['profit_margin'].median())
+    ].sort_values('sales', ascending=False)
+
+
+def event_category_summary(event_merchandise):
+    """Summary report for event merchandise by category."""
+    event_cat_summary = event_merchandise.groupby('category').agg({
+        'product_name': 'count',
+        'sales': 'sum',
+        'profit': 'sum'
+    }).reset_index()
+
+    event_cat_summary.columns = ['Category', 'Product Count', 'Total Sales', 'Total Profit']
+    return event_cat_summary
+
+
+def save_outputs(product_sales, event_merchandise):
+    """Save results to CSV for further reference."""
+    product_sales.head(100).to_csv('top_100_products.csv', index=False)
+    event_merchandise.head(50).to_csv('event_merchandise_recommendations.csv', index=False)
+
+
+def main():
+    cache = OutputCache()
+    charts = ChartBatch(cache)
+    trace = StageTrace('product_hierarchy_analysis')
+
+    print("Loading the dataset...")
+    with trace.stage('load') as stage:
+        stage.rows_out = df = open_superstore(columns=COLUMNS)
+        cube = load_sales_cube(df=df)
+
+    # Display basic information
+    print(f"Dataset Shape: {df.shape}")
+    print("\nFirst few rows:")
+    print(df.head())
+
+    print("Dataset cleaned successfully")
+
+    print("\n===== SALES BY CATEGORY =====")
+    with trace.stage('category sales', rows_in=cube.cells) as stage:
+        stage.rows_out = category_sales = sales_by_category(cube)
+        print(category_sales)
+        charts.add('category_sales.png', plot_category_sales, 'category sales chart', category_sales=category_sales)
+
+    print("\n===== SALES BY SUB-CATEGORY =====")
+    with trace.stage('sub-category sales', rows_in=cube.cells) as stage:
+        stage.rows_out = subcategory_sales = sales_by_subcategory(cube)
+        print("Top 10 Sub-Categories by Sales:")
+        print(subcategory_sales.head(10))
+        charts.add('top10_subcategory_sales.png', plot_top_subcategories, 'top 10 sub-categories chart',
+                   top10_subcategories=subcategory_sales.head(10))
+
+    print("\n===== TOP SELLING PRODUCTS =====")
+    with trace.stage('top selling products', rows_in=df) as stage:
+        stage.rows_out = product_sales = sales_by_product(df)
+        print("Top 20 Products by Sales:")
+        print(product_sales.head(20)[['product_name', 'category', 'sub-category', 'sales', 'quantity', 'profit',
+                                      'profit_margin']])
+        charts.add('top10_products_sales.png', plot_top_products, 'top 10 products chart',
+                   top10_products=product_sales.head(10))
+
+    print("\n===== EVENT MERCHANDISE RELEVANCE =====")
+    with trace.stage('event merchandise', rows_in=product_sales) as stage:
+        stage.rows_out = event_merchandise = event_merchandise_products(product_sales)
+        print("Top 10 Products for Event Merchandise (High Demand + Good Profit Margin):")
+        print(event_merchandise.head(10)[['product_name', 'category', 'sub-category', 'sales', 'quantity',
+                                          'profit_margin']])
+
+        event_cat_summary = event_category_summary(event_merchandise)
+        print("\nEvent Merchandise Summary by Category:")
+        print(event_cat_summary)
+
+    with trace.stage('save outputs'):
+        save_outputs(product_sales, event_merchandise)
+        print("\nSaved detailed product analysis to CSV files")
+
+    with trace.stage('charts'):
+        charts.render()
+    cache.report()
+    trace.report()
+
+    print("\n===== ANALYSIS COMPLETE =====")
+    print("All charts and data files have been saved to the current directory")
+
+if __name__ == '__main__':
+    main()
@@ -1,47 +1,79 @@
 #!/usr/bin/env python3
 # Sales Performance by Product Hierarchy Analysis
+#
+# The aggregations are plain functions returning DataFrames and the charts
+# are plot_* functions, so both can be imported and reused; main() runs the
+# full analysis and writes the outputs.
+
+import os
+import sys
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 
-# Set style for better visualizations
-plt.style.use('ggplot')
-sns.set(font_scale=1.1)
-plt.rcParams['figure.figsize'] = [10, 6]
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.charts import ChartBatch, plt, sns
+from common.column_store import open_clean_store
+from common.data_loader import plain_labels
+from common.instrumentation import StageTrace
+from common.output_cache import OutputCache
 
-# Load the cleaned dataset
-print("Loading the cleaned dataset...")
-df = pd.read_csv('superstore_clean.csv')
+# Columns of the cleaned dataset's column store this analysis reads
+COLUMNS = ['category', 'sales', 'order_id', 'quantity', 'profit']
 
-# Display basic information
-print(f"Dataset Shape: {df.shape}")
-print("\nFirst few rows:")
-print(df.head())
 
 # 1. Sales by Category
-print("\n===== SALES BY CATEGORY =====")
-category_sales = df.groupby('category').agg({
-    'sales': 'sum',
-    'order_id': 'nunique',
-    'quantity': 'sum',
-    'profit': 'sum'
-}).reset_index()
+def sales_by_category(df):
+    """Sales, orders, quantity and profit per category, best-selling first."""
+    category_sales = df.groupby('category', observed=True).agg({
+        'sales': 'sum',
+        'order_id': 'nunique',
+        'quantity': 'sum',
+        'profit': 'sum'
+    }).reset_index().pipe(plain_labels, columns=['category'])
 
-# Calculate metrics
-category_sales['avg_sales_per_order'] = category_sales['sales'] / category_sales['order_id']
-category_sales['profit_margin'] = category_sales['profit'] / category_sales['sales']
-category_sales = category_sales.sort_values('sales', ascending=False)
+    # Calculate metrics
+    category_sales['avg_sales_per_order'] = category_sales['sales'] / category_sales['order_id']
+    category_sales['profit_margin'] = category_sales['profit'] / category_sales['sales']
+    return category_sales.sort_values('sales', ascending=False)
 
-print(category_sales)
 
 # Visualize sales by category
-plt.figure(figsize=(12, 6))
-sns.barplot(x='category', y='sales', data=category_sales)
-plt.title('Total Sales by Category')
-plt.ylabel('Sales ($)')
-plt.xticks(rotation=0)
-plt.tight_layout()
-plt.savefig('category_sales.png')
-print("Saved category sales chart as 'category_sales.png'")
+def plot_category_sales(category_sales):
+    plt.figure(figsize=(12, 6))
+    sns.barplot(x='category', y='sales', data=category_sales)
+    plt.title('Total Sales by Category')
+    plt.ylabel('Sales ($)')
+    plt.xticks(rotation=0)
+    plt.tight_layout()
+
+
+def main():
+    cache = OutputCache()
+    charts = ChartBatch(cache)
+    trace = StageTrace('sales_by_product_hierarchy')
+
+    # Open the cleaned dataset's column store; only the columns used below are read
+    print("Loading the cleaned dataset...")
+    with trace.stage('load') as stage:
+        store = open_clean_store()
+        stage.rows_out = df = store.read(COLUMNS)
+
+    # Display basic information
+    print(f"Dataset Shape: {store.shape}")
+    print("\nFirst few rows:")
+    print(store.head())
+
+    print("\n===== SALES BY CATEGORY =====")
+    with trace.stage('category sales', rows_in=df) as stage:
+        stage.rows_out = category_sales = sales_by_category(df)
+        print(category_sales)
+        charts.add('category_sales.png', plot_category_sales, 'category sales chart', category_sales=category_sales)
+
+    with trace.stage('charts'):
+        charts.render()
+    cache.report()
+    trace.report()
+
+if __name__ == '__main__':
+    main()
@@ -1,60 +1,98 @@
 #!/usr/bin/env python3
 # Sales Performance by Sub-Category Analysis
+#
+# The aggregations are plain functions returning DataFrames and the charts
+# are plot_* functions, so both can be imported and reused; main() runs the
+# full analysis and writes the outputs.
+
+import os
+import sys
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 
-# Set style for better visualizations
-plt.style.use('ggplot')
-sns.set(font_scale=1.1)
-plt.rcParams['figure.figsize'] = [12, 8]
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.charts import ChartBatch, plt, sns
+from common.column_store import open_clean_store
+from common.data_loader import plain_labels
+from common.instrumentation import StageTrace
+from common.output_cache import OutputCache
+
+# Columns of the cleaned dataset's column store this analysis reads
+COLUMNS = ['category', 'sub_category', 'sales', 'order_id', 'quantity', 'profit']
 
-# Load the cleaned dataset
-print("Loading the cleaned dataset...")
-df = pd.read_csv('superstore_clean.csv')
 
 # 1. Sales by Sub-Category
-print("\n===== SALES BY SUB-CATEGORY =====")
-subcategory_sales = df.groupby(['category', 'sub_category']).agg({
-    'sales': 'sum',
-    'order_id': 'nunique',
-    'quantity': 'sum',
-    'profit': 'sum'
-}).reset_index()
-
-# Calculate metrics
-subcategory_sales['avg_sales_per_order'] = subcategory_sales['sales'] / subcategory_sales['order_id']
-subcategory_sales['profit_margin'] = subcategory_sales['profit'] / subcategory_sales['sales']
-subcategory_sales = subcategory_sales.sort_values('sales', ascending=False)
-
-print("Top 10 Sub-Categories by Sales:")
-print(subcategory_sales.head(10))
+def sales_by_subcategory(df):
+    """Sales, orders, quantity and profit per sub-category, best-selling first."""
+    subcategory_sales = df.groupby(['category', 'sub_category'], observed=True).agg({
+        'sales': 'sum',
+        'order_id': 'nunique',
+        'quantity': 'sum',
+        'profit': 'sum'
+    }).reset_index().pipe(plain_labels, columns=['category', 'sub_category'])
+
+    # Calculate metrics
+    subcategory_sales['avg_sales_per_order'] = subcategory_sales['sales'] / subcategory_sales['order_id']
+    subcategory_sales['profit_margin'] = subcategory_sales['profit'] / subcategory_sales['sales']
+    return subcategory_sales.sort_values('sales', ascending=False)
+
 
 # Visualize top 10 sub-categories by sales
-plt.figure(figsize=(14, 8))
-top10_subcategories = subcategory_sales.head(10)
-sns.barplot(x='sales', y='sub_category', data=top10_subcategories, hue='category', dodge=False)
-plt.title('Top 10 Sub-Categories by Sales')
-plt.xlabel('Sales ($)')
-plt.tight_layout()
-plt.savefig('top10_subcategory_sales.png')
-print("Saved top 10 sub-categories chart as 'top10_subcategory_sales.png'")
+def plot_top_subcategories(top10_subcategories):
+    plt.figure(figsize=(14, 8))
+    sns.barplot(x='sales', y='sub_category', data=top10_subcategories, hue='category', dodge=False)
+    plt.title('Top 10 Sub-Categories by Sales')
+    plt.xlabel('Sales ($)')
+    plt.tight_layout()
+
 
 # 2. Sales Distribution within Sub-Categories
-print("\n===== SALES DISTRIBUTION WITHIN SUB-CATEGORIES =====")
+def top_subcategory_lines(df, subcategory_sales, n=10):
+    """Sub-category and sales of the lines in the ``n`` best-selling sub-categories."""
+    top_subcats = subcategory_sales.head(n)['sub_category'].tolist()
+    return df.loc[df['sub_category'].isin(top_subcats), ['sub_category', 'sales']], top_subcats
+
 
 # Create a boxplot to show sales distribution within each sub-category
-plt.figure(figsize=(16, 10))
-# Filter to top 10 sub-categories for better visualization
-top_subcats = subcategory_sales.head(10)['sub_category'].tolist()
-df_top_subcats = df[df['sub_category'].isin(top_subcats)]
-
-# Create boxplot
-sns.boxplot(x='sub_category', y='sales', data=df_top_subcats, order=top_subcats)
-plt.title('Sales Distribution within Top 10 Sub-Categories')
-plt.xticks(rotation=45)
-plt.tight_layout()
-plt.savefig('subcategory_sales_distribution.png')
-print("Saved sub-category sales distribution chart as 'subcategory_sales_distribution.png'")
+def plot_subcategory_distribution(lines, top_subcats):
+    plt.figure(figsize=(16, 10))
+    sns.boxplot(x='sub_category', y='sales', data=lines, order=top_subcats)
+    plt.title('Sales Distribution within Top 10 Sub-Categories')
+    plt.xticks(rotation=45)
+    plt.tight_layout()
+
+
+def main():
+    cache = OutputCache()
+    charts = ChartBatch(cache)
+    trace = StageTrace('sales_by_subcategory')
+
+    # Open the cleaned dataset's column store; only the columns used below are read
+    print("Loading the cleaned dataset...")
+    with trace.stage('load') as stage:
+        stage.rows_out = df = open_clean_store().read(COLUMNS)
+
+    print("\n===== SALES BY SUB-CATEGORY =====")
+    with trace.stage('sub-category sales', rows_in=df) as stage:
+        stage.rows_out = subcategory_sales = sales_by_subcategory(df)
+        print("Top 10 Sub-Categories by Sales:")
+        print(subcategory_sales.head(10))
+        charts.add('top10_subcategory_sales.png', plot_top_subcategories, 'top 10 sub-categories chart',
+                   top10_subcategories=subcategory_sales.head(10))
+
+    print("\n===== SALES DISTRIBUTION WITHIN SUB-CATEGORIES =====")
+    with trace.stage('sub-category distribution', rows_in=df) as stage:
+        # Filter to top 10 sub-categories for better visualization
+        lines, top_subcats = top_subcategory_lines(df, subcategory_sales)
+        stage.rows_out = lines
+        charts.add('subcategory_sales_distribution.png', plot_subcategory_distribution,
+                   'sub-category sales distribution chart', lines=lines, top_subcats=top_subcats)
+
+    with trace.stage('charts'):
+        charts.render()
+    cache.report()
+    trace.report()
+
+if __name__ == '__main__':
+    main()
@@ -1,74 +1,120 @@
 #!/usr/bin/env python3
 # Top Selling Products Analysis
+#
+# The aggregations are plain functions returning DataFrames and the charts
+# are plot_* functions, so both can be imported and reused; main() runs the
+# full analysis and writes the outputs.
+
+import os
+import sys
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 
-# Set style for better visualizations
-plt.style.use('ggplot')
-sns.set(font_scale=1.1)
-plt.rcParams['figure.figsize'] = [12, 8]
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.charts import ChartBatch, plt, sns
+from common.column_store import open_clean_store
+from common.data_loader import plain_labels
+from common.instrumentation import StageTrace
+from common.output_cache import OutputCache
+
+# Columns of the cleaned dataset's column store this analysis reads
+COLUMNS = ['product_name', 'category', 'sub_category', 'sales', 'quantity', 'profit', 'order_id']
 
-# Load the cleaned dataset
-print("Loading the cleaned dataset...")
-df = pd.read_csv('superstore_clean.csv')
 
 # Analyze top selling products by name
-print("\n===== TOP SELLING PRODUCTS =====")
-product_sales = df.groupby(['product_name', 'category', 'sub_category']).agg({
-    'sales': 'sum',
-    'quantity': 'sum',
-    'profit': 'sum',
-    'order_id': 'nunique'
-}).reset_index()
-
-# Calculate metrics
-product_sales['avg_sales_per_order'] = product_sales['sales'] / product_sales['order_id']
-product_sales['profit_margin'] = product_sales['profit'] / product_sales['sales']
-product_sales = product_sales.sort_values('sales', ascending=False)
-
-print("Top 20 Products by Sales:")
-print(product_sales.head(20)[['product_name', 'category', 'sub_category', 'sales', 'quantity', 'profit', 'profit_margin']])
+def sales_by_product(df):
+    """Sales, quantity, profit and orders per product, best-selling first."""
+    product_sales = df.groupby(['product_name', 'category', 'sub_category'], observed=True).agg({
+        'sales': 'sum',
+        'quantity': 'sum',
+        'profit': 'sum',
+        'order_id': 'nunique'
+    }).reset_index().pipe(plain_labels, columns=['product_name', 'category', 'sub_category'])
+
+    # Calculate metrics
+    product_sales['avg_sales_per_order'] = product_sales['sales'] / product_sales['order_id']
+    product_sales['profit_margin'] = product_sales['profit'] / product_sales['sales']
+    return product_sales.sort_values('sales', ascending=False)
+
 
 # Visualize top 10 products by sales
-plt.figure(figsize=(14, 8))
-top10_products = product_sales.head(10)
-sns.barplot(x='sales', y='product_name', data=top10_products, hue='category', dodge=False)
-plt.title('Top 10 Products by Sales')
-plt.xlabel('Sales ($)')
-plt.tight_layout()
-plt.savefig('top10_products_sales.png')
-print("Saved top 10 products chart as 'top10_products_sales.png'")
+def plot_top_products(top10_products):
+    plt.figure(figsize=(14, 8))
+    sns.barplot(x='sales', y='product_name', data=top10_products, hue='category', dodge=False)
+    plt.title('Top 10 Products by Sales')
+    plt.xlabel('Sales ($)')
+    plt.tight_layout()
+
 
 # Event merchandise relevance analysis
-print("\n===== EVENT MERCHANDISE RELEVANCE =====")
-
-# Identify high-demand products with strong profit margins
-event_merchandise = product_sales[
-    (product_sales['quantity'] > product_sales['quantity'].median()) & 
-    (product_sales['profit_margin'] > product_sales['profit_margin'].median())
-].sort_values('sales', ascending=False)
-
-print("Top 10 Products for Event Merchandise (High Demand + Good Profit Margin):")
-print(event_merchandise.head(10)[['product_name', 'category', 'sub_category', 'sales', 'quantity', 'profit_margin']])
-
-# Create a summary report for event merchandise by category
-event_cat_summary = event_merchandise.groupby('category').agg({
-    'product_name': 'count',
-    'sales': 'sum',
-    'profit': 'sum'
-}).reset_index()
-
-event_cat_summary.columns = ['Category', 'Product Count', 'Total Sales', 'Total Profit']
-print("\nEvent Merchandise Summary by Category:")
-print(event_cat_summary)
-
-# Save results to CSV for further reference
-product_sales.head(100).to_csv('top_100_products.csv', index=False)
-event_merchandise.head(50).to_csv('event_merchandise_recommendations.csv', index=False)
-print("\nSaved detailed product analysis to CSV files")
-
-print("\n===== ANALYSIS COMPLETE =====")
-print("All charts and data files have been saved to the current directory")
+def event_merchandise_products(product_sales):
+    """High-demand products with strong profit margins (both above the median)."""
+    return product_sales[
+        (product_sales['quantity'] > product_sales['quantity'].median()) &
+        (product_sales['profit_margin'] > product_sales['profit_margin'].median())
+    ].sort_values('sales', ascending=False)
+
+
+def event_category_summary(event_merchandise):
+    """Summary report for event merchandise by category."""
+    event_cat_summary = event_merchandise.groupby('category').agg({
+        'product_name': 'count',
+        'sales': 'sum',
+        'profit': 'sum'
+    }).reset_index()
+
+    event_cat_summary.columns = ['Category', 'Product Count', 'Total Sales', 'Total Profit']
+    return event_cat_summary
+
+
+def save_outputs(product_sales, event_merchandise):
+    """Save results to CSV for further reference."""
+    product_sales.head(100).to_csv('top_100_products.csv', index=False)
+    event_merchandise.head(50).to_csv('event_merchandise_recommendations.csv', index=False)
+
+
+def main():
+    cache = OutputCache()
+    charts = ChartBatch(cache)
+    trace = StageTrace('top_selling_products')
+
+    # Open the cleaned dataset's column store; only the columns used below are read
+    print("Loading the cleaned dataset...")
+    with trace.stage('load') as stage:
+        stage.rows_out = df = open_clean_store().read(COLUMNS)
+
+    print("\n===== TOP SELLING PRODUCTS =====")
+    with trace.stage('top selling products', rows_in=df) as stage:
+        stage.rows_out = product_sales = sales_by_product(df)
+        print("Top 20 Products by Sales:")
+        print(product_sales.head(20)[['product_name', 'category', 'sub_category', 'sales', 'quantity', 'profit',
+                                      'profit_margin']])
+        charts.add('top10_products_sales.png', plot_top_products, 'top 10 products chart',
+                   top10_products=product_sales.head(10))
+
+    print("\n===== EVENT MERCHANDISE RELEVANCE =====")
+    with trace.stage('event merchandise', rows_in=product_sales) as stage:
+        stage.rows_out = event_merchandise = event_merchandise_products(product_sales)
+        print("Top 10 Products for Event Merchandise (High Demand + Good Profit Margin):")
+        print(event_merchandise.head(10)[['product_name', 'category', 'sub_category', 'sales', 'quantity',
+                                          'profit_margin']])
+
+        event_cat_summary = event_category_summary(event_merchandise)
+        print("\nEvent Merchandise Summary by Category:")
+        print(event_cat_summary)
+
+    with trace.stage('save outputs'):
+        save_outputs(product_sales, event_merchandise)
+        print("\nSaved detailed product analysis to CSV files")
+
+    with trace.stage('charts'):
+        charts.render()
+    cache.report()
+    trace.report()
+
+    print("\n===== ANALYSIS COMPLETE =====")
+    print("All charts and data files have been saved to the current directory")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# Run every analysis as one pipeline
+#
+# Usage (from anywhere):
+#   python analysis/run_pipeline.py [--jobs N] [--skip-charts] [--only NODE ...]
+#
+# The dataset and the sales cube are loaded once in this process; only the
+# columns named in the selected analyses' COLUMNS manifests are loaded. Each
+# analysis script is then imported and its main() run in a forked child,
+# inside its own directory (where it writes its charts and CSVs), reusing the
+# data already in memory instead of loading it again. Analyses that do not depend on each other run
+# concurrently. Per-node logs go to analysis/.cache/logs/.
+#
+# Each analysis writes a per-stage trace (common.instrumentation); the runner
+# traces its own shared nodes and merges the analyses' traces into
+# analysis/.cache/traces/run_pipeline.json, plus a Chrome trace-event file
+# with --chrome-trace.
+
+import argparse
+import functools
+import importlib.util
+import os
+import sys
+import time
+
+ANALYSIS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ANALYSIS_DIR)
+from common.data_loader import DEFAULT_CACHE_DIR, open_superstore
+from common.instrumentation import StageTrace, chrome_trace_enabled, load_trace, trace_dir_setting
+from common.pipeline import Node, print_timings, run_pipeline
+from common.sales_cube import load_sales_cube
+
+SCRIPTS = {
+    'data_cleaning': 'data_cleaning/clean_superstore.py',
+    'customer_segmentation': 'customer_segmentation/customer_segmentation_fixed.py',
+    'order_inventory': 'order_inventory_insights/order_inventory_analysis.py',
+    'time_trends': 'time_based_trends/time_based_analysis.py',
+    'profitability': 'profitability_analysis/profitability_discount_analysis.py',
+    'geographic': 'geographic_analysis/geographic_sales_analysis.py',
+    'product_hierarchy': 'product_hierarchy/product_hierarchy_analysis.py',
+}
+
+# Shared inputs each analysis reads
+INPUTS = {
+    'data_cleaning': ['dataset'],
+    'customer_segmentation': ['dataset', 'sales_cube'],
+    'order_inventory': ['dataset', 'sales_cube'],
+    'time_trends': ['dataset'],
+    'profitability': ['dataset', 'sales_cube'],
+    'geographic': ['dataset', 'sales_cube'],
+    'product_hierarchy': ['dataset', 'sales_cube'],
+}
+
+
+def load_analysis(relative_path):
+    """Import an analysis script as a module; importing runs nothing."""
+    path = os.path.join(ANALYSIS_DIR, relative_path)
+    name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    # Registered so inspect can find the module of its functions, e.g. to key cached charts
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_script(relative_path):
+    """Node body running one analysis's main() in its own directory."""
+    def run():
+        path = os.path.join(ANALYSIS_DIR, relative_path)
+        os.chdir(os.path.dirname(path))
+        sys.argv = [path]
+        load_analysis(relative_path).main()
+    return run
+
+
+def dataset_columns(names):
+    """Union of the COLUMNS manifests of the analyses ``names``, or None if one reads every column."""
+    columns = set()
+    for name in names:
+        manifest = load_analysis(SCRIPTS[name]).COLUMNS
+        if manifest is None:
+            return None
+        columns.update(manifest)
+    return sorted(columns)
+
+
+def node_traces(results, trace):
+    """Stage traces the analyses that succeeded wrote during this run."""
+    traces = []
+    for name, relative_path in SCRIPTS.items():
+        path = os.path.join(trace_dir_setting(), f"{os.path.splitext(os.path.basename(relative_path))[0]}.json")
+        if results.get(name, ('',))[0] != 'ok' or not os.path.exists(path):
+            continue
+        node_trace = load_trace(path)
+        if node_trace['start'] >= trace.started:
+            traces.append(node_trace)
+    return traces
+
+
+def build_pipeline(only=None, trace=None):
+    selected = [name for name in SCRIPTS if not only or name in only]
+    load_dataset = functools.partial(open_superstore, columns=dataset_columns(selected))
+    if trace is not None:
+        load_dataset = trace.traced('dataset', load_dataset)
+    nodes = [
+        Node('dataset', load_dataset, shared=True),
+        Node('sales_cube', load_sales_cube if trace is None else trace.traced('sales_cube', load_sales_cube),
+             ['dataset'], shared=True),
+    ]
+    for name in selected:
+        nodes.append(Node(name, run_script(SCRIPTS[name]), INPUTS[name]))
+    return nodes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run all analyses as a dependency-ordered pipeline')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='analyses to run at once')
+    parser.add_argument('--skip-charts', action='store_true', help='data-only run, no charts')
+    parser.add_argument('--only', nargs='+', choices=list(SCRIPTS), help='run just these analyses')
+    parser.add_argument('--chrome-trace', action='store_true', help='also write Chrome trace-event files')
+    args = parser.parse_args()
+
+    if args.skip_charts:
+        os.environ['SUPERSTORE_SKIP_CHARTS'] = '1'
+    if args.chrome_trace:
+        os.environ['SUPERSTORE_CHROME_TRACE'] = '1'
+    # Share the CPUs between concurrent analyses rather than oversubscribing them
+    os.environ.setdefault('SUPERSTORE_CHART_JOBS', str(max(1, (os.cpu_count() or 1) // args.jobs)))
+
+    trace = StageTrace('run_pipeline')
+    start = time.perf_counter()
+    results = run_pipeline(build_pipeline(args.only, trace), args.jobs, os.path.join(DEFAULT_CACHE_DIR, 'logs'))
+    print_timings(results, time.perf_counter() - start)
+    print(f"Stage trace written to '{trace.write(children=node_traces(results, trace))}'"
+          + (" (and a Chrome trace next to it)" if chrome_trace_enabled() else ''))
+    sys.exit(0 if all(status == 'ok' for status, _ in results.values()) else 1)
+
+
+if __name__ == '__main__':
+    main()